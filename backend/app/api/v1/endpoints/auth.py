@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Request
+from fastapi import APIRouter, HTTPException, status, Request, Body
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import Depends
 
 from app.core.config import settings
-from app.core.security import verify_password, create_access_token, verify_clerk_token
+from app.core.security import verify_password, create_access_token, verify_clerk_token, get_current_user
+from app.services.agent_keys import agent_keys
 
 router = APIRouter()
 
@@ -100,3 +101,27 @@ async def clerk_token_exchange(request: Request):
     return {"access_token": internal_token, "token_type": "bearer", "email": email}
 
 
+# ---------------------------------------------------------------------------
+# Agent keys — long-lived ingest credentials for log shippers
+# ---------------------------------------------------------------------------
+
+@router.post("/agent-keys", status_code=201)
+async def create_agent_key(agent: str = Body(..., embed=True), current_user: dict = Depends(get_current_user)):
+    """
+    Issue an ingest key for a shipper. The key is returned only in this
+    response; send it as `X-API-Key` or as the Bearer token.
+    """
+    if not agent.strip():
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="agent name required")
+    return await agent_keys.create(agent.strip())
+
+
+@router.get("/agent-keys")
+async def list_agent_keys(current_user: dict = Depends(get_current_user)):
+    return await agent_keys.list()
+
+
+@router.delete("/agent-keys/{key_id}", status_code=204)
+async def revoke_agent_key(key_id: str, current_user: dict = Depends(get_current_user)):
+    if not await agent_keys.revoke(key_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown agent key")
@@ -1,5 +1,10 @@
+import asyncio
+
 from fastapi import APIRouter, Depends
+from app.core import metrics
+from app.services.queue import queue_service
 from app.services.storage import storage_service
+from app.services.templates import template_miner
 from app.core.security import get_current_user
 import logging
 
@@ -27,13 +32,21 @@ async def get_stats(current_user: dict = Depends(get_current_user)):
         },
     )
 
+    # Throughput and pipeline latency over the workers' trailing 60 s window
+    try:
+        snapshots = await asyncio.to_thread(metrics.live_snapshots, queue_service.redis)
+        eps, avg_ms = metrics.fleet_throughput(snapshots)
+    except Exception as e:
+        logger.error(f"Worker metrics unavailable: {e}")
+        eps, avg_ms = 0.0, 0.0
+
     return {
         "total_logs": logs_count,
         "total_alerts": alerts_count,
         "total_incidents": incidents_count,
         "critical_last_24h": recent_crit,
-        "eps": 5234,           # simulated
-        "avg_response_ms": 42, # simulated
+        "eps": eps,
+        "avg_response_ms": avg_ms,
     }
 
 
@@ -71,3 +84,18 @@ async def get_logs(
         sort=[{"timestamp": {"order": "desc"}}],
         query=q,
     )
+
+
+@router.get("/templates")
+async def get_templates(
+    source: str | None = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user),
+):
+    """Most frequent log templates (messages no parser recognised), per source."""
+    try:
+        # The miner's Redis client is synchronous; keep its round-trips off the event loop
+        return await asyncio.to_thread(template_miner.top, source, limit)
+    except Exception as e:
+        logger.error(f"Log templates unavailable: {e}")
+        return {}
@@ -1,97 +1,243 @@
-from fastapi import APIRouter, HTTPException, Depends, Header, Request, Body
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response, Body
+from pydantic import ValidationError
 from typing import List, Optional, Union
 from datetime import datetime
 from app.models.log import LogEntry
 from app.services.queue import queue_service
-from app.core.limiter import limiter
+from app.core import codec, metrics
+from app.core.limiter import limiter, route_name
 from app.core.config import settings
-from app.core.security import get_current_user
-import redis
-
-r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+from app.core.security import get_ingest_principal
+from app.services.backpressure import backpressure_guard
+from app.services.blocklist import blocklist
+from app.services.normalization import normalization_service
+from app.services.syslog import split_frames
 
 router = APIRouter()
 
 
-def check_blocked(request: Request):
+def _raise_blocked():
+    raise HTTPException(
+        status_code=403,
+        detail="Access Denied: Your IP is blocked due to suspicious activity.",
+    )
+
+
+async def check_blocked(request: Request):
     ip = request.client.host
-    if r.exists(f"blocked:{ip}"):
-        raise HTTPException(
-            status_code=403,
-            detail="Access Denied: Your IP is blocked due to suspicious activity.",
-        )
+    if blocklist.ready:
+        blocked = blocklist.is_blocked(ip)
+    else:
+        blocked = await queue_service.aredis.exists(f"blocked:{ip}")
+    if blocked:
+        _raise_blocked()
+
+
+async def ingest_gate(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_ingest_principal),
+):
+    """
+    Block check + rate limit for the ingest routes: one EVALSHA, with the
+    block check answered from the local blocklist (or pipelined alongside
+    while that cache is not live), and no round-trip at all when the client
+    is blocked or the limiter already knows it is over its limit.
+    """
+    ip = request.client.host
+    local_blocklist = blocklist.ready
+    if local_blocklist and blocklist.is_blocked(ip):
+        _raise_blocked()
+    key, limit = limiter.policy(route_name(request), current_user.get("username"), ip)
+    decision = limiter.precheck(key)
+    if decision is not None:
+        limiter.enforce(decision)
+
+    def build(pipe):
+        limiter.queue(pipe, key, limit, ip)
+        if not local_blocklist:
+            pipe.exists(f"blocked:{ip}")
+
+    reply, *blocked = await limiter.run(build)
+    if any(blocked):
+        _raise_blocked()
+    limiter.enforce(limiter.decide(key, limit, reply), response)
+
+
+def _log_record(
+    log: LogEntry, timestamp: str, x_source_host: Optional[str], x_app_name: Optional[str]
+) -> dict:
+    log_data = log.dict()
+
+    if not log_data.get("timestamp"):
+        log_data["timestamp"] = timestamp
+    else:
+        log_data["timestamp"] = log_data["timestamp"].isoformat()
+
+    if x_source_host or x_app_name:
+        log_data.setdefault("metadata", {})
+        if x_source_host:
+            log_data["metadata"]["source_host"] = x_source_host
+        if x_app_name:
+            log_data["metadata"]["app_name"] = x_app_name
+    return log_data
 
 
 @router.post(
     "/logs",
     status_code=202,
-    dependencies=[Depends(limiter), Depends(check_blocked)],
+    dependencies=[Depends(ingest_gate), Depends(backpressure_guard)],
 )
 async def ingest_logs(
     logs: Union[LogEntry, List[LogEntry]],
     x_source_host: Optional[str] = Header(None),
     x_app_name: Optional[str] = Header(None),
     request: Request = None,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_ingest_principal),
 ):
-    """Ingest structured logs (single or batch). Async push to Redis."""
+    """Ingest structured logs (single or batch), queued with one pipelined XADD set."""
     if not isinstance(logs, list):
         logs = [logs]
 
     timestamp = datetime.utcnow().isoformat()
-    queued_count = 0
-
-    for log in logs:
-        log_data = log.dict()
-
-        if not log_data.get("timestamp"):
-            log_data["timestamp"] = timestamp
-        else:
-            log_data["timestamp"] = log_data["timestamp"].isoformat()
-
-        if x_source_host or x_app_name:
-            log_data.setdefault("metadata", {})
-            if x_source_host:
-                log_data["metadata"]["source_host"] = x_source_host
-            if x_app_name:
-                log_data["metadata"]["app_name"] = x_app_name
-
-        if queue_service.push_log(log_data):
-            queued_count += 1
+    batch = [_log_record(log, timestamp, x_source_host, x_app_name) for log in logs]
 
+    queued_count = await queue_service.apush_logs(batch)
+    metrics.INGESTED.inc(queued_count, route="logs")
     return {"status": "queued", "count": queued_count}
 
 
 @router.post(
     "/raw",
     status_code=202,
-    dependencies=[Depends(limiter), Depends(check_blocked)],
+    dependencies=[Depends(ingest_gate), Depends(backpressure_guard)],
 )
 async def ingest_raw(
     request: Request,
     body: str = Body(..., media_type="text/plain"),
     x_source_host: Optional[str] = Header(None),
     x_app_name: Optional[str] = Header(None),
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_ingest_principal),
 ):
-    """Ingest raw text logs (e.g. from syslog/rsyslog agents)."""
-    log_data = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "level": "INFO",
-        "source": "raw_ingest",
-        "message": body,
-        "metadata": {
-            "source_ip": request.client.host,
-            "raw_format": "text",
-        },
-    }
+    """
+    Ingest raw text logs (e.g. from syslog/rsyslog agents). The body is split
+    into one event per line, or per frame when it is octet-counted
+    (RFC 6587); each event's source is detected from its text and the whole
+    body is queued in one pipelined batch.
+    """
+    timestamp = datetime.utcnow().isoformat()
+    messages, framing = split_frames(body.encode("utf-8"))
+    batch = []
+
+    for message in messages:
+        log_data = {
+            "timestamp": timestamp,
+            "level": "INFO",
+            "source": normalization_service.detect_source(message),
+            "message": message,
+            "metadata": {
+                "source_ip": request.client.host,
+                "raw_format": "text",
+                "framing": framing,
+            },
+        }
+        if x_source_host:
+            log_data["metadata"]["source_host"] = x_source_host
+        if x_app_name:
+            log_data["metadata"]["app_name"] = x_app_name
+        batch.append(log_data)
+
+    if not batch:
+        raise HTTPException(status_code=400, detail="Empty raw log body")
+
+    queued_count = await queue_service.apush_logs(batch)
+    if queued_count:
+        metrics.INGESTED.inc(queued_count, route="raw")
+        return {"status": "queued", "message": "Raw log accepted", "count": queued_count}
 
-    if x_source_host:
-        log_data["metadata"]["source_host"] = x_source_host
-    if x_app_name:
-        log_data["metadata"]["app_name"] = x_app_name
+    raise HTTPException(status_code=500, detail="Failed to queue raw log")
 
-    if queue_service.push_log(log_data):
-        return {"status": "queued", "message": "Raw log accepted"}
 
-    raise HTTPException(status_code=500, detail="Failed to queue raw log")
+async def _body_lines(request: Request):
+    """
+    Yield (line_number, line) as the body arrives, holding at most one partial
+    line. Lines over INGEST_MAX_LINE_BYTES are discarded and yielded as None.
+    """
+    max_bytes = settings.INGEST_MAX_LINE_BYTES
+    buffer = b""
+    overflow = False
+    line_no = 0
+    async for chunk in request.stream():
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            line_no += 1
+            yield line_no, None if overflow or len(line) > max_bytes else line
+            overflow = False
+        if len(buffer) > max_bytes:
+            buffer, overflow = b"", True
+    if buffer or overflow:
+        yield line_no + 1, None if overflow or len(buffer) > max_bytes else buffer
+
+
+def _line_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or 'line'}: {err['msg']}" for err in e.errors()
+        )
+    if isinstance(e, OverflowError):
+        return str(e)
+    return f"invalid JSON: {e}"
+
+
+@router.post(
+    "/ndjson",
+    status_code=202,
+    dependencies=[Depends(ingest_gate), Depends(backpressure_guard)],
+)
+async def ingest_ndjson(
+    request: Request,
+    x_source_host: Optional[str] = Header(None),
+    x_app_name: Optional[str] = Header(None),
+    current_user: dict = Depends(get_ingest_principal),
+):
+    """
+    Ingest newline-delimited LogEntry objects, parsed and queued in chunks of
+    INGEST_CHUNK_SIZE while the upload is still arriving. Invalid lines are
+    skipped and reported by line number; the rest of the batch is accepted.
+    """
+    timestamp = datetime.utcnow().isoformat()
+    batch = []
+    errors = []
+    lines = failed = queued_count = 0
+
+    async for line_no, line in _body_lines(request):
+        if line is not None and not line.strip():
+            continue
+        lines += 1
+        try:
+            if line is None:
+                raise OverflowError(f"line exceeds {settings.INGEST_MAX_LINE_BYTES} bytes")
+            log = LogEntry.model_validate(codec.loads(line))
+        except (ValueError, OverflowError) as e:
+            failed += 1
+            if len(errors) < settings.INGEST_MAX_REPORTED_ERRORS:
+                errors.append({"line": line_no, "error": _line_error(e)})
+            continue
+
+        batch.append(_log_record(log, timestamp, x_source_host, x_app_name))
+        if len(batch) >= settings.INGEST_CHUNK_SIZE:
+            queued_count += await queue_service.apush_logs(batch)
+            batch = []
+
+    queued_count += await queue_service.apush_logs(batch)
+    metrics.INGESTED.inc(queued_count, route="ndjson")
+    if failed:
+        metrics.INGEST_REJECTED.inc(failed, route="ndjson", reason="invalid")
+    return {
+        "status": "queued",
+        "count": queued_count,
+        "lines": lines,
+        "failed": failed,
+        "errors": errors,
+    }
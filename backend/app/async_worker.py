@@ -0,0 +1,276 @@
+"""
+asyncio-native worker (WORKER_MODE=async).
+
+Reads the stream with redis.asyncio, keeps up to WORKER_CONCURRENCY events in
+flight and indexes through AsyncElasticsearch, so one slow GeoIP, ES or Redis
+call no longer stalls the whole consumer. The detection stages still use the
+services' sync Redis clients; they run in a thread pool sized to the
+concurrency limit so their network waits overlap too.
+
+Ordering guarantees:
+  * events for the same entity (IP, else user) are processed one after
+    another in stream order, so brute-force counters and correlation phases
+    see exactly the sequence the sync worker would;
+  * messages are XACKed in stream order, never past the oldest in-flight one.
+
+With STREAM_PARTITIONS > 0 it reads the partitions this process owns;
+partition heartbeats run in the shared housekeeping thread. Before a revoked
+partition's local state is flushed and dropped, reads pause and every event
+already in flight is finished, so none of them writes state for a partition
+another worker now owns. SIGTERM / SIGINT stop reading and drain the same way.
+
+Run:  python -m app.async_worker [--concurrency 64]
+(the same process setup as `python -m app.worker` with WORKER_MODE=async)
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import redis.asyncio as aioredis
+
+from app import dlq
+from app import worker as sync_worker
+from app.core import codec, metrics
+from app.core.config import settings
+from app.models.event import Event
+from app.services.storage import storage_service
+from app.services.normalization import normalization_service
+from app.services.templates import template_miner
+from app.services.enrichment import enrichment_service
+from app.services.detection_rules import rule_detector
+from app.services.detection_ml import ml_detector
+from app.services.correlation import correlation_service
+from app.services.response import response_service
+
+logger = logging.getLogger("aegis.async_worker")
+
+HOUSEKEEPING_INTERVAL = 1  # seconds
+
+
+class AsyncWorker:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.r = aioredis.from_url(
+            settings.REDIS_URL, decode_responses=True, encoding_errors=codec.REDIS_ENCODING_ERRORS
+        )
+        self.slots = asyncio.Semaphore(concurrency)
+        self.running = 0
+        # Read order of in-flight (stream, message_id) pairs and their outcome:
+        # None = still processing, True = ack, False = leave pending for reclaim
+        self.order: deque[tuple[str, str]] = deque()
+        self.outcome: dict[tuple[str, str], bool | None] = {}
+        # entity -> future resolved when that entity's latest event finishes
+        self.entity_tail: dict[str, asyncio.Future] = {}
+        self.tasks: set[asyncio.Task] = set()
+        # Held while reading and dispatching; drain() takes it so no new event starts meanwhile
+        self.dispatching = asyncio.Lock()
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # One thread more than the concurrency: housekeeping may block in drain() while events finish
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency + 1))
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stopping.set)
+        if sync_worker.coordinator is not None:
+            # Runs in the housekeeping thread, ahead of the state_cache.clear() callback
+            sync_worker.coordinator.on_revoke.insert(
+                0, lambda _lost: asyncio.run_coroutine_threadsafe(self.drain(), loop).result()
+            )
+        await asyncio.to_thread(sync_worker.create_consumer_group)
+        housekeeping = asyncio.create_task(self._housekeeping())
+
+        logger.info(
+            f"Async worker {sync_worker.CONSUMER_NAME} started on stream "
+            f"'{sync_worker.STREAM_KEY}' (concurrency={self.concurrency})…"
+        )
+        try:
+            while not self.stopping.is_set():
+                try:
+                    await self._read_and_dispatch()
+                except Exception as e:
+                    logger.error(f"Worker loop error: {e}")
+                    await asyncio.sleep(1)
+            logger.info(f"Async worker stopping, finishing {len(self.tasks)} in-flight event(s)")
+            await self.drain()
+        finally:
+            housekeeping.cancel()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(sig)
+            await self.r.close()
+
+    async def drain(self):
+        """Pause reads and wait until every event already read is processed and acked."""
+        async with self.dispatching:
+            while self.tasks:
+                await asyncio.wait(set(self.tasks))
+
+    async def _read_and_dispatch(self):
+        # Wait for one free slot, then read as many messages as there are free slots
+        await self.slots.acquire()
+        async with self.dispatching:
+            await self._dispatch_read()
+
+    async def _dispatch_read(self):
+        streams = sync_worker.consumed_streams()
+        if not streams:  # owns no partition right now
+            self.slots.release()
+            await asyncio.sleep(settings.WORKER_READ_BLOCK_MS / 1000)
+            return
+        # COUNT applies per stream, so split the free slots between them
+        count = max(1, (self.concurrency - self.running) // len(streams))
+        try:
+            entries = await self.r.xreadgroup(
+                sync_worker.GROUP_NAME,
+                sync_worker.CONSUMER_NAME,
+                {stream: ">" for stream in streams},
+                count=count,
+                block=settings.WORKER_READ_BLOCK_MS,
+            )
+        except Exception:
+            self.slots.release()
+            raise
+
+        messages = [(stream, *m) for stream, msgs in entries or [] for m in msgs]
+        if not messages:
+            self.slots.release()
+            return
+
+        for i, (stream, message_id, message_data) in enumerate(messages):
+            if i:
+                await self.slots.acquire()
+            self.running += 1
+            key = (stream, message_id)
+            self.order.append(key)
+            self.outcome[key] = None
+            task = asyncio.create_task(self._handle(key, message_data))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _handle(self, key: tuple[str, str], message_data: dict):
+        try:
+            ok = await self._process(*key, message_data)
+        finally:
+            self.running -= 1
+            self.slots.release()
+        self.outcome[key] = ok
+        await self._ack_ready()
+
+    async def _ack_ready(self):
+        """XACK the completed prefix of the in-flight window, in stream order."""
+        ready: dict[str, list[str]] = {}
+        while self.order and self.outcome[self.order[0]] is not None:
+            key = self.order.popleft()
+            if self.outcome.pop(key):
+                stream, message_id = key
+                ready.setdefault(stream, []).append(message_id)
+        for stream, ids in ready.items():
+            await self.r.xack(stream, sync_worker.GROUP_NAME, *ids)
+
+    async def _process(self, stream: str, message_id: str, message_data: dict) -> bool:
+        if not message_data.get("data"):
+            return True
+        try:
+            log_entry = Event(codec.decode_entry(message_data))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            # _decode records the error and dead-letters the message
+            await asyncio.to_thread(sync_worker._decode, message_id, message_data, stream)
+            return False
+
+        start = time.perf_counter()
+        stage = metrics.STAGE_LATENCY.time
+        try:
+            # 1. Normalize, or template unparsed messages (CPU only, stays on the event loop)
+            with stage(stage="normalize"):
+                extracted = normalization_service.parse_log(
+                    log_entry.message, log_entry.source or ""
+                )
+                if extracted:
+                    log_entry.update(extracted)
+            if not extracted:
+                with stage(stage="template"):
+                    template_miner.process_event(log_entry)
+
+            # 2-6. Stateful stages, serialized per entity
+            await self._run_in_entity_order(log_entry.entity, log_entry)
+
+            # 7. Index to ES + 8. publish to the live feed
+            doc = log_entry.to_dict()
+            with stage(stage="index"), sync_worker.backpressure.track_index():
+                await storage_service.aindex_log(doc)
+            with stage(stage="publish"):
+                await self.r.publish(sync_worker.PUBSUB_CHANNEL, codec.dumps_bytes(doc))
+
+            sync_worker.record_outcome([log_entry], time.perf_counter() - start)
+            return True
+
+        except Exception as e:
+            logger.error(f"Processing error for {message_id}: {e}")
+            await dlq.record_failure(self.r, message_id, e, stream)
+            return False
+
+    async def _run_in_entity_order(self, entity: str | None, log_entry: Event):
+        if not entity:
+            await asyncio.to_thread(_detect, log_entry)
+            return
+
+        previous = self.entity_tail.get(entity)
+        done = asyncio.get_running_loop().create_future()
+        self.entity_tail[entity] = done
+        try:
+            if previous is not None:
+                await previous
+            await asyncio.to_thread(_detect, log_entry)
+        finally:
+            done.set_result(None)
+            if self.entity_tail.get(entity) is done:
+                del self.entity_tail[entity]
+
+    async def _housekeeping(self):
+        """iptables sync and pending-entry reclaim, shared with the sync worker."""
+        while True:
+            await asyncio.sleep(HOUSEKEEPING_INTERVAL)
+            try:
+                await asyncio.to_thread(sync_worker.run_housekeeping)
+            except Exception as e:
+                logger.error(f"Housekeeping error: {e}")
+
+
+def _detect(log_entry: Event):
+    """Enrichment → rules → ML → correlation → response (blocking; runs in a thread)."""
+    stage = metrics.STAGE_LATENCY.time
+    with stage(stage="enrich"):
+        enrichment_service.enrich_log(log_entry)
+    with stage(stage="rules"):
+        sync_worker._apply_rules(log_entry, *rule_detector.check_rules(log_entry))
+    with stage(stage="ml"):
+        sync_worker._apply_anomaly(log_entry, ml_detector.predict(log_entry))
+    with stage(stage="correlation"):
+        correlation_service.process_event(log_entry)
+    with stage(stage="response"):
+        sync_worker._apply_response(log_entry, response_service.evaluate(log_entry))
+
+
+def run(concurrency: int | None = None):
+    asyncio.run(AsyncWorker(concurrency or settings.WORKER_CONCURRENCY).run())
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Aegis asyncio stream worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.WORKER_CONCURRENCY,
+        help="max events in flight at once",
+    )
+    args = parser.parse_args(argv)
+    with sync_worker.worker_lifecycle():
+        run(args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Event serialization, shared by the queue, the workers, the live feed, the
+offline pipeline and the Elasticsearch client.
+
+JSON goes through the fastest library installed: orjson, else msgspec, else
+the standard library. All three give the same documents: datetimes as
+ISO 8601, numpy scalars as plain numbers, anything else unknown as str()
+(what the old `json.dumps(..., default=str)` calls did, minus the space in
+datetimes).
+
+Stream entries carry a format version so producers and workers can be
+upgraded independently:
+
+  {"data": <json>}               v1, what every worker understands
+  {"v": "2", "data": <msgpack>}  written when STREAM_CODEC=msgpack
+
+decode_entry() reads both. Roll out new workers first, then switch the
+producers. The Redis clients that touch stream entries use
+REDIS_ENCODING_ERRORS so msgpack bytes survive their decode_responses=True
+connections unchanged.
+"""
+import json
+from datetime import date, datetime
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # optional fast path
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional fast path
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:  # only needed for STREAM_CODEC=msgpack
+    msgpack = None
+
+MSGPACK_VERSION = "2"
+# Lets binary stream fields round-trip through str-decoding Redis clients
+REDIS_ENCODING_ERRORS = "surrogateescape"
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "item"):  # numpy scalar
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+    _decoder = msgspec.json.Decoder()
+
+    def dumps_bytes(obj) -> bytes:
+        return _encoder.encode(obj)
+
+    def loads(data):
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+else:
+    BACKEND = "json"
+
+    def dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps(obj) -> str:
+    return dumps_bytes(obj).decode()
+
+
+# ---- stream entries ----
+
+def encode_entry(event: dict, codec: str | None = None) -> dict:
+    """Stream fields for an event, in STREAM_CODEC format."""
+    if (codec or settings.STREAM_CODEC) == "msgpack":
+        return {"v": MSGPACK_VERSION, "data": msgpack.packb(event, default=_default)}
+    return {"data": dumps_bytes(event)}
+
+
+def decode_entry(fields: dict) -> dict:
+    """Event from stream fields of any known version; ValueError if unreadable."""
+    version = fields.get("v")
+    data = fields["data"]
+    if version is None:
+        return loads(data)
+    if version == MSGPACK_VERSION:
+        if msgpack is None:
+            raise ValueError("msgpack stream entry but msgpack is not installed")
+        if isinstance(data, str):
+            data = data.encode("utf-8", REDIS_ENCODING_ERRORS)
+        try:
+            return msgpack.unpackb(data, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"bad msgpack entry: {e}") from e
+    raise ValueError(f"unknown stream entry version {version!r}")
+
+
+def entry_fields(fields: dict) -> dict:
+    """The fields that carry the event, for copying an entry elsewhere (DLQ, replay)."""
+    copied = {"data": fields.get("data", "")}
+    if "v" in fields:
+        copied["v"] = fields["v"]
+    return copied
@@ -0,0 +1,146 @@
+"""
+Compressed request bodies for the ingest routes.
+
+Shippers may send `Content-Encoding: gzip` or `zstd`. RequestDecompressionMiddleware
+decodes the body chunk by chunk as the endpoint reads it, so streaming
+routes (/ingest/ndjson) stay streaming and nothing is inflated up front.
+Output is produced in bounded pieces and counted against
+INGEST_MAX_DECOMPRESSED_BYTES; going over it answers 413 before the excess
+is ever held in memory (zip-bomb guard).
+
+zstd needs the `zstandard` package; without it zstd bodies get 415.
+"""
+import zlib
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.core import metrics
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip still works
+    zstandard = None
+
+# Largest piece a decoder emits per step; bounds overshoot past the ceiling
+OUTPUT_CHUNK = 64 * 1024
+
+
+def supported_encodings() -> list[str]:
+    return ["gzip", "zstd"] if zstandard else ["gzip"]
+
+
+class _Sink:
+    """zstd stream_writer target that collects output and enforces the ceiling."""
+
+    def __init__(self, decoder: "BodyDecoder"):
+        self.decoder = decoder
+        self.parts: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.decoder._count(len(data))
+        self.parts.append(data)
+        return len(data)
+
+
+class BodyDecoder:
+    """Incremental decoder for one request body; raises 413 past `max_bytes`."""
+
+    def __init__(self, encoding: str, max_bytes: int):
+        self.encoding = encoding
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._in_member = False  # gzip: inside a member that has not ended yet
+        if encoding == "gzip":
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._sink = _Sink(self)
+            self._zstd = zstandard.ZstdDecompressor().stream_writer(
+                self._sink, write_size=OUTPUT_CHUNK, write_return_read=True
+            )
+
+    def _count(self, size: int):
+        self.total += size
+        if self.max_bytes and self.total > self.max_bytes:
+            metrics.INGEST_REJECTED.inc(route="decompress", reason="too_large")
+            raise HTTPException(
+                status_code=413,
+                detail=f"Decompressed body exceeds {self.max_bytes} bytes",
+            )
+
+    def feed(self, data: bytes) -> bytes:
+        try:
+            if self.encoding == "gzip":
+                return self._feed_gzip(data)
+            self._zstd.write(data)
+            out, self._sink.parts = b"".join(self._sink.parts), []
+            return out
+        except HTTPException:
+            raise
+        except Exception as e:  # zlib.error / zstandard.ZstdError
+            raise HTTPException(status_code=400, detail=f"Invalid {self.encoding} body: {e}")
+
+    def finish(self):
+        """End of body: a gzip member cut off mid-stream is an error."""
+        if self._in_member:
+            raise HTTPException(status_code=400, detail="Truncated gzip body")
+
+    def _feed_gzip(self, data: bytes) -> bytes:
+        parts = []
+        while data:
+            self._in_member = True
+            out = self._zlib.decompress(data, OUTPUT_CHUNK)
+            self._count(len(out))
+            parts.append(out)
+            data = self._zlib.unconsumed_tail
+            if self._zlib.eof:
+                # Concatenated gzip members (e.g. appended batches)
+                self._in_member = False
+                data = self._zlib.unused_data + data
+                self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return b"".join(parts)
+
+
+class RequestDecompressionMiddleware:
+    """ASGI middleware: decode gzip / zstd request bodies under `path_prefix`."""
+
+    def __init__(self, app, path_prefix: str = "/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"content-encoding":
+                encoding = value.decode("latin-1").strip().lower()
+        if encoding in (None, "", "identity"):
+            return await self.app(scope, receive, send)
+        if encoding not in supported_encodings():
+            response = JSONResponse(
+                {"detail": f"Unsupported Content-Encoding '{encoding}'"},
+                status_code=415,
+                headers={"Accept-Encoding": ", ".join(supported_encodings())},
+            )
+            return await response(scope, receive, send)
+
+        # The endpoint sees a plain body of unknown length
+        scope = dict(
+            scope,
+            headers=[(n, v) for n, v in scope["headers"] if n not in (b"content-encoding", b"content-length")],
+        )
+        decoder = BodyDecoder(encoding, settings.INGEST_MAX_DECOMPRESSED_BYTES)
+
+        async def receive_decoded():
+            message = await receive()
+            if message["type"] == "http.request":
+                body = decoder.feed(message.get("body", b""))
+                if not message.get("more_body", False):
+                    decoder.finish()
+                message = dict(message, body=body)
+            return message
+
+        await self.app(scope, receive_decoded, send)
@@ -16,10 +16,123 @@ class Settings(BaseSettings):
     IPINFO_TOKEN: str = ""
     ABUSEIPDB_API_KEY: str = ""
 
+    # Worker
+    # "single" processes one event at a time; "batch" moves each XREADGROUP
+    # batch through the pipeline as a unit (pipelined Redis, ES _bulk, one XACK);
+    # "async" keeps WORKER_CONCURRENCY events in flight (app/async_worker.py).
+    WORKER_MODE: str = "single"
+    WORKER_BATCH_SIZE: int = 100
+    # Max time to wait for a batch to fill before processing what we have
+    WORKER_BATCH_LINGER_MS: int = 50
+    # Max events in flight per process in async mode
+    WORKER_CONCURRENCY: int = 32
+    # Worker processes started by `python -m app.worker` (0 = one per CPU core)
+    WORKER_PROCESSES: int = 1
+    # Delay between successive process starts in the pool
+    WORKER_STARTUP_STAGGER_SECONDS: float = 2.0
+    # Pending entries idle this long are re-delivered (failed or orphaned by a dead worker)
+    WORKER_RECLAIM_IDLE_MS: int = 60000
+    WORKER_RECLAIM_INTERVAL_SECONDS: int = 15
+    # Deliveries after which a message is moved to the logs_stream:dlq stream
+    WORKER_MAX_DELIVERIES: int = 5
+    # XREADGROUP COUNT grows with consumer-group lag between these bounds
+    # (batch mode caps it at WORKER_BATCH_SIZE instead of the max)
+    WORKER_READ_COUNT_MIN: int = 10
+    WORKER_READ_COUNT_MAX: int = 500
+    # How long an idle read blocks; also bounds how late housekeeping runs
+    WORKER_READ_BLOCK_MS: int = 500
+    # Prometheus endpoint per worker process (port + pool slot); 0 disables
+    WORKER_METRICS_PORT: int = 9101
+
+    # Shard logs_stream by entity (IP, else user) into logs_stream:{0..N-1};
+    # 0 keeps the single stream. Workers share the partitions via leases that
+    # expire after STREAM_PARTITION_TTL_SECONDS without a heartbeat.
+    STREAM_PARTITIONS: int = 0
+    STREAM_PARTITION_TTL_SECONDS: int = 15
+    # Stream entry format written by producers: "json" (v1) or "msgpack" (v2).
+    # Workers read both; upgrade them before switching producers.
+    STREAM_CODEC: str = "json"
+    # How often workers and the API check app/rules/parsers.yaml for changes (0 = never)
+    PARSERS_RELOAD_SECONDS: int = 10
+    # Log template mining (app/services/templates.py) for messages no parser
+    # matches: leading tokens that route a message down the prefix tree (Drain's
+    # depth minus 2), similarity needed to join a template, children per tree
+    # node, templates per process, sources with their own templates besides the
+    # parsers' (others share "other"), and how often they are written to Redis
+    TEMPLATES_ENABLED: bool = True
+    TEMPLATES_DEPTH: int = 2
+    TEMPLATES_SIMILARITY: float = 0.5
+    TEMPLATES_MAX_CHILDREN: int = 100
+    TEMPLATES_MAX: int = 50000
+    TEMPLATES_MAX_SOURCES: int = 50
+    TEMPLATES_FLUSH_SECONDS: int = 10
+    # Index the raw message of templated events too. Off by default: template_id +
+    # params carry the line (minus whitespace) at a fraction of the size, but
+    # full-text search over logs-write no longer matches templated messages
+    TEMPLATES_INDEX_MESSAGE: bool = False
+
+    # Detection state (brute-force windows, admin IPs, correlation phases):
+    # "strict" = every access is a Redis call; "local" = in-process cache with
+    # write-behind flushes (needs one worker per entity: 1 process or STREAM_PARTITIONS)
+    STATE_CONSISTENCY: str = "strict"
+    STATE_CACHE_MAX_ENTRIES: int = 100000
+    STATE_FLUSH_INTERVAL_MS: int = 200
+    # Max staleness of values other processes write (API rate_limit counters)
+    STATE_SHARED_READ_TTL_MS: int = 1000
+
+    # logs_stream retention: acked entries are trimmed every interval; above
+    # these ceilings (0 = off) ingest is throttled instead of deleting unprocessed data
+    RETENTION_INTERVAL_SECONDS: int = 10
+    RETENTION_MAX_LEN: int = 1000000
+    RETENTION_MAX_MEMORY_MB: int = 0
+
+    # Ingest backpressure: /ingest answers 503 + Retry-After while any worker
+    # sees ES writes slower than this (EWMA) or group lag above this
+    BACKPRESSURE_MAX_INDEX_MS: int = 2000
+    BACKPRESSURE_MAX_LAG: int = 50000
+    BACKPRESSURE_RETRY_AFTER_SECONDS: int = 5
+
+    # Streaming ingest (/ingest/ndjson): events per pipelined XADD while the
+    # body is still arriving, longest accepted line, per-line errors reported
+    INGEST_CHUNK_SIZE: int = 500
+    INGEST_MAX_LINE_BYTES: int = 1048576
+    INGEST_MAX_REPORTED_ERRORS: int = 100
+    # Ceiling on a gzip/zstd ingest body once decompressed (413 above; 0 = none)
+    INGEST_MAX_DECOMPRESSED_BYTES: int = 268435456
+
+    # Syslog listener (python -m app.syslog_server); a port of 0 disables it.
+    # Events wait in a bounded buffer and are XADDed in pipelined batches.
+    SYSLOG_HOST: str = "0.0.0.0"
+    SYSLOG_UDP_PORT: int = 5514
+    SYSLOG_TCP_PORT: int = 5514
+    SYSLOG_BUFFER_SIZE: int = 100000
+    SYSLOG_BATCH_SIZE: int = 500
+    SYSLOG_FLUSH_MS: int = 50
+    SYSLOG_MAX_MESSAGE_BYTES: int = 65536
+
+    # Ingest rate limits, token buckets written "requests/seconds". Route
+    # overrides are keyed by endpoint name (ingest_logs, ingest_raw,
+    # ingest_ndjson); principal overrides by username (agent keys: agent:<name>)
+    # and share one bucket.
+    RATE_LIMIT_DEFAULT: str = "1000/60"
+    RATE_LIMIT_ROUTES: str = ""
+    RATE_LIMIT_PRINCIPALS: str = ""
+    # Refuse clients Redis just refused without a round-trip until their next token
+    RATE_LIMIT_LOCAL_PRECHECK: bool = True
+
+    # Keep blocked:{ip} in API process memory, updated over pub/sub from
+    # ResponseService.execute_block and fully reloaded every resync interval
+    BLOCKLIST_LOCAL: bool = True
+    BLOCKLIST_RESYNC_SECONDS: int = 60
+
     # JWT
     SECRET_KEY: str = "change-me-in-production-use-openssl-rand-hex-32"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    # Verified tokens / agent-key records kept per API process; a revoked
+    # agent key may be accepted for up to AGENT_KEY_CACHE_SECONDS
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AGENT_KEY_CACHE_SECONDS: int = 30
 
     # Clerk (external auth provider)
     CLERK_SECRET_KEY: str = ""
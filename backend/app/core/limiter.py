@@ -1,27 +1,203 @@
+"""
+Ingest rate limiting: token buckets in Redis, one EVALSHA per request.
+
+A limit "N/W" is a bucket of N tokens refilled at N per W seconds, so a
+client may burst N requests and then sustain N/W per second, with no 2x
+burst at window edges. The script refills the bucket, takes a token, sets
+the bucket's TTL and bumps the per-minute rate_limit:{ip} counter that the
+ML features read, all atomically (no key can be left without a TTL).
+
+Which limit applies:
+  * a principal listed in RATE_LIMIT_PRINCIPALS gets that limit, in one
+    bucket shared by all its clients (per route);
+  * everyone else gets a bucket per route and client IP, sized by
+    RATE_LIMIT_ROUTES (keyed by endpoint name, e.g. ingest_ndjson) or
+    RATE_LIMIT_DEFAULT.
+
+With RATE_LIMIT_LOCAL_PRECHECK, a bucket Redis just refused is refused in
+process, without a round-trip, until its next token is due.
+
+Responses carry RateLimit-Limit / -Remaining / -Reset / -Policy headers
+(IETF draft); 429s add Retry-After.
+"""
+import hashlib
+import math
+import time
+from typing import Callable, NamedTuple
+
 import redis
-from fastapi import Request, HTTPException
+from fastapi import HTTPException, Request, Response
+
 from app.core.config import settings
+from app.services.queue import queue_service
+
+_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local per_ms = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * per_ms)
+
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / per_ms))
+
+-- requests per minute per IP, read by the ML detector
+if redis.call('INCR', KEYS[2]) == 1 then
+    redis.call('EXPIRE', KEYS[2], 60)
+end
+
+local retry = 0
+if allowed == 0 then
+    retry = math.ceil((cost - tokens) / per_ms)
+end
+return {allowed, math.floor(tokens), math.ceil((capacity - tokens) / per_ms), retry}
+"""
+
+# Refusals remembered for the local pre-check before stale ones are swept
+_MAX_REFUSED = 10000
+
+
+class Limit(NamedTuple):
+    requests: int
+    seconds: int
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: Limit
+    remaining: int
+    reset_ms: int
+    retry_after_ms: int
+
+
+def parse_limit(value: str) -> Limit:
+    """'1000/60' -> Limit(1000, 60); a bare number means per minute."""
+    requests, _, seconds = value.strip().partition("/")
+    return Limit(int(requests), int(seconds or 60))
+
+
+def parse_limits(value: str) -> dict[str, Limit]:
+    """'ingest_ndjson=100/60,ingest_raw=2000/60' -> {name: Limit}"""
+    limits = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, limit = item.partition("=")
+            limits[name.strip()] = parse_limit(limit)
+    return limits
+
 
 class RateLimiter:
-    def __init__(self, requests_per_minute: int = 1000):
-        self.limit = requests_per_minute
-        self.redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-
-    async def __call__(self, request: Request):
-        client_ip = request.client.host
-        key = f"rate_limit:{client_ip}"
-        
-        # Increment counter (Lua script for atomicity would be better in ultra-high load, but this is fine for now)
-        current = self.redis.incr(key)
-        
-        if current == 1:
-            self.redis.expire(key, 60) # Reset every minute
-            
-        if current > self.limit:
+    def __init__(self, default: str | None = None, routes: str | None = None, principals: str | None = None):
+        self.redis = queue_service.aredis
+        self.default = parse_limit(default or settings.RATE_LIMIT_DEFAULT)
+        self.routes = parse_limits(settings.RATE_LIMIT_ROUTES if routes is None else routes)
+        self.principals = parse_limits(settings.RATE_LIMIT_PRINCIPALS if principals is None else principals)
+        self.local_precheck = settings.RATE_LIMIT_LOCAL_PRECHECK
+        self.sha = hashlib.sha1(_TOKEN_BUCKET.encode()).hexdigest()
+        self._loaded = False
+        # bucket key -> (monotonic time the next token is due, refusal to replay)
+        self._refused: dict[str, tuple[float, Decision]] = {}
+
+    def policy(self, route: str, principal: str | None, client_ip: str) -> tuple[str, Limit]:
+        """Bucket key and limit for a request."""
+        if principal and principal in self.principals:
+            return f"rate_limit:bucket:{route}:principal:{principal}", self.principals[principal]
+        return f"rate_limit:bucket:{route}:{client_ip}", self.routes.get(route, self.default)
+
+    def precheck(self, key: str) -> Decision | None:
+        """A refusal still in force for `key`, known without asking Redis."""
+        if not self.local_precheck:
+            return None
+        refused = self._refused.get(key)
+        if refused is None:
+            return None
+        until, decision = refused
+        remaining_ms = (until - time.monotonic()) * 1000
+        if remaining_ms <= 0:
+            del self._refused[key]
+            return None
+        return decision._replace(retry_after_ms=math.ceil(remaining_ms))
+
+    def queue(self, pipe, key: str, limit: Limit, client_ip: str, cost: int = 1):
+        """Add the bucket check to `pipe` so callers can share the round-trip."""
+        per_ms = limit.requests / (limit.seconds * 1000)
+        pipe.evalsha(self.sha, 2, key, f"rate_limit:{client_ip}", limit.requests, per_ms, cost)
+
+    async def run(self, build: Callable) -> list:
+        """
+        Execute a pipeline that `build(pipe)` fills. The script is loaded once
+        per process, and again if Redis lost it (restart / SCRIPT FLUSH).
+        """
+        for attempt in range(2):
+            if not self._loaded:
+                await self.redis.script_load(_TOKEN_BUCKET)
+                self._loaded = True
+            pipe = self.redis.pipeline(transaction=False)
+            build(pipe)
+            try:
+                return await pipe.execute()
+            except redis.exceptions.NoScriptError:
+                self._loaded = False
+                if attempt:
+                    raise
+
+    def decide(self, key: str, limit: Limit, reply: list) -> Decision:
+        allowed, remaining, reset_ms, retry_after_ms = reply
+        decision = Decision(bool(allowed), limit, remaining, reset_ms, retry_after_ms)
+        if not decision.allowed and self.local_precheck:
+            if len(self._refused) >= _MAX_REFUSED:
+                now = time.monotonic()
+                self._refused = {k: v for k, v in self._refused.items() if v[0] > now}
+            self._refused[key] = (time.monotonic() + retry_after_ms / 1000, decision)
+        return decision
+
+    @staticmethod
+    def headers(decision: Decision) -> dict[str, str]:
+        return {
+            "RateLimit-Limit": str(decision.limit.requests),
+            "RateLimit-Remaining": str(decision.remaining),
+            "RateLimit-Reset": str(math.ceil(decision.reset_ms / 1000)),
+            "RateLimit-Policy": f"{decision.limit.requests};w={decision.limit.seconds}",
+        }
+
+    def enforce(self, decision: Decision, response: Response | None = None):
+        """Raise 429 for a refusal; otherwise add the RateLimit-* headers to `response`."""
+        headers = self.headers(decision)
+        if not decision.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(decision.retry_after_ms / 1000)))
             raise HTTPException(
-                status_code=429, 
-                detail="Too Many Requests. Rate limit exceeded."
+                status_code=429,
+                detail="Too Many Requests. Rate limit exceeded.",
+                headers=headers,
             )
+        if response is not None:
+            response.headers.update(headers)
+
+    async def __call__(self, request: Request, response: Response):
+        """Standalone dependency: per-IP bucket for the matched route."""
+        ip = request.client.host
+        key, limit = self.policy(route_name(request), None, ip)
+        decision = self.precheck(key)
+        if decision is None:
+            (reply,) = await self.run(lambda pipe: self.queue(pipe, key, limit, ip))
+            decision = self.decide(key, limit, reply)
+        self.enforce(decision, response)
+
+
+def route_name(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "name", None) or "default"
+
 
 # Dependency used in routes
-limiter = RateLimiter(requests_per_minute=1000)
+limiter = RateLimiter()
@@ -0,0 +1,375 @@
+"""
+Lightweight Prometheus-compatible metrics.
+
+Every process keeps its own registry. Workers serve theirs on
+WORKER_METRICS_PORT and push a JSON snapshot to the Redis hash
+`metrics:workers` every few seconds; the API merges the live snapshots so
+GET /metrics and /dashboard/stats describe the whole worker fleet.
+
+Usage
+-----
+    from app.core.metrics import STAGE_LATENCY, EVENTS
+
+    with STAGE_LATENCY.time(stage="rules"):
+        ...
+    EVENTS.inc(source="nginx")
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "metrics:workers"
+SNAPSHOT_MAX_AGE = 30  # seconds; older snapshots belong to dead workers
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: tuple = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def dump(self) -> dict:
+        with self._lock:
+            values = [[list(k), v] for k, v in self._values.items()]
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "values": values,
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def merge(self, values: list):
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        return self._header() + [
+            f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def merge(self, values: list):
+        # Fleet gauges (stream lag, PEL size) are global values every worker
+        # samples independently, so the freshest-highest reading wins.
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                self._values[key] = max(self._values.get(key, value), value)
+
+    def render(self) -> list[str]:
+        return self._header() + [
+            f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, count: int = 1, **labels):
+        """Record `count` observations of `value` (count > 1 for amortized batch timings)."""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += count
+                    break
+            state[1] += value * count
+            state[2] += count
+
+    @contextmanager
+    def time(self, count: int = 1, **labels):
+        """Time the block; with count > 1 the elapsed time is split evenly per event."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if count:
+                self.observe((time.perf_counter() - start) / count, count=count, **labels)
+
+    def dump(self) -> dict:
+        data = super().dump()
+        data["buckets"] = list(self.buckets)
+        return data
+
+    def merge(self, values: list):
+        with self._lock:
+            for key, (counts, total, n) in values:
+                key = tuple(key)
+                state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += n
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, (counts, total, n) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{self._labels(key, (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels(key, (('le', '+Inf'),))} {n}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {n}")
+        return lines
+
+
+class RateWindow:
+    """Events and their summed latency per second, over a trailing window."""
+
+    def __init__(self, seconds: int = 60):
+        self.seconds = seconds
+        self._lock = threading.Lock()
+        self._buckets: dict[int, list] = {}
+
+    def record(self, events: int, latency_total: float):
+        now = int(time.time())
+        with self._lock:
+            bucket = self._buckets.setdefault(now, [0, 0.0])
+            bucket[0] += events
+            bucket[1] += latency_total
+            if len(self._buckets) > self.seconds:
+                for second in [s for s in self._buckets if s <= now - self.seconds]:
+                    del self._buckets[second]
+
+    def totals(self) -> dict:
+        cutoff = int(time.time()) - self.seconds
+        with self._lock:
+            live = [b for s, b in self._buckets.items() if s > cutoff]
+        return {
+            "events": sum(b[0] for b in live),
+            "latency_sum": sum(b[1] for b in live),
+            "seconds": self.seconds,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self.window = RateWindow()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            "ts": time.time(),
+            "window": self.window.totals(),
+            "metrics": {name: m.dump() for name, m in self._metrics.items()},
+        }
+
+    def merge(self, snapshot: dict):
+        """Add another process's snapshot into this registry."""
+        for name, data in snapshot.get("metrics", {}).items():
+            if data["kind"] == "histogram":
+                metric = self.histogram(name, data["help"], data["labels"], data["buckets"])
+            elif data["kind"] == "gauge":
+                metric = self.gauge(name, data["help"], data["labels"])
+            else:
+                metric = self.counter(name, data["help"], data["labels"])
+            metric.merge(data["values"])
+
+
+registry = Registry()
+
+# ---- Worker pipeline metrics ----
+STAGE_LATENCY = registry.histogram(
+    "aegis_stage_duration_seconds", "Per-event latency of each worker pipeline stage", ["stage"]
+)
+EVENTS = registry.counter("aegis_events_processed_total", "Events processed by the worker", ["source"])
+ALERTS = registry.counter("aegis_alerts_total", "Alerts raised by the worker", ["source"])
+INCIDENTS = registry.counter("aegis_incidents_total", "Correlated incidents raised by the worker", ["source"])
+STREAM_LAG = registry.gauge(
+    "aegis_stream_lag", "Stream entries not yet delivered to the consumer group", ["stream", "group"]
+)
+STREAM_PENDING = registry.gauge(
+    "aegis_stream_pending", "Delivered but un-acknowledged entries (PEL size)", ["stream", "group"]
+)
+STREAM_LENGTH = registry.gauge("aegis_stream_length", "Entries held in the stream (XLEN)", ["stream"])
+STREAM_TRIMMED = registry.counter(
+    "aegis_stream_trimmed_total", "Acknowledged entries removed by stream retention", ["stream"]
+)
+STATE_CACHE = registry.counter(
+    "aegis_state_cache_requests_total", "Local detection-state lookups (STATE_CONSISTENCY=local)", ["result"]
+)
+NORMALIZE_PARSERS = registry.counter(
+    "aegis_normalize_parser_total",
+    "Normalization parser outcomes: hit, miss (regex ran, no match), skipped (prefilter rejected)",
+    ["parser", "result"],
+)
+TEMPLATE_EVENTS = registry.counter(
+    "aegis_template_events_total",
+    "Unparsed events by log template outcome: matched, created, full (TEMPLATES_MAX reached)",
+    ["result"],
+)
+STATE_FLUSHED = registry.counter(
+    "aegis_state_flushed_keys_total", "Detection-state keys written back to Redis by the state cache"
+)
+
+# ---- Ingest API metrics ----
+INGESTED = registry.counter("aegis_ingest_events_total", "Events queued by the ingest API", ["route"])
+INGEST_REJECTED = registry.counter(
+    "aegis_ingest_rejected_total", "Ingest lines or events dropped by the API", ["route", "reason"]
+)
+
+# ---- Syslog listener metrics ----
+SYSLOG_RECEIVED = registry.counter("aegis_syslog_received_total", "Syslog messages received", ["transport"])
+SYSLOG_DROPPED = registry.counter(
+    "aegis_syslog_dropped_total", "Syslog messages dropped before reaching the stream", ["reason"]
+)
+SYSLOG_BUFFERED = registry.gauge("aegis_syslog_buffered", "Syslog events waiting to be queued")
+
+
+def update_stream_gauges(client, streams: list[str]):
+    """Refresh lag / PEL gauges from XINFO GROUPS (lag needs Redis >= 7)."""
+    for stream in streams:
+        try:
+            for group in client.xinfo_groups(stream):
+                STREAM_PENDING.set(group["pending"], stream=stream, group=group["name"])
+                if group.get("lag") is not None:
+                    STREAM_LAG.set(group["lag"], stream=stream, group=group["name"])
+        except Exception as e:
+            logger.debug(f"Stream gauges unavailable for {stream}: {e}")
+
+
+def publish_snapshot(client, name: str):
+    client.hset(SNAPSHOT_KEY, name, json.dumps(registry.snapshot()))
+
+
+def live_snapshots(client) -> list[dict]:
+    """Worker snapshots younger than SNAPSHOT_MAX_AGE; stale ones are removed."""
+    live, stale = [], []
+    now = time.time()
+    for name, raw in client.hgetall(SNAPSHOT_KEY).items():
+        try:
+            snap = json.loads(raw)
+        except ValueError:
+            stale.append(name)
+            continue
+        if now - snap.get("ts", 0) > SNAPSHOT_MAX_AGE:
+            stale.append(name)
+        else:
+            live.append(snap)
+    if stale:
+        client.hdel(SNAPSHOT_KEY, *stale)
+    return live
+
+
+def fleet_registry(snapshots: list[dict]) -> Registry:
+    """This process's metrics merged with the given worker snapshots."""
+    merged = Registry()
+    merged.merge(registry.snapshot())
+    for snap in snapshots:
+        merged.merge(snap)
+    return merged
+
+
+def fleet_throughput(snapshots: list[dict]) -> tuple[float, float]:
+    """(events/sec, avg end-to-end processing ms) over the workers' trailing windows."""
+    events = sum(s["window"]["events"] for s in snapshots)
+    latency = sum(s["window"]["latency_sum"] for s in snapshots)
+    seconds = max((s["window"]["seconds"] for s in snapshots), default=0)
+    eps = events / seconds if seconds else 0.0
+    avg_ms = latency / events * 1000 if events else 0.0
+    return round(eps, 1), round(avg_ms, 2)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    """Serve this process's registry on :port/ in a daemon thread."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on :{port}")
+    return server
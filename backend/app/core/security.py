@@ -12,18 +12,29 @@ Optional (returns None if no token):
     @router.get("/maybe-protected")
     async def maybe(user: dict = Depends(get_current_user_optional)):
         ...
+
+Ingest (user JWT or agent key, via Bearer or X-API-Key):
+    @router.post("/ingest")
+    async def ingest(principal: dict = Depends(get_ingest_principal)):
+        ...
+
+Verified JWTs are cached (LRU keyed by the token's SHA-256, until `exp`),
+so a shipper re-sending the same token is not re-verified on every request.
 """
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+import hashlib
 import time
 
 import requests as _requests
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.services.agent_keys import PREFIX as AGENT_KEY_PREFIX, agent_keys
 
 # ---------------------------------------------------------------------------
 # Password hashing
@@ -34,6 +45,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token
 oauth2_scheme_optional = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/token", auto_error=False
 )
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
 def verify_password(plain: str, hashed: str) -> bool:
@@ -128,6 +140,36 @@ def decode_token(token: str) -> dict:
     return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
 
 
+class VerifiedTokenCache:
+    """LRU of verified tokens: sha256(token) -> (payload, exp or None)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, tuple[dict, float | None]] = OrderedDict()
+
+    def decode(self, token: str) -> dict:
+        """decode_token, skipping the signature check for tokens seen before."""
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self._entries.get(digest)
+        if cached is not None:
+            payload, exp = cached
+            if exp is None or exp > time.time():
+                self._entries.move_to_end(digest)
+                return payload
+            del self._entries[digest]
+            raise JWTError("Signature has expired.")
+
+        payload = decode_token(token)
+        exp = payload.get("exp")
+        self._entries[digest] = (payload, float(exp) if exp is not None else None)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return payload
+
+
+token_cache = VerifiedTokenCache(settings.AUTH_CACHE_MAX_ENTRIES)
+
+
 # ---------------------------------------------------------------------------
 # FastAPI dependencies
 # ---------------------------------------------------------------------------
@@ -141,7 +183,7 @@ CREDENTIALS_EXCEPTION = HTTPException(
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     try:
-        payload = decode_token(token)
+        payload = token_cache.decode(token)
         username: str | None = payload.get("sub")
         if not username:
             raise CREDENTIALS_EXCEPTION
@@ -156,10 +198,29 @@ async def get_current_user_optional(
     if not token:
         return None
     try:
-        payload = decode_token(token)
+        payload = token_cache.decode(token)
         username: str | None = payload.get("sub")
         if username:
             return {"username": username}
     except JWTError:
         pass
     return None
+
+
+async def get_ingest_principal(
+    token: str | None = Depends(oauth2_scheme_optional),
+    api_key: str | None = Depends(api_key_header),
+) -> dict:
+    """
+    Ingest routes accept a user JWT or an agent key (`aegis_...`), either as
+    the Bearer token or in X-API-Key. Agents are named `agent:<name>`.
+    """
+    credential = api_key or token
+    if not credential:
+        raise CREDENTIALS_EXCEPTION
+    if credential.startswith(AGENT_KEY_PREFIX):
+        agent = await agent_keys.verify(credential)
+        if agent is None:
+            raise CREDENTIALS_EXCEPTION
+        return {"username": f"agent:{agent}", "agent": agent}
+    return await get_current_user(credential)
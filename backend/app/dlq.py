@@ -0,0 +1,140 @@
+"""
+Dead-letter queue for the log stream.
+
+The worker leaves a message pending when processing fails. Its reclaim loop
+re-delivers pending messages that have been idle for WORKER_RECLAIM_IDLE_MS;
+once a message has been delivered WORKER_MAX_DELIVERIES times it is moved to
+`logs_stream:dlq` together with its delivery count and last error.
+With STREAM_PARTITIONS > 0 all partitions share the one DLQ, and replay
+routes each entry back to its entity's partition.
+
+CLI:
+    python -m app.dlq stats
+    python -m app.dlq list [--count 20]
+    python -m app.dlq replay [--count N] [--batch 500]
+    python -m app.dlq purge
+"""
+import argparse
+import logging
+import time
+from typing import Iterable
+
+from app.core import codec
+from app.services.queue import queue_service
+
+logger = logging.getLogger("aegis.dlq")
+
+STREAM_KEY = queue_service.stream_name
+DLQ_KEY = f"{STREAM_KEY}:dlq"
+# message_id -> last processing error, kept until the message is acked or dead-lettered
+FAILURES_KEY = f"{STREAM_KEY}:failures"
+
+
+def failure_field(message_id: str, stream: str = STREAM_KEY) -> str:
+    """FAILURES_KEY field; partition IDs are qualified since they can repeat across streams."""
+    return message_id if stream == STREAM_KEY else f"{stream}/{message_id}"
+
+
+def record_failure(client, message_id: str, error: Exception | str, stream: str = STREAM_KEY):
+    """Remember why a message failed (works with sync, async and pipeline clients)."""
+    return client.hset(FAILURES_KEY, failure_field(message_id, stream), str(error)[:500])
+
+
+def dead_letter(
+    client, group: str, pending: Iterable[tuple[str, int]], stream: str = STREAM_KEY
+) -> int:
+    """
+    Move (message_id, times_delivered) pairs from `stream` to the DLQ and ack
+    them in `group`. Entries already trimmed from the stream are just acked.
+    Returns the number of messages written to the DLQ.
+    """
+    pending = list(pending)
+    if not pending:
+        return 0
+    ids = [message_id for message_id, _ in pending]
+    fields = [failure_field(message_id, stream) for message_id in ids]
+
+    reads = client.pipeline(transaction=False)
+    for message_id in ids:
+        reads.xrange(stream, message_id, message_id)
+    reads.hmget(FAILURES_KEY, fields)
+    *ranges, errors = reads.execute()
+
+    moved = 0
+    writes = client.pipeline(transaction=False)
+    for (message_id, deliveries), found, error in zip(pending, ranges, errors):
+        if found:
+            _id, entry = found[0]
+            writes.xadd(DLQ_KEY, {
+                **codec.entry_fields(entry),
+                "original_id": message_id,
+                "stream": stream,
+                "deliveries": deliveries,
+                "error": error or "",
+                "failed_at": int(time.time()),
+            })
+            moved += 1
+        writes.xack(stream, group, message_id)
+    writes.hdel(FAILURES_KEY, *fields)
+    writes.execute()
+
+    logger.warning(f"Dead-lettered {moved} message(s) to '{DLQ_KEY}'")
+    return moved
+
+
+def replay(client, count: int | None = None, batch: int = 500) -> int:
+    """
+    Re-queue DLQ entries (oldest first) onto the main stream (or their entity's
+    partition) and remove them from the DLQ. Replays everything when count is None.
+    """
+    replayed = 0
+    while count is None or replayed < count:
+        size = batch if count is None else min(batch, count - replayed)
+        entries = client.xrange(DLQ_KEY, "-", "+", count=size)
+        if not entries:
+            break
+
+        pipe = client.pipeline(transaction=False)
+        for _dlq_id, fields in entries:
+            try:
+                stream = queue_service.stream_for(codec.decode_entry(fields))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                stream = queue_service.stream_for({})
+            pipe.xadd(stream, codec.entry_fields(fields))
+        pipe.xdel(DLQ_KEY, *[dlq_id for dlq_id, _ in entries])
+        pipe.execute()
+        replayed += len(entries)
+
+    return replayed
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=f"Inspect and replay the '{DLQ_KEY}' stream")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="show DLQ size")
+    p_list = sub.add_parser("list", help="show the oldest DLQ entries")
+    p_list.add_argument("--count", type=int, default=20)
+    p_replay = sub.add_parser("replay", help="move DLQ entries back onto the main stream")
+    p_replay.add_argument("--count", type=int, default=None, help="max entries (default: all)")
+    p_replay.add_argument("--batch", type=int, default=500, help="entries per pipelined round-trip")
+    sub.add_parser("purge", help="delete the DLQ")
+    args = parser.parse_args(argv)
+
+    r = queue_service.redis
+    if args.command == "stats":
+        print(f"{DLQ_KEY}: {r.xlen(DLQ_KEY)} entries")
+    elif args.command == "list":
+        for dlq_id, fields in r.xrange(DLQ_KEY, "-", "+", count=args.count):
+            print(
+                f"{dlq_id}  original={fields.get('stream', STREAM_KEY)}/{fields.get('original_id')}  "
+                f"deliveries={fields.get('deliveries')}  error={fields.get('error')!r}"
+            )
+    elif args.command == "replay":
+        print(f"Replayed {replay(r, args.count, args.batch)} entries onto '{STREAM_KEY}'")
+    elif args.command == "purge":
+        r.delete(DLQ_KEY)
+        print(f"Deleted {DLQ_KEY}")
+
+
+if __name__ == "__main__":
+    main()
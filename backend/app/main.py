@@ -1,12 +1,28 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from app.core import metrics
+from app.core.compression import RequestDecompressionMiddleware
 from app.core.config import settings
 from app.api.v1.endpoints import ingest, dashboard, auth, feed
+from app.services.blocklist import blocklist
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.BLOCKLIST_LOCAL:
+        blocklist.start()
+    yield
+    await blocklist.stop()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS — exact origins from settings + regex for Vercel preview URLs
@@ -19,6 +35,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / zstd request bodies from log shippers
+app.add_middleware(RequestDecompressionMiddleware, path_prefix=f"{settings.API_V1_STR}/ingest")
+
 
 @app.get("/")
 def read_root():
@@ -53,6 +72,23 @@ def health_check():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus scrape endpoint: API metrics merged with every live worker's snapshot."""
+    from app.services.queue import queue_service
+
+    snapshots = []
+    try:
+        metrics.update_stream_gauges(queue_service.redis, queue_service.streams)
+        snapshots = metrics.live_snapshots(queue_service.redis)
+    except Exception:
+        pass  # still expose the API's own metrics when Redis is down
+
+    return PlainTextResponse(
+        metrics.fleet_registry(snapshots).render(), media_type=metrics.CONTENT_TYPE
+    )
+
+
 # Auth (public — issues JWT tokens)
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 
@@ -0,0 +1,124 @@
+"""
+The event the worker pipeline passes from stage to stage.
+
+An Event wraps the decoded stream document and resolves the keys every
+stage asks for once, at decode time: the entity IP and user (top level,
+else metadata), event_type, source, message, the timestamp as epoch
+seconds and the hour as written in it. Stage outputs (alerts, severity, anomaly score, response decision,
+enrichment, log template) go into fixed slots instead of growing the document dict.
+
+to_dict() merges the outputs back into the document; call it only at the
+storage and live-feed boundaries.
+"""
+from datetime import datetime, timezone
+from typing import Any
+
+# Fields written by the pipeline stages; kept out of `doc` until to_dict()
+OUTPUTS = (
+    "alerts",
+    "incidents",
+    "severity",
+    "anomaly_score",
+    "anomaly_explanation",
+    "ml_anomaly",
+    "response_action",
+    "geo",
+    "threat_intel",
+    "ua_details",
+    "template_id",
+    "template_params",
+    "template_rarity",
+)
+
+
+def epoch_of(timestamp: Any) -> float | None:
+    """ISO 8601 -> unix seconds; naive timestamps are UTC (what ingest writes)."""
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        ts = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def hour_of(timestamp: Any) -> int | None:
+    """The hour as written in an ISO 8601 `...THH:...` timestamp (its own offset, not UTC)."""
+    if not isinstance(timestamp, str) or "T" not in timestamp:
+        return None
+    try:
+        return int(timestamp.split("T")[1].split(":")[0])
+    except ValueError:
+        return None
+
+
+class Event:
+    __slots__ = ("doc", "ip", "user", "event_type", "source", "message", "epoch", "hour", *OUTPUTS)
+
+    def __init__(self, doc: dict):
+        self.doc = doc
+        # Outputs carried by the document (e.g. a replayed event) continue from their values
+        self.alerts = doc.pop("alerts", None)
+        self.incidents = doc.pop("incidents", None)
+        self.severity = doc.pop("severity", None)
+        self.anomaly_score = doc.pop("anomaly_score", None)
+        self.anomaly_explanation = doc.pop("anomaly_explanation", None)
+        self.ml_anomaly = doc.pop("ml_anomaly", None)
+        self.response_action = doc.pop("response_action", None)
+        self.geo = doc.pop("geo", None)
+        self.threat_intel = doc.pop("threat_intel", None)
+        self.ua_details = doc.pop("ua_details", None)
+        self.template_id = doc.pop("template_id", None)
+        self.template_params = doc.pop("template_params", None)
+        self.template_rarity = doc.pop("template_rarity", None)
+        self.message = doc.get("message") or ""
+        self.epoch = epoch_of(doc.get("timestamp"))
+        self.hour = hour_of(doc.get("timestamp"))
+        self._resolve()
+
+    def _resolve(self):
+        doc = self.doc
+        metadata = doc.get("metadata")
+        if not isinstance(metadata, dict):
+            metadata = {}
+        self.ip = doc.get("ip") or metadata.get("ip")
+        self.user = doc.get("user") or metadata.get("user")
+        self.event_type = doc.get("event_type")
+        self.source = doc.get("source")
+
+    @property
+    def entity(self) -> str | None:
+        """The key per-entity detection state is tracked under: IP, else user."""
+        return self.ip or self.user
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """A document field that has no slot of its own (e.g. user_agent)."""
+        return self.doc.get(key, default)
+
+    def update(self, extracted: dict):
+        """Merge normalization output into the document and re-resolve the keys."""
+        self.doc.update(extracted)
+        self._resolve()
+
+    def add_alert(self, alert: str):
+        if self.alerts is None:
+            self.alerts = []
+        self.alerts.append(alert)
+
+    def add_incident(self, incident: str):
+        if self.incidents is None:
+            self.incidents = []
+        self.incidents.append(incident)
+
+    def to_dict(self) -> dict:
+        """The document with the stage outputs merged in (the event's own dict, not a copy)."""
+        doc = self.doc
+        for name in OUTPUTS:
+            value = getattr(self, name)
+            if value is not None:
+                doc[name] = value
+        if self.anomaly_score is not None:
+            doc["anomaly_explanation"] = self.anomaly_explanation
+        return doc
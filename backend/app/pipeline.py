@@ -0,0 +1,344 @@
+"""
+Offline pipeline runner: streams an NDJSON file through the same
+normalization → enrichment → rules → ML → correlation → response stages as
+the worker, without Redis or Elasticsearch.
+
+    python -m app.pipeline run --input logs.ndjson.gz --output enriched.ndjson.gz \\
+        --alerts alerts.ndjson --workers 8
+
+Each input line is a LogEntry-shaped JSON object. Detection state is kept
+in memory and its TTLs follow event time (the `timestamp` field), so a
+backfill raises the same alerts as the live worker would have. Response
+decisions are recorded on the event but nothing is blocked.
+
+Parallelism: a process pool decodes and normalizes chunks of lines; the
+normalized events are then routed by entity (IP, else user) to one of
+--workers stateful processes, so every event of an entity is handled by the
+same process in file order. Output keeps input order, and because all
+detection state is keyed by the entity, results do not depend on --workers.
+Messages no parser recognises are given log templates (and so the ML
+template-rarity feature) by one in-memory miner in the runner process, in
+input order, so template IDs and counts do not depend on --workers either.
+"""
+import argparse
+import gzip
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import zlib
+from collections import deque
+
+from app import worker as sync_worker
+from app.models.event import Event
+from app.services.normalization import normalization_service
+from app.services.enrichment import enrichment_service
+from app.services.detection_rules import rule_detector
+from app.services.detection_ml import ml_detector
+from app.services.correlation import correlation_service
+from app.services.response import response_service
+from app.services.state_cache import state_cache
+from app.services.templates import TemplateMiner
+from app.core import codec
+from app.core.config import settings
+
+logger = logging.getLogger("aegis.pipeline")
+
+# How often the runner checks its detection processes are alive while waiting on them
+DETECTOR_POLL_SECONDS = 1.0
+
+
+def open_text(path: str, mode: str):
+    """Open a (possibly gzipped) text file; '-' is stdin/stdout."""
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_chunks(path: str, size: int):
+    chunk = []
+    with open_text(path, "r") as f:
+        for line in f:
+            if line.strip():
+                chunk.append(line)
+                if len(chunk) >= size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# Stage 1: decode + normalize (stateless, any process)
+# ---------------------------------------------------------------------------
+
+def _is_log_entry(doc) -> bool:
+    """An object whose message (and source, if given) are strings, as LogEntry requires."""
+    return (
+        isinstance(doc, dict)
+        and isinstance(doc.get("message", ""), str)
+        and isinstance(doc.get("source") or "", str)
+    )
+
+
+def normalize_chunk(lines: list[str]) -> tuple[list[Event | None], list[int]]:
+    """
+    (events, positions of the events no parser recognised). Lines that are
+    not LogEntry-shaped JSON come back as None and are counted as errors.
+    """
+    events = []
+    for line in lines:
+        try:
+            doc = codec.loads(line)
+        except ValueError:
+            events.append(None)
+            continue
+        if not _is_log_entry(doc):
+            events.append(None)
+            continue
+        events.append(Event(doc))
+    decoded = [e for e in events if e is not None]
+    parsed = normalization_service.parse_many(
+        [e.message for e in decoded], [e.source or "" for e in decoded]
+    )
+    unparsed = []
+    rows = iter(parsed.rows())
+    for seq, log_entry in enumerate(events):
+        if log_entry is None:
+            continue
+        extracted = next(rows)
+        if extracted:
+            log_entry.update(extracted)
+        else:
+            unparsed.append(seq)
+    return events, unparsed
+
+
+# ---------------------------------------------------------------------------
+# Stage 2: stateful detection (one process per entity partition)
+# ---------------------------------------------------------------------------
+
+class EventClock:
+    """
+    State TTL clock set to the current event's own timestamp, so an entity's
+    windows depend only on its own events (not on what else shares the
+    process). Events without a parseable timestamp reuse the previous time.
+    """
+
+    def __init__(self):
+        self.now_ms = 0
+
+    def advance(self, log_entry: Event):
+        if log_entry.epoch is not None:
+            self.now_ms = int(log_entry.epoch * 1000)
+
+    def __call__(self) -> int:
+        return self.now_ms
+
+
+def detect_events(log_entries: list[Event], clock: EventClock) -> list[Event]:
+    """Enrichment → rules → ML → correlation → response decision, in order."""
+    for log_entry in log_entries:
+        clock.advance(log_entry)
+        enrichment_service.enrich_log(log_entry)
+        sync_worker._apply_rules(log_entry, *rule_detector.check_rules(log_entry))
+
+    # Scoring is stateless, so the whole run is scored in one model call
+    for log_entry, anomaly_result in zip(log_entries, ml_detector.predict_batch(log_entries)):
+        sync_worker._apply_anomaly(log_entry, anomaly_result)
+
+    for log_entry in log_entries:
+        clock.advance(log_entry)
+        correlation_service.process_event(log_entry)
+        _ip, decision = response_service._decide(log_entry)
+        if decision:
+            log_entry.response_action = decision
+    return log_entries
+
+
+def _detection_process(inbox, outbox):
+    clock = EventClock()
+    state_cache.use_memory(clock)
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        chunk_id, part, seqs, log_entries = job
+        detect_events(log_entries, clock)
+        lines = [codec.dumps(e.to_dict()) for e in log_entries]
+        alerts = [bool(e.alerts) for e in log_entries]
+        outbox.put((chunk_id, part, seqs, lines, alerts))
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.events = self.errors = self.alerts = 0
+        self.started = time.perf_counter()
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        eps = self.events / elapsed if elapsed else 0.0
+        return (
+            f"{self.events} events ({self.errors} invalid lines), {self.alerts} with alerts "
+            f"in {elapsed:.1f}s — {eps:,.0f} events/s ({eps * 60:,.0f}/min)"
+        )
+
+
+def _partition(log_entry: Event, seq: int, partitions: int) -> int:
+    entity = log_entry.entity
+    if not entity:
+        return seq % partitions  # stateless events: spread deterministically
+    return zlib.crc32(str(entity).encode()) % partitions
+
+
+def run(
+    input_path: str,
+    output_path: str = "-",
+    alerts_path: str | None = None,
+    workers: int = 1,
+    chunk_size: int = 1000,
+) -> Stats:
+    stats = Stats()
+    ctx = multiprocessing.get_context("fork")
+    out = open_text(output_path, "w")
+    alerts_out = open_text(alerts_path, "w") if alerts_path else None
+
+    inboxes = [ctx.Queue() for _ in range(workers)]
+    outbox = ctx.Queue()
+    detectors = [ctx.Process(target=_detection_process, args=(q, outbox)) for q in inboxes]
+    for proc in detectors:
+        proc.start()
+    normalizer = ctx.Pool(workers)
+    # Never loaded or flushed: templates start empty and stay in this process
+    miner = TemplateMiner()
+
+    max_inflight = workers * 4  # chunks in the pool or in detection at once
+    normalizing = deque()  # AsyncResults, in input order
+    # chunk_id -> [parts still out, lines by position]; written in chunk order
+    assembling: dict[int, list] = {}
+    next_chunk = next_write = 0
+
+    def write_ready():
+        nonlocal next_write
+        while next_write in assembling and assembling[next_write][0] == 0:
+            for item in assembling.pop(next_write)[1]:
+                if item is None:
+                    continue
+                line, has_alert = item
+                out.write(line + "\n")
+                if has_alert:
+                    stats.alerts += 1
+                    if alerts_out:
+                        alerts_out.write(line + "\n")
+            next_write += 1
+
+    def next_result():
+        # A detection process that died (exception, OOM kill) never answers: fail instead of waiting
+        while True:
+            try:
+                return outbox.get(timeout=DETECTOR_POLL_SECONDS)
+            except queue.Empty:
+                for part, proc in enumerate(detectors):
+                    if not proc.is_alive():
+                        raise RuntimeError(f"Detection process for partition {part} exited with code {proc.exitcode}")
+
+    def collect(block: bool):
+        while assembling and (block or not outbox.empty()):
+            chunk_id, _part, seqs, lines, alerts = next_result()
+            state = assembling[chunk_id]
+            state[0] -= 1
+            for seq, line, has_alert in zip(seqs, lines, alerts):
+                state[1][seq] = (line, has_alert)
+            block = False
+            write_ready()
+
+    def dispatch(normalized: tuple[list[Event | None], list[int]]):
+        nonlocal next_chunk
+        events, unparsed = normalized
+        for seq in unparsed:
+            miner.process_event(events[seq])
+        parts: dict[int, tuple[list, list]] = {}
+        for seq, log_entry in enumerate(events):
+            if log_entry is None:
+                stats.errors += 1
+                continue
+            seqs, entries = parts.setdefault(_partition(log_entry, seq, workers), ([], []))
+            seqs.append(seq)
+            entries.append(log_entry)
+        stats.events += len(events) - sum(e is None for e in events)
+        assembling[next_chunk] = [len(parts), [None] * len(events)]
+        for part, (seqs, entries) in parts.items():
+            inboxes[part].put((next_chunk, part, seqs, entries))
+        next_chunk += 1
+        write_ready()  # a chunk of only invalid lines has no parts to wait for
+
+    try:
+        for chunk in read_chunks(input_path, chunk_size):
+            normalizing.append(normalizer.apply_async(normalize_chunk, (chunk,)))
+            while len(normalizing) >= max_inflight // 2:
+                dispatch(normalizing.popleft().get())
+            while len(assembling) >= max_inflight // 2:
+                collect(block=True)
+            collect(block=False)
+        while normalizing:
+            dispatch(normalizing.popleft().get())
+        while assembling:
+            collect(block=True)
+    except BaseException:
+        # Live detectors may be blocked on a queue a dead one left behind; stop them rather than join
+        for proc in detectors:
+            proc.terminate()
+        for q in inboxes:
+            q.cancel_join_thread()  # chunks nobody will read must not hold up exit
+        normalizer.terminate()
+        raise
+    finally:
+        for q in inboxes:
+            q.put(None)
+        for proc in detectors:
+            proc.join()
+        normalizer.close()
+        normalizer.join()
+        if out is not sys.stdout:
+            out.close()
+        if alerts_out:
+            alerts_out.close()
+    return stats
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Run the detection pipeline over an NDJSON file")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="process a file (.ndjson / .jsonl, optionally .gz)")
+    p_run.add_argument("--input", required=True, help="input path, or - for stdin")
+    p_run.add_argument("--output", default="-", help="enriched events (default: stdout)")
+    p_run.add_argument("--alerts", default=None, help="also write events with alerts here")
+    p_run.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="detection processes (default: CPU count)"
+    )
+    p_run.add_argument("--chunk-size", type=int, default=1000, help="lines per unit of work")
+    p_run.add_argument(
+        "--remote-enrichment",
+        action="store_true",
+        help="call ipinfo / AbuseIPDB for every IP (slow; off by default)",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.remote_enrichment:
+        settings.IPINFO_TOKEN = ""
+        settings.ABUSEIPDB_API_KEY = ""
+
+    stats = run(args.input, args.output, args.alerts, max(1, args.workers), args.chunk_size)
+    print(stats.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Long-lived ingest credentials for log shippers ("agent keys").
+
+A key looks like `aegis_<key_id>.<secret>` and is shown once, when it is
+created. Redis only stores a SHA-256 of the secret, in the `auth:agent_keys`
+hash under key_id. The secret is 256 random bits, so a fast hash is enough
+(no bcrypt cost per request). Records are cached per process for
+AGENT_KEY_CACHE_SECONDS, which is also how long a revoked key may still be
+accepted by an API process that recently saw it.
+
+Verifying a key is one SHA-256 and a constant-time compare against the
+cached record; Redis is only asked on a cache miss.
+"""
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.services.queue import queue_service
+
+KEYS_HASH = "auth:agent_keys"
+PREFIX = "aegis_"
+
+
+def _digest(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def parse_key(api_key: str) -> tuple[str, str] | None:
+    """'aegis_<key_id>.<secret>' -> (key_id, secret)"""
+    if not api_key.startswith(PREFIX):
+        return None
+    key_id, sep, secret = api_key[len(PREFIX):].partition(".")
+    if not sep or not key_id or not secret:
+        return None
+    return key_id, secret
+
+
+class AgentKeyStore:
+    def __init__(self, client=None):
+        self.redis = client or queue_service.aredis
+        # key_id -> (record or None for unknown ids, fetched_at); unknown ids are
+        # cached too so a flood of bogus keys does not reach Redis
+        self._records: dict[str, tuple[dict | None, float]] = {}
+
+    async def create(self, agent: str) -> dict:
+        key_id = secrets.token_hex(8)
+        secret = secrets.token_urlsafe(32)
+        record = {
+            "agent": agent,
+            "hash": _digest(secret),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self.redis.hset(KEYS_HASH, key_id, json.dumps(record))
+        return {"key_id": key_id, "agent": agent, "api_key": f"{PREFIX}{key_id}.{secret}"}
+
+    async def revoke(self, key_id: str) -> bool:
+        self._records.pop(key_id, None)
+        return bool(await self.redis.hdel(KEYS_HASH, key_id))
+
+    async def list(self) -> list[dict]:
+        stored = await self.redis.hgetall(KEYS_HASH)
+        keys = []
+        for key_id, raw in sorted(stored.items()):
+            record = json.loads(raw)
+            keys.append({"key_id": key_id, "agent": record["agent"], "created_at": record.get("created_at")})
+        return keys
+
+    async def _record(self, key_id: str) -> dict | None:
+        cached = self._records.get(key_id)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < settings.AGENT_KEY_CACHE_SECONDS:
+            return cached[0]
+        raw = await self.redis.hget(KEYS_HASH, key_id)
+        record = json.loads(raw) if raw else None
+        if len(self._records) >= settings.AUTH_CACHE_MAX_ENTRIES:
+            self._records.clear()
+        self._records[key_id] = (record, now)
+        return record
+
+    async def verify(self, api_key: str) -> str | None:
+        """The agent name for a valid key, else None."""
+        parsed = parse_key(api_key)
+        if parsed is None:
+            return None
+        key_id, secret = parsed
+        record = await self._record(key_id)
+        if record is None:
+            return None
+        if not hmac.compare_digest(_digest(secret), record["hash"]):
+            return None
+        return record["agent"]
+
+
+agent_keys = AgentKeyStore()
@@ -0,0 +1,102 @@
+"""
+Ingest backpressure signal.
+
+Workers raise it when Elasticsearch writes slow down or the consumer group
+falls too far behind; while it is set the ingest API answers 503 with a
+Retry-After header instead of letting logs_stream grow without bound.
+
+The signal is a Redis key with a short TTL that every struggling worker keeps
+refreshing, so it clears by itself once no worker reports pressure (or if
+all workers die).
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+import redis
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services.queue import queue_service
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_KEY = "ingest:backpressure"
+SIGNAL_TTL = 5  # seconds
+
+
+def raise_signal(client, reason: str):
+    """Set (or refresh) the signal; it expires SIGNAL_TTL seconds after the last call."""
+    client.set(BACKPRESSURE_KEY, reason, ex=SIGNAL_TTL)
+    logger.warning(f"Backpressure: {reason}")
+
+
+class BackpressureMonitor:
+    """Worker side: tracks ES write latency and decides when to raise the signal."""
+
+    def __init__(self, client, alpha: float = 0.2):
+        self.redis = client
+        self.alpha = alpha
+        self.index_latency: float | None = None  # EWMA, seconds per ES request
+
+    def observe_index(self, seconds: float):
+        if self.index_latency is None:
+            self.index_latency = seconds
+        else:
+            self.index_latency = self.alpha * seconds + (1 - self.alpha) * self.index_latency
+
+    @contextmanager
+    def track_index(self):
+        """Time one ES write request (single doc or _bulk) into the EWMA."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_index(time.perf_counter() - start)
+
+    def evaluate(self, lag: int | None) -> str | None:
+        """Refresh the signal if the worker is under pressure; returns the reason."""
+        reason = None
+        max_ms = settings.BACKPRESSURE_MAX_INDEX_MS
+        if self.index_latency is not None and self.index_latency * 1000 > max_ms:
+            reason = f"ES write latency {self.index_latency * 1000:.0f}ms > {max_ms}ms"
+        elif lag is not None and lag > settings.BACKPRESSURE_MAX_LAG:
+            reason = f"consumer lag {lag} > {settings.BACKPRESSURE_MAX_LAG}"
+
+        if reason:
+            raise_signal(self.redis, reason)
+        return reason
+
+
+class BackpressureGuard:
+    """
+    Ingest dependency: reject requests with 503 while the signal is set.
+    The key is re-read at most once per `cache_seconds` per process.
+    """
+
+    def __init__(self, cache_seconds: float = 1.0):
+        self.redis = queue_service.aredis
+        self.cache_seconds = cache_seconds
+        self._checked_at = 0.0
+        self._reason: str | None = None
+
+    async def current(self) -> str | None:
+        now = time.monotonic()
+        if now - self._checked_at > self.cache_seconds:
+            self._checked_at = now
+            try:
+                self._reason = await self.redis.get(BACKPRESSURE_KEY)
+            except redis.exceptions.RedisError:
+                self._reason = None  # fail open: the queue push will surface Redis errors
+        return self._reason
+
+    async def __call__(self):
+        if await self.current():
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest temporarily throttled: processing pipeline is behind. Retry later.",
+                headers={"Retry-After": str(settings.BACKPRESSURE_RETRY_AFTER_SECONDS)},
+            )
+
+
+backpressure_guard = BackpressureGuard()
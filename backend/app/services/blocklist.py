@@ -0,0 +1,132 @@
+"""
+In-process copy of the blocked:{ip} keys for the API's per-request check.
+
+ResponseService.execute_block publishes every new block (IP + TTL) on the
+`blocklist:events` channel. Each API process:
+
+  * subscribes, then loads all blocked:* keys with their remaining TTLs, so
+    a block issued while loading is not missed;
+  * applies published blocks as they arrive (well under a second);
+  * expires entries locally from the TTL, on a monotonic clock, so hosts'
+    clocks need not agree;
+  * reloads the full set every BLOCKLIST_RESYNC_SECONDS to pick up keys
+    changed outside execute_block (manual DEL / SET).
+
+is_blocked() is a dict lookup. Until the subscription is live (startup, or
+after the connection dropped) `ready` is False and callers fall back to
+asking Redis, so a block is never missed because the cache is behind.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from app.core.config import settings
+from app.services.queue import queue_service
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "blocklist:events"
+KEY_PREFIX = "blocked:"
+
+
+def publish_block(client, ip: str, ttl: int):
+    """Announce a new block; `client` may be a pipeline."""
+    client.publish(CHANNEL, json.dumps({"op": "block", "ip": ip, "ttl": ttl}))
+
+
+class Blocklist:
+    def __init__(self, client=None):
+        self.redis = client or queue_service.aredis
+        self.ready = False
+        self._expires: dict[str, float] = {}  # ip -> monotonic expiry
+        self._during_load: dict[str, float] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def is_blocked(self, ip: str) -> bool:
+        expires = self._expires.get(ip)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            self._expires.pop(ip, None)
+            return False
+        return True
+
+    def add(self, ip: str, ttl_seconds: float):
+        expires = time.monotonic() + ttl_seconds
+        self._expires[ip] = expires
+        if self._during_load is not None:
+            self._during_load[ip] = expires
+
+    def _apply(self, data: str):
+        try:
+            event = json.loads(data)
+            if event["op"] == "block":
+                self.add(event["ip"], float(event["ttl"]))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed blocklist event {data!r}: {e}")
+
+    async def load(self):
+        """Replace the local set with every blocked:* key and its remaining TTL."""
+        self._during_load = {}
+        try:
+            keys = [key async for key in self.redis.scan_iter(match=f"{KEY_PREFIX}*", count=1000)]
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.pttl(key)
+            ttls = await pipe.execute() if keys else []
+            now = time.monotonic()
+            snapshot = {}
+            for key, pttl in zip(keys, ttls):
+                if pttl == -1:
+                    snapshot[key[len(KEY_PREFIX):]] = float("inf")  # no TTL: blocked until deleted
+                elif pttl > 0:
+                    snapshot[key[len(KEY_PREFIX):]] = now + pttl / 1000
+            # Events that arrived while scanning are newer than the scan
+            snapshot.update(self._during_load)
+            self._expires = snapshot
+        finally:
+            self._during_load = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                await self.load()
+                self.ready = True
+                logger.info(f"Blocklist cache live with {len(self._expires)} blocked IPs")
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Blocklist subscription lost, checking Redis directly: {e}")
+            finally:
+                self.ready = False
+                await pubsub.close()
+            await asyncio.sleep(1)
+
+    async def _resync(self):
+        while True:
+            await asyncio.sleep(settings.BLOCKLIST_RESYNC_SECONDS)
+            if self.ready:
+                try:
+                    await self.load()
+                except Exception as e:
+                    logger.error(f"Blocklist resync failed: {e}")
+
+    def start(self):
+        """Begin following the channel (call from the running event loop)."""
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._resync())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.ready = False
+
+
+blocklist = Blocklist()
@@ -1,14 +1,18 @@
 import redis
+from typing import Callable, List
 from app.core.config import settings
+from app.models.event import Event
+from app.services.state_cache import state_cache
 
 class CorrelationService:
     def __init__(self):
         self.redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.state = state_cache
         self.PHASE_1_TTL = 300 # 5 minutes to succeed after brute force
         self.PHASE_2_TTL = 300 # 5 minutes to escalate privileges after login
 
 
-    def process_event(self, log_entry: dict):
+    def process_event(self, log_entry: Event):
         """
         Correlate events to detect multi-stage attacks.
         
@@ -17,43 +21,100 @@ class CorrelationService:
         - T1078: Valid Accounts (Phase 2 - successful login after brute force)
         - T1098: Account Manipulation / T1078: Valid Accounts (Phase 3 - sudo/privilege escalation)
         """
-        ip = log_entry.get("ip") or log_entry.get("metadata", {}).get("ip")
+        ip = log_entry.ip
         if not ip:
             return []  # worker calls .extend() — must never return None
 
+        self._correlate(
+            log_entry,
+            ip,
+            is_active=lambda phase: self.state.flag_active(f"risk:phase:{phase}:{ip}"),
+            activate=lambda phase, ttl: self.state.set_flag(f"risk:phase:{phase}:{ip}", ttl),
+        )
+
+    def process_batch(self, log_entries: List[Event]):
+        """
+        Batch variant of process_event. Phase flags for every IP in the batch are
+        fetched in one pipelined EXISTS round-trip, tracked locally while the batch
+        is walked in order, and new flags are written back in one SETEX pipeline.
+        With local state, misses are prefetched and the events run one by one.
+        """
+        ips = [e.ip for e in log_entries]
+        keys = sorted({f"risk:phase:{phase}:{ip}" for ip in ips if ip for phase in (1, 2)})
+        if not keys:
+            return
+
+        if self.state.local:
+            self.state.prefetch(flags=keys)
+            for log_entry in log_entries:
+                self.process_event(log_entry)
+            return
+
+        reads = self.redis.pipeline(transaction=False)
+        for key in keys:
+            reads.exists(key)
+        active = {key for key, hit in zip(keys, reads.execute()) if hit}
+
+        writes = self.redis.pipeline(transaction=False)
+
+        for log_entry, ip in zip(log_entries, ips):
+            if not ip:
+                continue
+
+            def activate(phase, ttl, ip=ip):
+                key = f"risk:phase:{phase}:{ip}"
+                active.add(key)
+                writes.setex(key, ttl, "active")
+
+            self._correlate(
+                log_entry,
+                ip,
+                is_active=lambda phase, ip=ip: f"risk:phase:{phase}:{ip}" in active,
+                activate=activate,
+            )
+
+        if len(writes):
+            writes.execute()
+
+    def _correlate(
+        self,
+        log_entry: Event,
+        ip: str,
+        is_active: Callable[[int], bool],
+        activate: Callable[[int, int], None],
+    ):
+        """Walk the attack-chain state machine using the given phase-state accessors."""
         # 1. State: Brute Force Attempt (Phase 1)
         # This is set by the RuleBasedDetector (T1110)
         # We check if this IP is already flagged as a risk.
-        if log_entry.get('alerts'):
-            for alert in log_entry['alerts']:
+        if log_entry.alerts:
+            for alert in log_entry.alerts:
                 if "SSH Brute Force" in alert:
                     # Set short-term state: "Risk Level 1"
-                    self.redis.setex(f"risk:phase:1:{ip}", 300, "active") # TTL 5 mins
+                    activate(1, self.PHASE_1_TTL)
 
         # 2. State: Successful Login after Brute Force (Phase 2)
         # Technique: T1078 - Valid Accounts
-        if log_entry.get('event_type') == 'ssh_login_success':
-            if self.redis.exists(f"risk:phase:1:{ip}"):
+        if log_entry.event_type == 'ssh_login_success':
+            if is_active(1):
                 # Escalating risk to Phase 2
-                self.redis.setex(f"risk:phase:2:{ip}", 300, "active")
+                activate(2, self.PHASE_2_TTL)
                 
                 # Create Incident
                 incident_msg = f"Suspicious Login after Brute Force from {ip}"
-                log_entry['incidents'] = log_entry.get('incidents', [])
-                log_entry['incidents'].append(incident_msg)
-                log_entry['severity'] = 'CRITICAL'
-                log_entry['alerts'].append(incident_msg)
+                log_entry.add_incident(incident_msg)
+                log_entry.severity = 'CRITICAL'
+                log_entry.add_alert(incident_msg)
 
         # 3. State: Privilege Escalation (Phase 3)
         # Technique: T1548.003 - Sudo Caching / Sudo Usage
-        msg = log_entry.get("message", "").lower()
+        msg = log_entry.message.lower()
         if "sudo" in msg and "command not found" not in msg:
-            if self.redis.exists(f"risk:phase:2:{ip}"):
+            if is_active(2):
                  # Highest Risk: Attacker Brute Forced -> Logged In -> Is now Root
                 incident_msg = f"CRITICAL: Privilege Escalation after Brute Force from {ip}"
-                log_entry['incidents'] = log_entry.get('incidents', [])
-                log_entry['incidents'].append(incident_msg)
-                log_entry['severity'] = 'CRITICAL'
-                log_entry['alerts'].append(incident_msg)
+                log_entry.add_incident(incident_msg)
+                log_entry.severity = 'CRITICAL'
+                log_entry.add_alert(incident_msg)
 
 correlation_service = CorrelationService()
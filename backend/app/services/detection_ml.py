@@ -4,24 +4,30 @@ import os
 import redis
 import logging
 from app.core.config import settings
-from typing import Dict, Any
+from app.models.event import Event
+from app.services.state_cache import state_cache
+from typing import Dict, Any, List
 from sklearn.pipeline import Pipeline
 
 logger = logging.getLogger(__name__)
 
 MODEL_PATH = "model.joblib"
+# Feature order the model is trained on; models trained before template mining use the first four
+FEATURE_NAMES = ["Time of Day", "Message Size", "Protocol (SSH)", "Request Frequency", "Log Template Rarity"]
 
 
 class MLDetector:
     def __init__(self):
         self.redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
         self.model: Pipeline | None = None
+        self.n_features = 4
         self.load_model()
 
     def load_model(self):
         if os.path.exists(MODEL_PATH):
             try:
                 self.model = joblib.load(MODEL_PATH)
+                self.n_features = getattr(self.model, "n_features_in_", 4)
                 logger.info("ML pipeline (scaler + IsolationForest) loaded successfully.")
             except Exception as e:
                 logger.error(f"Failed to load ML model: {e}")
@@ -33,55 +39,89 @@ class MLDetector:
         """Get approximate request rate for IP from Redis."""
         if not ip:
             return 0
-        val = self.redis.get(f"rate_limit:{ip}")
-        return int(val) if val else 0
+        return state_cache.shared_int(f"rate_limit:{ip}")
 
-    def predict(self, log_entry: dict) -> Dict[str, Any]:
+    def _features(self, log_entry: Event, login_rate: int) -> list:
+        """
+        [hour, msg_len, is_ssh, login_rate(, template_rarity)] — same order the
+        model was trained on. Rarity is 0 for events a parser recognised.
+        """
+        msg_len = len(log_entry.message)
+
+        # Hour as written in the timestamp (what the model was trained on); 12 without one
+        hour = 12 if log_entry.hour is None else log_entry.hour
+
+        is_ssh = 1 if "ssh" in str(log_entry.source or "").lower() else 0
+
+        features = [hour, msg_len, is_ssh, login_rate]
+        if self.n_features > 4:
+            features.append(log_entry.template_rarity or 0.0)
+        return features
+
+    def _score(self, raw_score: float, raw_features: np.ndarray) -> Dict[str, Any]:
+        # Normalise to 0..1 (anomaly probability proxy)
+        if raw_score < 0:
+            anomaly_score = min(0.5 + abs(raw_score) * 2, 1.0)
+        else:
+            anomaly_score = max(0.5 - raw_score * 2, 0.0)
+
+        explanation = None
+        if anomaly_score > 0.6:
+            explanation = self._explain_anomaly(raw_features)
+
+        return {
+            "score": round(anomaly_score, 2),
+            "explanation": explanation,
+        }
+
+    def predict(self, log_entry: Event) -> Dict[str, Any]:
         """Returns {score: float, explanation: str | None}"""
         if not self.model:
             return {"score": 0.0, "explanation": "Model not loaded"}
 
         try:
-            # Feature extraction
-            msg_len = len(log_entry.get("message", ""))
-
-            timestamp = log_entry.get("timestamp", "")
-            hour = 12
-            if "T" in timestamp:
-                try:
-                    hour = int(timestamp.split("T")[1].split(":")[0])
-                except Exception:
-                    pass
-
-            is_ssh = 1 if "ssh" in log_entry.get("source", "").lower() else 0
-
-            ip = log_entry.get("ip") or log_entry.get("metadata", {}).get("ip")
-            login_rate = self.get_login_rate(ip)
+            login_rate = self.get_login_rate(log_entry.ip)
 
-            features = np.array([[hour, msg_len, is_ssh, login_rate]])
+            features = np.array([self._features(log_entry, login_rate)])
 
             # Pipeline contains scaler → IsolationForest.
             # decision_function: positive = normal, negative = anomaly.
             raw_score = self.model.decision_function(features)[0]
+            return self._score(raw_score, features[0])
 
-            # Normalise to 0..1 (anomaly probability proxy)
-            if raw_score < 0:
-                anomaly_score = min(0.5 + abs(raw_score) * 2, 1.0)
-            else:
-                anomaly_score = max(0.5 - raw_score * 2, 0.0)
+        except Exception as e:
+            logger.error(f"ML prediction error: {e}")
+            return {"score": 0.0, "explanation": "Error"}
+
+    def predict_batch(self, log_entries: List[Event]) -> List[Dict[str, Any]]:
+        """
+        Batch variant of predict: login rates come from a single MGET and the
+        model scores the whole feature matrix in one decision_function call.
+        """
+        if not self.model:
+            return [{"score": 0.0, "explanation": "Model not loaded"} for _ in log_entries]
+        if not log_entries:
+            return []
 
-            explanation = None
-            if anomaly_score > 0.6:
-                explanation = self._explain_anomaly(features[0])
+        try:
+            ips = [e.ip for e in log_entries]
+            keys = sorted({f"rate_limit:{ip}" for ip in ips if ip})
+            if state_cache.local:
+                state_cache.prefetch(shared=keys)
+                rates = {key: state_cache.shared_int(key) for key in keys}
+            else:
+                rates = dict(zip(keys, self.redis.mget(keys))) if keys else {}
 
-            return {
-                "score": round(anomaly_score, 2),
-                "explanation": explanation,
-            }
+            features = np.array([
+                self._features(e, int(rates.get(f"rate_limit:{ip}") or 0) if ip else 0)
+                for e, ip in zip(log_entries, ips)
+            ])
+            raw_scores = self.model.decision_function(features)
+            return [self._score(raw, feats) for raw, feats in zip(raw_scores, features)]
 
         except Exception as e:
-            logger.error(f"ML prediction error: {e}")
-            return {"score": 0.0, "explanation": "Error"}
+            logger.error(f"ML batch prediction error: {e}")
+            return [{"score": 0.0, "explanation": "Error"} for _ in log_entries]
 
     def _explain_anomaly(self, raw_features: np.ndarray) -> str:
         """
@@ -92,11 +132,10 @@ class MLDetector:
             scaler = self.model.named_steps["scaler"]
             z_scores = np.abs((raw_features - scaler.mean_) / (scaler.scale_ + 1e-9))
         except Exception:
-            z_scores = np.zeros(4)
+            z_scores = np.zeros(len(raw_features))
 
-        names = ["Time of Day", "Message Size", "Protocol (SSH)", "Request Frequency"]
         top_idx = int(np.argmax(z_scores))
-        return f"Anomalous {names[top_idx]} detected (z={z_scores[top_idx]:.1f})"
+        return f"Anomalous {FEATURE_NAMES[top_idx]} detected (z={z_scores[top_idx]:.1f})"
 
 
 ml_detector = MLDetector()
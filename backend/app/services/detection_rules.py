@@ -2,16 +2,22 @@ import redis
 import yaml
 import os
 import logging
-from typing import List
+from typing import List, Optional
 from app.core.config import settings
+from app.models.event import Event
+from app.services.state_cache import state_cache
 
 logger = logging.getLogger(__name__)
 
 CONFIG_PATH = "app/rules/detection_config.yaml"
 
+# Severity Map for comparison
+SEV_MAP = {"CRITICAL": 50, "HIGH": 40, "MEDIUM": 30, "LOW": 20, "INFO": 10}
+
 class RuleBasedDetector:
     def __init__(self):
         self.redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.state = state_cache
         self.config = self.load_config()
         
     def load_config(self):
@@ -26,58 +32,139 @@ class RuleBasedDetector:
             logger.error(f"Failed to load detection config: {e}")
             return {}
 
-    def check_rules(self, log_entry: dict) -> tuple[List[str], str]:
+    # ---- Stateful rule predicates (decide which Redis state an event needs) ----
+
+    def _is_brute_candidate(self, log_entry: Event, ip: Optional[str]) -> bool:
+        rule_cfg = self.config.get("ssh_brute_force", {})
+        return bool(rule_cfg.get("enabled") and ip and log_entry.event_type == 'ssh_login_failed')
+
+    def _is_admin_candidate(self, user: Optional[str], ip: Optional[str]) -> bool:
+        rule_cfg = self.config.get("suspicious_admin", {})
+        if not (rule_cfg.get("enabled") and user and ip):
+            return False
+        return user in rule_cfg.get("admin_users", ["root", "admin", "ubuntu"])
+
+    def check_rules(self, log_entry: Event) -> tuple[List[str], str]:
         """
         Check log against rules. Returns (alerts_list, max_severity).
         """
+        ip = log_entry.ip
+        user = log_entry.user
+
+        brute_count = None
+        if self._is_brute_candidate(log_entry, ip):
+            brute_count = self.state.window_incr(
+                f"risk:brute:{ip}", self.config["ssh_brute_force"].get("window_seconds", 60)
+            )
+
+        admin_known = None
+        if self._is_admin_candidate(user, ip):
+            known_key = f"state:admin_ips:{user}"
+            admin_known = self.state.is_member(known_key, ip)
+            if not admin_known:
+                self.state.add_member(known_key, ip)
+
+        return self._evaluate(log_entry, ip, user, brute_count, admin_known)
+
+    def check_rules_batch(self, log_entries: List[Event]) -> List[tuple[List[str], str]]:
+        """
+        Batch variant of check_rules. All Redis state for the batch is read in one
+        pipelined round-trip and written back in a second one. INCRs are queued in
+        event order, so brute-force counts match what per-event processing sees.
+        With local state, misses are prefetched in one round-trip instead.
+        """
+        if self.state.local:
+            return self._check_rules_local(log_entries)
+
+        plan = []
+        reads = self.redis.pipeline(transaction=False)
+        for log_entry in log_entries:
+            ip = log_entry.ip
+            user = log_entry.user
+            brute = self._is_brute_candidate(log_entry, ip)
+            admin = self._is_admin_candidate(user, ip)
+            if brute:
+                reads.incr(f"risk:brute:{ip}")
+            if admin:
+                reads.sismember(f"state:admin_ips:{user}", ip)
+            plan.append((ip, user, brute, admin))
+
+        replies = iter(reads.execute() if len(reads) else [])
+        writes = self.redis.pipeline(transaction=False)
+        learned = set()  # admin IPs first seen earlier in this same batch
+        results = []
+        for log_entry, (ip, user, brute, admin) in zip(log_entries, plan):
+            brute_count = None
+            if brute:
+                brute_count = next(replies)
+                if brute_count == 1:
+                    writes.expire(
+                        f"risk:brute:{ip}",
+                        self.config["ssh_brute_force"].get("window_seconds", 60),
+                    )
+
+            admin_known = None
+            if admin:
+                admin_known = bool(next(replies)) or (user, ip) in learned
+                if not admin_known:
+                    learned.add((user, ip))
+                    writes.sadd(f"state:admin_ips:{user}", ip)
+
+            results.append(self._evaluate(log_entry, ip, user, brute_count, admin_known))
+
+        if len(writes):
+            writes.execute()
+        return results
+
+    def _check_rules_local(self, log_entries: List[Event]) -> List[tuple[List[str], str]]:
+        counters, members = [], []
+        for log_entry in log_entries:
+            ip = log_entry.ip
+            user = log_entry.user
+            if self._is_brute_candidate(log_entry, ip):
+                counters.append(f"risk:brute:{ip}")
+            if self._is_admin_candidate(user, ip):
+                members.append((f"state:admin_ips:{user}", ip))
+        self.state.prefetch(counters=counters, members=members)
+        return [self.check_rules(log_entry) for log_entry in log_entries]
+
+    def _evaluate(
+        self,
+        log_entry: Event,
+        ip: Optional[str],
+        user: Optional[str],
+        brute_count: Optional[int],
+        admin_known: Optional[bool],
+    ) -> tuple[List[str], str]:
+        """Apply the rules given already-resolved state (no Redis access here)."""
         alerts = []
         max_severity = "INFO"
-        
-        # Severity Map for comparison
-        sev_map = {"CRITICAL": 50, "HIGH": 40, "MEDIUM": 30, "LOW": 20, "INFO": 10}
-        
+
         def update_severity(new_sev):
             nonlocal max_severity
-            if sev_map.get(new_sev, 0) > sev_map.get(max_severity, 0):
+            if SEV_MAP.get(new_sev, 0) > SEV_MAP.get(max_severity, 0):
                 max_severity = new_sev
 
-        ip = log_entry.get('ip') or log_entry.get('metadata', {}).get('ip')
-        user = log_entry.get('user') or log_entry.get('metadata', {}).get('user')
-        
         # 1. SSH Brute Force
         rule_cfg = self.config.get("ssh_brute_force", {})
-        if rule_cfg.get("enabled"):
-            if log_entry.get('event_type') == 'ssh_login_failed' and ip:
-                key = f"risk:brute:{ip}"
-                count = self.redis.incr(key)
-                if count == 1:
-                    self.redis.expire(key, rule_cfg.get("window_seconds", 60))
-                
-                if count >= rule_cfg.get("threshold", 5):
-                     alerts.append(f"SSH Brute Force Detected from {ip} ({count} failures)")
-                     update_severity(rule_cfg.get("severity", "HIGH"))
+        if brute_count is not None and brute_count >= rule_cfg.get("threshold", 5):
+            alerts.append(f"SSH Brute Force Detected from {ip} ({brute_count} failures)")
+            update_severity(rule_cfg.get("severity", "HIGH"))
 
         # 2. Sudo Usage
         rule_cfg = self.config.get("sudo_usage", {})
         if rule_cfg.get("enabled"):
-            msg = log_entry.get('message', '').lower()
+            msg = log_entry.message.lower()
             if "sudo" in msg and "command not found" not in msg:
                  alerts.append("Suspicious Sudo Command Detection")
                  update_severity(rule_cfg.get("severity", "MEDIUM"))
         
         # 3. Suspicious Admin Login (New IP)
         rule_cfg = self.config.get("suspicious_admin", {})
-        if rule_cfg.get("enabled") and user and ip:
-             admin_users = rule_cfg.get("admin_users", ["root", "admin", "ubuntu"])
-             if user in admin_users:
-                 known_key = f"state:admin_ips:{user}"
-                 
-                 is_known = self.redis.sismember(known_key, ip)
-                 if not is_known:
-                     alerts.append(f"Suspicious Admin Login (New IP): User {user} from {ip}")
-                     update_severity(rule_cfg.get("severity", "CRITICAL"))
-                     self.redis.sadd(known_key, ip)
-                 
+        if admin_known is False:
+            alerts.append(f"Suspicious Admin Login (New IP): User {user} from {ip}")
+            update_severity(rule_cfg.get("severity", "CRITICAL"))
+
         return alerts, max_severity
 
 rule_detector = RuleBasedDetector()
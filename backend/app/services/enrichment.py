@@ -3,6 +3,7 @@ from app.core.config import settings
 import requests
 import logging
 from functools import lru_cache
+from app.models.event import Event
 
 logger = logging.getLogger(__name__)
 
@@ -22,19 +23,19 @@ class EnrichmentService:
         # Production: No local DB init required as we use External APIs
         pass
 
-    def enrich_log(self, log_entry: dict):
+    def enrich_log(self, log_entry: Event):
         """
-        Add 'geo', 'ua_details', and 'threat_intel' to log_entry.
+        Set 'geo', 'ua_details', and 'threat_intel' on log_entry.
         Production Mode: No Mocks. If API fails, fields are omitted.
         """
-        ip = log_entry.get("ip") or log_entry.get("metadata", {}).get("ip")
+        ip = log_entry.ip
         
         # 1. GeoIP Enrichment (Production: ipinfo.io)
         if ip and settings.IPINFO_TOKEN:
             data = get_geo_data(ip, settings.IPINFO_TOKEN)
             if data:
                 loc = data.get('loc', '0,0').split(',')
-                log_entry["geo"] = {
+                log_entry.geo = {
                     "country": data.get("country", "Unknown"),
                     "city": data.get("city", "Unknown"),
                     "lat": float(loc[0]) if len(loc) == 2 else 0.0,
@@ -55,7 +56,7 @@ class EnrichmentService:
                 if resp.status_code == 200:
                     data = resp.json().get('data', {})
                     score = data.get('abuseConfidenceScore', 0)
-                    log_entry["threat_intel"] = {
+                    log_entry.threat_intel = {
                         "abuse_score": score,
                         "is_tor": data.get('isTor', False),
                         "usage_type": data.get('usageType', 'Unknown')
@@ -63,9 +64,8 @@ class EnrichmentService:
                     
                     # ALERT LOGIC: High Reputation Score = High Severity
                     if score > 80:
-                        log_entry['alerts'] = log_entry.get('alerts', [])
-                        log_entry['alerts'].append(f"High-Risk IP Detected (AbuseIPDB Score: {score})")
-                        log_entry['severity'] = 'HIGH'
+                        log_entry.add_alert(f"High-Risk IP Detected (AbuseIPDB Score: {score})")
+                        log_entry.severity = 'HIGH'
             except Exception as e:
                 logger.error(f"Threat Intel failed for {ip}: {e}")
 
@@ -74,7 +74,7 @@ class EnrichmentService:
         if ua_string:
             try:
                 ua = parse(ua_string)
-                log_entry["ua_details"] = {
+                log_entry.ua_details = {
                     "browser": ua.browser.family,
                     "os": ua.os.family,
                     "device": ua.device.family
@@ -0,0 +1,40 @@
+"""
+Grok-style pattern expansion for the parser library (app/rules/parsers.yaml).
+
+    %{NAME}             the sub-pattern NAME, not captured
+    %{NAME:field}       captured as `field`
+    %{NAME:field:int}   captured and cast to int (or float)
+
+Sub-patterns may reference other sub-patterns; anything else in an
+expression is plain regex. Expansion happens once, when the library is
+compiled, so a reference costs nothing per message.
+"""
+import re
+
+_REF = re.compile(r'%\{(\w+)(?::(\w+))?(?::(int|float))?\}')
+CASTS = {"int": int, "float": float}
+
+
+class GrokError(ValueError):
+    pass
+
+
+def expand(expression: str, patterns: dict, _seen: tuple = ()) -> tuple[str, dict]:
+    """Expression -> (regex source, {field: cast}) for the fields it captures."""
+    casts = {}
+
+    def replace(ref: re.Match) -> str:
+        name, field, cast = ref.groups()
+        if name in _seen:
+            raise GrokError(f"pattern {name} refers to itself via {' -> '.join(_seen)}")
+        if name not in patterns:
+            raise GrokError(f"unknown pattern %{{{name}}}")
+        body, inner = expand(str(patterns[name]), patterns, _seen + (name,))
+        casts.update(inner)
+        if field is None:
+            return f"(?:{body})"
+        if cast:
+            casts[field] = CASTS[cast]
+        return f"(?P<{field}>{body})"
+
+    return _REF.sub(replace, expression), casts
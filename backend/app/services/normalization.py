@@ -1,69 +1,424 @@
+"""
+Message parsing: the parser library in app/rules/parsers.yaml, compiled once
+and swapped in whole when the file changes.
+
+  * Each source_type maps to an ordered list of parsers; a parser's regex
+    only runs when its literal prefilter occurs in the message, so formats
+    for other sources, or that the message cannot be, cost nothing.
+  * Sources without parsers of their own (raw_ingest, unlabeled syslog) are
+    classified: the prefilter literals index the parsers, and only parsers
+    whose literal occurs in the line are tried. For unlabeled lines (no
+    source, or raw_ingest) the first match also names the event's source; a
+    source the client supplied is kept.
+
+parse_many() does the same for a whole batch: messages are grouped by
+source and each parser runs over its group in one loop, producing columns
+rather than a dict per message.
+"""
+import logging
+import os
 import re
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Iterable, List, Optional
+
+import yaml
+
+from app.core import metrics
+from app.core.config import settings
+from app.services import grok
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "rules", "parsers.yaml")
+# Sources of lines that arrived without one; classification names their source
+UNLABELED_SOURCES = ("", None, "raw_ingest")
+
+# Named group in a pattern, for prefixing when variants share one regex
+_GROUP = re.compile(r'\(\?P<(\w+)>')
+
+
+class ParsedBatch:
+    """
+    parse_many() output. Matches are kept per parser as blocks of columns:
+    (message indices, field names, one value list per field, constant fields).
+    `columns` lays them out per field across the whole batch; rows() gives
+    the per-message dicts parse_log would have returned.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.blocks: List[tuple] = []
+        self.parser: List[Optional[str]] = [None] * size  # name of the parser that matched
+
+    def add(self, parser: str, indices: List[int], names: tuple, values: List[list], constants: Dict[str, Any]):
+        if not indices:
+            return
+        self.blocks.append((indices, names, values, constants))
+        for i in indices:
+            self.parser[i] = parser
+
+    @property
+    def matched(self) -> int:
+        return sum(len(block[0]) for block in self.blocks)
+
+    @property
+    def columns(self) -> Dict[str, list]:
+        """field -> value per message (None where the message has no such field)."""
+        columns: Dict[str, list] = {}
+        for indices, names, values, constants in self.blocks:
+            for name, column in zip(names, values):
+                target = columns.setdefault(name, [None] * self.size)
+                for i, value in zip(indices, column):
+                    target[i] = value
+            for name, value in constants.items():
+                target = columns.setdefault(name, [None] * self.size)
+                for i in indices:
+                    target[i] = value
+        return columns
+
+    def rows(self) -> List[Optional[Dict[str, Any]]]:
+        rows: List[Optional[Dict[str, Any]]] = [None] * self.size
+        for indices, names, values, constants in self.blocks:
+            # A parser that captures nothing still matched: constants only
+            for i, row in zip(indices, zip(*values) if values else [()] * len(indices)):
+                extracted = dict(zip(names, row))
+                extracted.update(constants)
+                rows[i] = extracted
+        return rows
+
+
+class Parser:
+    """
+    One log format: a compiled regex behind a cheap literal prefilter.
+    The regex only runs on messages that contain `prefilter`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pattern: str,
+        prefilter: Optional[str] = None,
+        anchored: bool = False,
+        fields: Optional[Dict[str, Any]] = None,
+        casts: Optional[Dict[str, type]] = None,
+        drop: Iterable[str] = (),
+        source: Optional[str] = None,
+    ):
+        self.name = name
+        self.prefilter = prefilter
+        self.source = source  # given to events this parser recognises by classification
+        self.regex = re.compile(pattern)
+        self._run = self.regex.match if anchored else self.regex.search
+        self.fields = fields or {}  # constants added to every match
+        self.casts = casts or {}
+        self.drop = tuple(drop)
+        self.hits = self.misses = self.skipped = 0
+        # Captured fields in group order, minus the dropped ones, for bulk extraction
+        order = sorted(self.regex.groupindex.items(), key=lambda item: item[1])
+        self._keep = [(index - 1, name) for name, index in order if name not in self.drop]
+
+    def _finish(self, extracted: Dict[str, Any], fields: Dict[str, Any], casts: Dict[str, type]) -> Dict[str, Any]:
+        for key in self.drop:
+            extracted.pop(key, None)
+        for key, cast in casts.items():
+            if extracted.get(key) is not None:
+                extracted[key] = cast(extracted[key])
+        extracted.update(fields)
+        return extracted
+
+    def _extract(self, match: re.Match) -> Dict[str, Any]:
+        return self._finish(match.groupdict(), self.fields, self.casts)
+
+    def parse(self, message: str) -> Optional[Dict[str, Any]]:
+        if self.prefilter is not None and self.prefilter not in message:
+            self.skipped += 1
+            return None
+        match = self._run(message)
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._extract(match)
+
+    # ---- bulk ----
+
+    def _columns(self, rows: List[tuple], keep: List[tuple], casts: Dict[str, type]) -> tuple:
+        """Transpose group tuples into (names, value lists), casting whole columns."""
+        columns = list(zip(*rows))
+        names, values = [], []
+        for index, name in keep:
+            column = columns[index]
+            cast = casts.get(name)
+            if cast is not None:
+                column = [None if v is None else cast(v) for v in column]
+            names.append(name)
+            values.append(column)
+        return tuple(names), values
+
+    def _emit(self, indices: List[int], matches: List[re.Match], batch: ParsedBatch, extra: Optional[Dict[str, Any]]):
+        if not indices:
+            return
+        names, values = self._columns([m.groups() for m in matches], self._keep, self.casts)
+        constants = {**extra, **self.fields} if extra else self.fields
+        batch.add(self.name, indices, names, values, constants)
+
+    def parse_many(
+        self, messages: List[str], indices: List[int], batch: ParsedBatch, extra: Optional[Dict[str, Any]] = None
+    ) -> List[int]:
+        """Parse messages[i] for i in indices into `batch`; returns the indices left unmatched."""
+        prefilter, run = self.prefilter, self._run
+        hit_indices, matches, unmatched = [], [], []
+        for i in indices:
+            message = messages[i]
+            if prefilter is not None and prefilter not in message:
+                self.skipped += 1
+                unmatched.append(i)
+                continue
+            match = run(message)
+            if match is None:
+                self.misses += 1
+                unmatched.append(i)
+            else:
+                hit_indices.append(i)
+                matches.append(match)
+        self.hits += len(matches)
+        self._emit(hit_indices, matches, batch, extra)
+        return unmatched
+
+
+class AlternationParser(Parser):
+    """
+    Several variants of one format compiled into a single alternation, so
+    one scan both matches and tells which variant it was. Each variant is
+    (pattern, constant fields, casts); its group names are prefixed internally.
+    """
+
+    def __init__(self, name: str, variants: List[tuple], **options):
+        branches = []
+        self.variants = {}
+        for i, (pattern, fields, casts) in enumerate(variants):
+            tag = f"v{i}"
+            names = _GROUP.findall(pattern)
+            branches.append(f"(?P<{tag}>{_GROUP.sub(lambda m: f'(?P<{tag}__{m.group(1)}>', pattern)})")
+            self.variants[tag] = ([(f"{tag}__{n}", n) for n in names], fields or {}, casts or {})
+        super().__init__(name, "|".join(branches), **options)
+
+    def _extract(self, match: re.Match) -> Dict[str, Any]:
+        # The variant's own group closes last, so lastgroup names it
+        groups, fields, casts = self.variants[match.lastgroup]
+        return self._finish({name: match.group(group) for group, name in groups}, fields, casts)
+
+    def _emit(self, indices: List[int], matches: List[re.Match], batch: ParsedBatch, extra: Optional[Dict[str, Any]]):
+        by_variant: Dict[str, tuple] = {}
+        for i, match in zip(indices, matches):
+            variant_indices, variant_rows = by_variant.setdefault(match.lastgroup, ([], []))
+            variant_indices.append(i)
+            variant_rows.append(match.groups())
+        groupindex = self.regex.groupindex
+        for tag, (variant_indices, variant_rows) in by_variant.items():
+            groups, fields, casts = self.variants[tag]
+            keep = [(groupindex[group] - 1, name) for group, name in groups if name not in self.drop]
+            names, values = self._columns(variant_rows, keep, casts)
+            constants = {**extra, **fields} if extra else fields
+            batch.add(self.name, variant_indices, names, values, constants)
+
+
+def build_parser(spec: dict, patterns: dict) -> Parser:
+    """One `parsers:` entry of the library file -> Parser."""
+    sources = spec.get("sources") or []
+    options = {
+        "prefilter": spec.get("prefilter"),
+        "anchored": bool(spec.get("anchored")),
+        "drop": spec.get("drop") or (),
+        "source": sources[0] if sources else None,
+    }
+    if "variants" in spec:
+        variants = []
+        for variant in spec["variants"]:
+            regex, casts = grok.expand(variant["pattern"], patterns)
+            variants.append((regex, variant.get("fields"), casts))
+        return AlternationParser(spec["name"], variants, **options)
+    regex, casts = grok.expand(spec["pattern"], patterns)
+    return Parser(spec["name"], regex, fields=spec.get("fields"), casts=casts, **options)
+
+
+class ParserLibrary:
+    """A compiled parser file: per-source dispatch plus the classifier index."""
+
+    def __init__(self, parsers: List[Parser], sources: Dict[str, List[Parser]]):
+        self.parsers = parsers
+        self.by_source = sources
+        # prefilter literal -> parsers using it, in file order
+        self.by_literal: Dict[str, List[Parser]] = {}
+        for parser in parsers:
+            if parser.prefilter:
+                self.by_literal.setdefault(parser.prefilter, []).append(parser)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ParserLibrary":
+        patterns = config.get("patterns") or {}
+        parsers, sources = [], {}
+        for spec in config.get("parsers") or []:
+            try:
+                parser = build_parser(spec, patterns)
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                raise ValueError(f"parser {spec.get('name', '?')!r}: {e}") from e
+            parsers.append(parser)
+            for source in spec.get("sources") or []:
+                sources.setdefault(source, []).append(parser)
+        return cls(parsers, sources)
+
+    def classify(self, message: str, name_source: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Fields from the first parser that recognises the line; with
+        `name_source`, also its source (for lines that arrived without one).
+        """
+        for literal, parsers in self.by_literal.items():
+            if literal in message:
+                for parser in parsers:
+                    extracted = parser.parse(message)
+                    if extracted is not None:
+                        if name_source and parser.source:
+                            extracted.setdefault("source", parser.source)
+                        return extracted
+        return None
+
+    def classify_many(self, messages: List[str], indices: List[int], batch: ParsedBatch, name_source: bool = True):
+        """Bulk classify(): each literal's parsers see the lines still unmatched that contain it."""
+        for literal, parsers in self.by_literal.items():
+            candidates = [i for i in indices if literal in messages[i]]
+            if not candidates:
+                continue
+            matched = set(candidates)
+            for parser in parsers:
+                extra = {"source": parser.source} if name_source and parser.source else None
+                candidates = parser.parse_many(messages, candidates, batch, extra)
+                if not candidates:
+                    break
+            matched.difference_update(candidates)
+            indices = [i for i in indices if i not in matched]
+            if not indices:
+                return
+
+    def parse_many(self, messages: List[str], source_types) -> ParsedBatch:
+        """Bulk parse_log(): `source_types` is one source for all messages or one per message."""
+        batch = ParsedBatch(len(messages))
+        if isinstance(source_types, str):
+            groups = {source_types: list(range(len(messages)))}
+        else:
+            groups: Dict[str, List[int]] = {}
+            for i, source_type in enumerate(source_types):
+                groups.setdefault(source_type, []).append(i)
+        for source_type, indices in groups.items():
+            parsers = self.by_source.get(source_type)
+            if parsers is None:
+                self.classify_many(messages, indices, batch, source_type in UNLABELED_SOURCES)
+                continue
+            for parser in parsers:
+                indices = parser.parse_many(messages, indices, batch)
+                if not indices:
+                    break
+        return batch
+
 
 class NormalizationService:
-    def __init__(self):
-        # Nginx default log format: '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"'
-        # Example: 127.0.0.1 - - [08/Jan/2026:17:37:52 +0000] "GET /api/v1/logs HTTP/1.1" 202 31 "-" "python-requests/2.32.5"
-        self.nginx_pattern = re.compile(
-            r'(?P<ip>[\d\.]+) - (?P<remote_user>[\w-]+) \[(?P<timestamp>.*?)\] "(?P<verb>\w+) (?P<path>.*?) HTTP/[0-9\.]+" (?P<status>\d+) (?P<bytes>\d+) "(?P<referrer>.*?)" "(?P<user_agent>.*?)"'
-        )
-
-        # SSH Pattern (Basic examples)
-        # Failed password for invalid user admin from 192.168.1.1 port 22 ssh2
-        # Accepted password for user root from 192.168.1.1 port 22 ssh2
-        self.ssh_failed_pattern = re.compile(
-            r'Failed password for (?:invalid user )?(?P<user>[\w\-_]+) from (?P<ip>[\d\.]+) port \d+ ssh2'
-        )
-        self.ssh_accepted_pattern = re.compile(
-            r'Accepted password for (?P<user>[\w\-_]+) from (?P<ip>[\d\.]+) port \d+ ssh2'
-        )
-        
-        # UFW Firewall Pattern
-        # [UFW BLOCK] IN=eth0 OUT= MAC=... SRC=1.2.3.4 DST=...
-        self.ufw_pattern = re.compile(
-            r'\[UFW BLOCK\] .*?SRC=(?P<ip>[\d\.]+) .*?DST=(?P<dst>[\d\.]+) .*?PROTO=(?P<proto>\w+)'
-        )
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self.library = ParserLibrary([], {})
+        self._mtime = None
+        self._checked = 0.0
+        self._published: Dict[tuple, int] = {}
+        self.load()
+
+    # ---- library file ----
+
+    def load(self) -> bool:
+        """(Re)compile the parser file. On any error the current library stays in use."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r") as f:
+                library = ParserLibrary.from_config(yaml.safe_load(f) or {})
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            logger.error(f"Parser library {self.path} not loaded, keeping {len(self.library.parsers)} parsers: {e}")
+            return False
+        # Counts of the outgoing parsers are published before they are dropped
+        self.publish_metrics()
+        self._published = {}
+        self.library = library
+        self._mtime = mtime
+        logger.info(f"Loaded {len(library.parsers)} log parsers from {self.path}")
+        return True
+
+    def maybe_reload(self):
+        """Reload if the file changed; stat()s at most every PARSERS_RELOAD_SECONDS."""
+        interval = settings.PARSERS_RELOAD_SECONDS
+        now = time.monotonic()
+        if not interval or now - self._checked < interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.load()
+
+    # ---- parsing ----
+
+    def detect_source(self, message: str) -> str:
+        """
+        Best-guess source_type for a line that arrived without one (raw and
+        syslog ingest), so parse_log can pick the right pattern.
+        """
+        self.maybe_reload()
+        extracted = self.library.classify(message)
+        if extracted and extracted.get("source"):
+            return extracted["source"]
+        return "raw_ingest"
 
     def parse_log(self, message: str, source_type: str) -> Dict[str, Any]:
         """
         Parse a raw log message based on the source type.
-        Returns a dictionary of extracted fields.
+        Returns a dictionary of extracted fields (empty when nothing matched).
         """
-        extracted = {}
-
-        if source_type == "nginx":
-            match = self.nginx_pattern.match(message)
-            if match:
-                extracted = match.groupdict()
-                # Remove extracted timestamp to avoid format conflicts with ES (use API timestamp instead)
-                extracted.pop('timestamp', None)
-                # Cast status/bytes to int
-                extracted['status'] = int(extracted['status'])
-                extracted['bytes'] = int(extracted['bytes'])
-        
-        elif source_type == "ssh":
-            # Check Failed
-            fail_match = self.ssh_failed_pattern.search(message)
-            if fail_match:
-                extracted = fail_match.groupdict()
-                extracted['event_type'] = 'ssh_login_failed'
-                extracted['action'] = 'block' # simplistic rule
-            else:
-                # Check Accepted
-                success_match = self.ssh_accepted_pattern.search(message)
-                if success_match:
-                    extracted = success_match.groupdict()
-                    extracted['event_type'] = 'ssh_login_success'
-        
-        elif "UFW BLOCK" in message:
-            match = self.ufw_pattern.search(message)
-            if match:
-                extracted = match.groupdict()
-                extracted['event_type'] = 'firewall_block'
-                extracted['action'] = 'blocked'
-                extracted['source'] = 'firewall'
-        
-        return extracted
+        library = self.library
+        parsers = library.by_source.get(source_type)
+        if parsers is None:
+            return library.classify(message, source_type in UNLABELED_SOURCES) or {}
+        for parser in parsers:
+            extracted = parser.parse(message)
+            if extracted is not None:
+                return extracted
+        return {}
+
+    def parse_many(self, messages: List[str], source_types) -> ParsedBatch:
+        """
+        parse_log for a batch: `source_types` is a list parallel to
+        `messages`, or one source_type for all of them. Returns a
+        ParsedBatch with int casts already applied.
+        """
+        return self.library.parse_many(messages, source_types)
+
+    # ---- metrics ----
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            p.name: {"hit": p.hits, "miss": p.misses, "skipped": p.skipped}
+            for p in self.library.parsers
+        }
+
+    def publish_metrics(self):
+        """
+        Fold the parsers' plain-int counters into aegis_normalize_parser_total.
+        Called from the worker's metrics tick so parse_log never takes a lock.
+        """
+        for name, results in self.stats().items():
+            for result, total in results.items():
+                key = (name, result)
+                delta = total - self._published.get(key, 0)
+                if delta:
+                    metrics.NORMALIZE_PARSERS.inc(delta, parser=name, result=result)
+                    self._published[key] = total
+
 
 normalization_service = NormalizationService()
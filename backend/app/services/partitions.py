@@ -0,0 +1,165 @@
+"""
+Entity-sharded log streams.
+
+With STREAM_PARTITIONS = N > 0 the ingest side hashes each event's entity
+into one of N streams `logs_stream:{0..N-1}`, so every event for a given IP
+lands in the same partition. Ingest does not run the parsers: the entity is
+an explicit `ip` (top level, then metadata), else the first IP address in
+the message, else the user. That is the IP the worker's normalization
+extracts for the shipped parsers (nginx, SSH and UFW lines carry it only in
+the message, and it is the first address there); a custom parser whose `ip`
+is not the first address in its lines would split that IP across
+partitions. Workers split the partitions between them:
+
+  * every worker heartbeats into the `logs_stream:members` sorted set;
+    members that miss STREAM_PARTITION_TTL_SECONDS of heartbeats are dropped;
+  * the live members, sorted by name, get partitions round-robin, so every
+    worker computes the same assignment without talking to the others;
+  * a worker only reads a partition while it holds that partition's lease
+    key, which it renews on each heartbeat and releases as soon as the
+    assignment moves the partition elsewhere. The new owner takes over when
+    the lease is released (or expires if the old owner died), so a partition
+    is never consumed by two workers at once and per-IP state can be kept in
+    process memory by its owner.
+
+Entries the old owner left pending are picked up by the new owner's
+reclaim pass once they have been idle for WORKER_RECLAIM_IDLE_MS.
+"""
+import logging
+import random
+import re
+import time
+import zlib
+from typing import Callable
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Renew / release a lease only if we still hold it
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+_IPV4 = r"(?:\d{1,3}\.){3}\d{1,3}"
+_IPV6 = (
+    r"(?:[0-9A-Fa-f]{1,4}:){7}[0-9A-Fa-f]{1,4}|(?:[0-9A-Fa-f]{1,4}:){1,7}:"
+    r"|(?:[0-9A-Fa-f]{1,4}:){1,6}(?::[0-9A-Fa-f]{1,4}){1,6}"
+    rf"|::(?:[0-9A-Fa-f]{{1,4}}:){{0,5}}(?:[0-9A-Fa-f]{{1,4}}|{_IPV4})?|(?:[0-9A-Fa-f]{{1,4}}:){{1,4}}:{_IPV4}"
+)
+# A whole address: not part of a longer dotted / colon-separated run such as a MAC (UFW's MAC=...)
+_MESSAGE_IP = re.compile(rf"(?<![\w.:])(?:{_IPV4}(?![\d.]*\d)|(?:{_IPV6})(?![\w:]))")
+
+
+def entity_of(log_data: dict) -> str | None:
+    """
+    The key that per-entity detection state is tracked under: IP, else user.
+    Without an explicit IP, the first address in the message stands in for
+    the one normalization would extract.
+    """
+    metadata = log_data.get("metadata")
+    if not isinstance(metadata, dict):
+        metadata = {}
+    ip = log_data.get("ip") or metadata.get("ip")
+    if not ip:
+        message = log_data.get("message")
+        found = _MESSAGE_IP.search(message) if isinstance(message, str) else None
+        ip = found.group() if found else None
+    return ip or log_data.get("user") or metadata.get("user")
+
+
+def partition_for(entity: str | None, partitions: int) -> int:
+    """Stable across processes and restarts (unlike hash()). Entity-less events spread randomly."""
+    if not entity:
+        return random.randrange(partitions)
+    return zlib.crc32(str(entity).encode()) % partitions
+
+
+def stream_names(base: str, partitions: int) -> list[str]:
+    if not partitions:
+        return [base]
+    return [f"{base}:{i}" for i in range(partitions)]
+
+
+class PartitionCoordinator:
+    """Worker side: membership heartbeat, partition assignment and leases."""
+
+    def __init__(self, client, base: str, member: str, partitions: int | None = None):
+        self.redis = client
+        self.base = base
+        self.member = member
+        self.partitions = settings.STREAM_PARTITIONS if partitions is None else partitions
+        self.ttl = settings.STREAM_PARTITION_TTL_SECONDS
+        self.members_key = f"{base}:members"
+        self.owned: set[int] = set()
+        # Called with the set of partitions just lost / just gained
+        self.on_revoke: list[Callable[[set[int]], None]] = []
+        self.on_assign: list[Callable[[set[int]], None]] = []
+        self._renew = client.register_script(_RENEW)
+        self._release = client.register_script(_RELEASE)
+
+    def lease_key(self, partition: int) -> str:
+        return f"{self.base}:{partition}:owner"
+
+    def streams(self) -> list[str]:
+        return [f"{self.base}:{i}" for i in sorted(self.owned)]
+
+    def assignment(self, members: list[str]) -> set[int]:
+        if self.member not in members:
+            return set()
+        index, count = members.index(self.member), len(members)
+        return {p for p in range(self.partitions) if p % count == index}
+
+    def heartbeat(self) -> set[int]:
+        """Refresh membership, then release / renew / acquire leases. Returns owned partitions."""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(self.members_key, {self.member: now})
+        pipe.zremrangebyscore(self.members_key, "-inf", now - self.ttl)
+        pipe.zrange(self.members_key, 0, -1)
+        members = pipe.execute()[2]
+        target = self.assignment(sorted(members))
+
+        moved = {p for p in self.owned if p not in target}
+        lost = set(moved)
+        for p in self.owned & target:
+            if not self._renew(keys=[self.lease_key(p)], args=[self.member, self.ttl]):
+                lost.add(p)  # lease expired and someone else took it
+
+        # Revoke callbacks (state flush) run while we still hold the leases of
+        # moved partitions, so their next owner never reads state we had not written
+        if lost:
+            self.owned -= lost
+            for callback in self.on_revoke:
+                callback(lost)
+            for p in moved:
+                self._release(keys=[self.lease_key(p)], args=[self.member])
+            logger.info(f"{self.member} released partitions {sorted(lost)}")
+
+        gained = set()
+        for p in target - self.owned:
+            if self.redis.set(self.lease_key(p), self.member, nx=True, ex=self.ttl):
+                gained.add(p)
+        if gained:
+            self.owned |= gained
+            logger.info(f"{self.member} now owns partitions {sorted(self.owned)}")
+            for callback in self.on_assign:
+                callback(gained)
+        return self.owned
+
+    def leave(self):
+        """Graceful shutdown: give up leases so the partitions move immediately."""
+        self.redis.zrem(self.members_key, self.member)
+        for p in self.owned:
+            self._release(keys=[self.lease_key(p)], args=[self.member])
+        self.owned = set()
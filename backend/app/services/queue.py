@@ -1,27 +1,66 @@
 import redis
-import json
+import redis.asyncio as aioredis
+from app.core import codec
 from app.core.config import settings
+from app.services.partitions import entity_of, partition_for, stream_names
 
 # Create a Redis connection pool
-pool = redis.ConnectionPool.from_url(settings.REDIS_URL, decode_responses=True)
+pool = redis.ConnectionPool.from_url(
+    settings.REDIS_URL, decode_responses=True, encoding_errors=codec.REDIS_ENCODING_ERRORS
+)
+# Shared asyncio pool for the API's request path (ingest, rate limiting, block checks)
+async_pool = aioredis.ConnectionPool.from_url(
+    settings.REDIS_URL, decode_responses=True, encoding_errors=codec.REDIS_ENCODING_ERRORS
+)
 
 class QueueService:
     def __init__(self):
         self.redis = redis.Redis(connection_pool=pool)
+        self.aredis = aioredis.Redis(connection_pool=async_pool)
         self.stream_name = "logs_stream"
+        # STREAM_PARTITIONS > 0 shards the stream by entity: logs_stream:{0..N-1}
+        self.partitions = settings.STREAM_PARTITIONS
+        self.streams = stream_names(self.stream_name, self.partitions)
+
+    def stream_for(self, log_data: dict) -> str:
+        """
+        Stream an event goes to: the entity's partition when sharding is on.
+        No parsing on this path; see partitions.entity_of for how the entity
+        is found in lines that carry the IP only in `message`.
+        """
+        if not self.partitions:
+            return self.stream_name
+        return self.streams[partition_for(entity_of(log_data), self.partitions)]
 
     def push_log(self, log_data: dict):
         """
         Push a log entry to the Redis Stream.
         """
-        # Redis Streams store keys/values as strings. We serialize the whole JSON-compatible dict to a string.
-        # Alternatively, we could store fields individually.
+        # Redis Streams store keys/values as strings. We serialize the whole dict into one field
+        # (see app.core.codec for the format).
         try:
             # We add it to the stream. '*' means auto-generate ID.
-            self.redis.xadd(self.stream_name, {"data": json.dumps(log_data)})
+            self.redis.xadd(self.stream_for(log_data), codec.encode_entry(log_data))
             return True
         except Exception as e:
             print(f"Error pushing to Redis: {e}")
             return False
 
+    async def apush_logs(self, logs: list) -> int:
+        """
+        Push a batch of log entries with one pipelined round-trip (async client).
+        Returns how many were queued.
+        """
+        if not logs:
+            return 0
+        try:
+            pipe = self.aredis.pipeline(transaction=False)
+            for log_data in logs:
+                pipe.xadd(self.stream_for(log_data), codec.encode_entry(log_data))
+            results = await pipe.execute(raise_on_error=False)
+            return sum(1 for res in results if not isinstance(res, Exception))
+        except Exception as e:
+            print(f"Error pushing to Redis: {e}")
+            return 0
+
 queue_service = QueueService()
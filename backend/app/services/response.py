@@ -3,8 +3,10 @@ import yaml
 import os
 import logging
 import ipaddress
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from app.core.config import settings
+from app.models.event import Event
+from app.services.blocklist import publish_block
 
 logger = logging.getLogger(__name__)
 
@@ -37,12 +39,12 @@ class ResponseService:
             pass # Invalid IP
         return False
 
-    def calculate_risk_score(self, log_entry: Dict[str, Any]) -> int:
+    def calculate_risk_score(self, log_entry: Event) -> int:
         """
         Calculate simple risk score based on severity and ML score.
         """
         score = 0
-        severity = log_entry.get("severity", "INFO")
+        severity = log_entry.severity or "INFO"
         
         # Base Severity Score
         if severity == "CRITICAL":
@@ -58,42 +60,71 @@ class ResponseService:
         # Assuming anomalies merged into log
         # Or checking specific ML output if stored differently.
         # For now, let's look at incidents list size as a multiplier
-        if len(log_entry.get("incidents", [])) > 0:
+        if log_entry.incidents:
             score += 10 # Boost for confirmed incidents
 
         # Cap at 100 for normalization, but we can go higher for extreme threats
         return score
 
-    def evaluate(self, log_entry: Dict[str, Any]):
+    def _decide(self, log_entry: Event):
         """
-        Decide and execute response.
+        Return (ip, decision) for the log entry without side effects.
+        ip is None when there is nothing to act on.
         """
-        ip = log_entry.get("ip") or log_entry.get("metadata", {}).get("ip")
+        ip = log_entry.ip
         if not ip:
-            return
+            return None, None
 
         if self.is_whitelisted(ip):
             logger.info(f"Response: IP {ip} is whitelisted. Ignoring.")
-            return
+            return None, None
 
         risk_score = self.calculate_risk_score(log_entry)
         threshold = self.policy.get("block_threshold", 80)
         
         if risk_score >= threshold:
-            self.execute_block(ip, risk_score)
-            return {"action": "block", "score": risk_score, "reason": f"Risk Score {risk_score} > Threshold {threshold}"}
+            return ip, {"action": "block", "score": risk_score, "reason": f"Risk Score {risk_score} > Threshold {threshold}"}
         
-        return {"action": "monitor", "score": risk_score}
+        return ip, {"action": "monitor", "score": risk_score}
+
+    def evaluate(self, log_entry: Event):
+        """
+        Decide and execute response.
+        """
+        ip, decision = self._decide(log_entry)
+        if decision and decision["action"] == "block":
+            self.execute_block(ip, decision["score"])
+        return decision
+
+    def evaluate_batch(self, log_entries: List[Event]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Batch variant of evaluate: every block in the batch is written in a
+        single pipelined round-trip.
+        """
+        decisions = []
+        pipe = self.redis.pipeline(transaction=False)
+        for log_entry in log_entries:
+            ip, decision = self._decide(log_entry)
+            if decision and decision["action"] == "block":
+                self.execute_block(ip, decision["score"], client=pipe)
+            decisions.append(decision)
+        if len(pipe):
+            pipe.execute()
+        return decisions
 
-    def execute_block(self, ip: str, score: int):
+    def execute_block(self, ip: str, score: int, client=None):
         """
-        Simulate Block: Add to Redis 'blocked:{ip}'
+        Simulate Block: Add to Redis 'blocked:{ip}' and announce it to the
+        API processes' blocklist caches.
+        `client` may be a pipeline when blocks are batched.
         """
         duration = self.policy.get("block_duration_seconds", 300)
         key = f"blocked:{ip}"
         
         # Only block if not already blocked (or refresh TTL)
-        self.redis.setex(key, duration, f"Risk Score: {score}")
+        client = client or self.redis
+        client.setex(key, duration, f"Risk Score: {score}")
+        publish_block(client, ip, duration)
         logger.warning(f"Response: BLOCKED IP {ip} for {duration}s. Reason: Risk Score {score}")
         
         # In a real system, here we would call:
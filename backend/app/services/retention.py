@@ -0,0 +1,90 @@
+"""
+Retention for logs_stream.
+
+XADD never trims, so acknowledged entries would otherwise stay in Redis
+forever. One worker per RETENTION_INTERVAL_SECONDS (elected with a short
+lock) trims the stream with approximate MINID up to the oldest entry some
+consumer group still needs:
+
+  * the oldest pending (delivered, un-acked) ID of each group, or
+  * the entry after the group's last-delivered-id when nothing is pending.
+
+Entries that are un-acked or not yet delivered are never removed. When the
+stream is still above RETENTION_MAX_LEN / RETENTION_MAX_MEMORY_MB after
+trimming, the backlog is unprocessed data, so instead of deleting it the
+ingest backpressure signal is raised until the workers catch up.
+"""
+import logging
+
+from app.core import metrics
+from app.core.config import settings
+from app.services.backpressure import raise_signal
+
+logger = logging.getLogger(__name__)
+
+
+def _id_tuple(stream_id: str) -> tuple[int, int]:
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _next_id(stream_id: str) -> str:
+    ms, seq = _id_tuple(stream_id)
+    return f"{ms}-{seq + 1}"
+
+
+class StreamRetention:
+    def __init__(self, client, stream: str, max_len: int | None = None):
+        self.redis = client
+        self.stream = stream
+        # Partitions split RETENTION_MAX_LEN between them
+        self.max_len = settings.RETENTION_MAX_LEN if max_len is None else max_len
+        self.lock_key = f"{stream}:retention:lock"
+
+    def safe_min_id(self) -> str | None:
+        """Lowest ID any consumer group still needs; None if there are no groups."""
+        boundary = None
+        for group in self.redis.xinfo_groups(self.stream):
+            if group["pending"]:
+                summary = self.redis.xpending(self.stream, group["name"])
+                needed = summary["min"]
+            else:
+                needed = _next_id(group["last-delivered-id"])
+            if boundary is None or _id_tuple(needed) < _id_tuple(boundary):
+                boundary = needed
+        return boundary
+
+    def trim(self) -> int:
+        """Approximate MINID trim to the safe boundary; returns entries removed."""
+        boundary = self.safe_min_id()
+        if boundary is None or boundary == "0-1":
+            return 0
+        trimmed = self.redis.xtrim(self.stream, minid=boundary, approximate=True)
+        if trimmed:
+            metrics.STREAM_TRIMMED.inc(trimmed, stream=self.stream)
+            logger.debug(f"Trimmed {trimmed} acked entries from '{self.stream}' (MINID ~ {boundary})")
+        return trimmed
+
+    def over_ceiling(self, length: int) -> str | None:
+        if self.max_len and length > self.max_len:
+            return f"{self.stream} holds {length} unprocessed entries > {self.max_len}"
+        if settings.RETENTION_MAX_MEMORY_MB:
+            used_mb = self.redis.info("memory")["used_memory"] / (1024 * 1024)
+            if used_mb > settings.RETENTION_MAX_MEMORY_MB:
+                return f"Redis memory {used_mb:.0f}MB > {settings.RETENTION_MAX_MEMORY_MB}MB"
+        return None
+
+    def run(self) -> int | None:
+        """
+        One retention pass, skipped if another worker ran one within the
+        interval. Returns entries trimmed, or None when skipped.
+        """
+        if not self.redis.set(self.lock_key, "1", nx=True, ex=settings.RETENTION_INTERVAL_SECONDS):
+            return None
+        trimmed = self.trim()
+        length = self.redis.xlen(self.stream)
+        metrics.STREAM_LENGTH.set(length, stream=self.stream)
+        reason = self.over_ceiling(length)
+        if reason:
+            raise_signal(self.redis, reason)
+        return trimmed
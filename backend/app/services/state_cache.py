@@ -0,0 +1,279 @@
+"""
+Detection state layer: brute-force windows, admin-IP sets, correlation phase
+flags and the login-rate counters the ML features read.
+
+STATE_CONSISTENCY selects how it talks to Redis:
+
+  strict  every read and write is a Redis call, as before (safe with any
+          number of workers reading the same stream);
+  local   state lives in process memory. Misses are read through from Redis
+          (so a restarted worker reloads what was flushed before), writes are
+          applied locally and flushed write-behind in one pipeline every
+          STATE_FLUSH_INTERVAL_MS. Only correct when a single worker sees all
+          events of an entity: one worker process, or STREAM_PARTITIONS > 0,
+          where the cache is flushed and dropped whenever a partition is
+          released.
+
+The local store is an LRU bounded by STATE_CACHE_MAX_ENTRIES and honours the
+same TTLs as the Redis keys (expiries are flushed as absolute PXAT times).
+
+use_memory() detaches the cache from Redis entirely (offline pipeline runs):
+misses start empty, nothing is flushed and TTLs follow a caller-supplied clock.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+import redis
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+COUNTER, MEMBER, FLAG, SHARED = "counter", "member", "flag", "shared"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class StateCache:
+    def __init__(self, client=None, mode: str | None = None, max_entries: int | None = None):
+        self.redis = client or redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.local = (mode or settings.STATE_CONSISTENCY) == "local"
+        self.max_entries = max_entries or settings.STATE_CACHE_MAX_ENTRIES
+        self._lock = threading.RLock()
+        # (kind, key[, member]) -> [value, expires_at_ms | None]
+        self._entries: OrderedDict[tuple, list] = OrderedDict()
+        # Write-behind buffers
+        self._counters: dict[str, list] = {}  # key -> [op ("incr"|"set"), amount, expires_at_ms]
+        self._members: dict[str, set] = {}  # key -> members to SADD
+        self._flags: dict[str, tuple] = {}  # key -> (value, expires_at_ms)
+        self._flushed_at = time.monotonic()
+        self.memory = False
+        self.clock = _now_ms
+
+    def use_memory(self, clock=None):
+        """
+        Keep all state in this process with no Redis behind it. `clock` returns
+        the current time in ms (e.g. event time when replaying a file). LRU
+        eviction then forgets state, so size STATE_CACHE_MAX_ENTRIES for the
+        number of live entities.
+        """
+        self.local = self.memory = True
+        self.clock = clock or _now_ms
+        self._entries.clear()
+        self._counters, self._members, self._flags = {}, {}, {}
+
+    # ---- public API (same semantics in both modes) ----
+
+    def window_incr(self, key: str, ttl: int) -> int:
+        """INCR a fixed-window counter; the window starts at the first increment."""
+        if not self.local:
+            count = self.redis.incr(key)
+            if count == 1:
+                self.redis.expire(key, ttl)
+            return count
+
+        with self._lock:
+            entry = self._get(COUNTER, key)
+            now = self.clock()
+            if entry[0] == 0 or (entry[1] is not None and entry[1] <= now):
+                entry[0], entry[1] = 1, now + ttl * 1000
+                if not self.memory:
+                    self._counters[key] = ["set", 1, entry[1]]
+            else:
+                entry[0] += 1
+                if not self.memory:
+                    pending = self._counters.setdefault(key, ["incr", 0, entry[1]])
+                    pending[1] += 1
+                    pending[2] = entry[1]
+            return entry[0]
+
+    def is_member(self, key: str, member: str) -> bool:
+        if not self.local:
+            return bool(self.redis.sismember(key, member))
+        with self._lock:
+            return bool(self._get(MEMBER, key, member)[0])
+
+    def add_member(self, key: str, member: str):
+        if not self.local:
+            self.redis.sadd(key, member)
+            return
+        with self._lock:
+            self._put((MEMBER, key, member), True, None)
+            if not self.memory:
+                self._members.setdefault(key, set()).add(member)
+
+    def flag_active(self, key: str) -> bool:
+        if not self.local:
+            return bool(self.redis.exists(key))
+        with self._lock:
+            value, expires_at = self._get(FLAG, key)
+            return value is not None and (expires_at is None or expires_at > self.clock())
+
+    def set_flag(self, key: str, ttl: int, value: str = "active"):
+        if not self.local:
+            self.redis.setex(key, ttl, value)
+            return
+        with self._lock:
+            expires_at = self.clock() + ttl * 1000
+            self._put((FLAG, key), value, expires_at)
+            if not self.memory:
+                self._flags[key] = (value, expires_at)
+
+    def shared_int(self, key: str) -> int:
+        """
+        An integer another process owns (e.g. the API's rate_limit:{ip}). In
+        local mode it is re-read at most every STATE_SHARED_READ_TTL_MS.
+        """
+        if not self.local:
+            val = self.redis.get(key)
+            return int(val) if val else 0
+        with self._lock:
+            return int(self._get(SHARED, key)[0] or 0)
+
+    def prefetch(
+        self,
+        counters: Iterable[str] = (),
+        members: Iterable[tuple[str, str]] = (),
+        flags: Iterable[str] = (),
+        shared: Iterable[str] = (),
+    ):
+        """Load every missing entry a batch will touch in one pipelined round-trip."""
+        if not self.local:
+            return
+        with self._lock:
+            wanted = (
+                [(COUNTER, k) for k in counters]
+                + [(MEMBER, k, m) for k, m in members]
+                + [(FLAG, k) for k in flags]
+                + [(SHARED, k) for k in shared]
+            )
+            self._load([e for e in dict.fromkeys(wanted) if not self._fresh(e)])
+
+    # ---- write-behind ----
+
+    def maybe_flush(self) -> int:
+        if not self.local:
+            return 0
+        if (time.monotonic() - self._flushed_at) * 1000 < settings.STATE_FLUSH_INTERVAL_MS:
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """Write buffered state to Redis in one pipeline. Returns keys written."""
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            counters, members, flags = self._counters, self._members, self._flags
+            if not (counters or members or flags):
+                return 0
+            self._counters, self._members, self._flags = {}, {}, {}
+
+            pipe = self.redis.pipeline(transaction=False)
+            for key, (op, amount, expires_at) in counters.items():
+                if op == "set":
+                    pipe.set(key, amount, pxat=expires_at)
+                else:
+                    pipe.incrby(key, amount)
+                    if expires_at is not None:
+                        pipe.pexpireat(key, expires_at)
+            for key, new_members in members.items():
+                pipe.sadd(key, *new_members)
+            for key, (value, expires_at) in flags.items():
+                pipe.set(key, value, pxat=expires_at)
+            try:
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"State flush failed, will retry: {e}")
+                self._requeue(counters, members, flags)
+                return 0
+
+            written = len(counters) + len(members) + len(flags)
+            metrics.STATE_FLUSHED.inc(written)
+            return written
+
+    def clear(self):
+        """Flush, then forget all local state (e.g. after losing partitions)."""
+        with self._lock:
+            self.flush()
+            self._entries.clear()
+
+    # ---- internals ----
+
+    def _fresh(self, entry_key: tuple) -> bool:
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return False
+        if entry_key[0] == SHARED:
+            return entry[1] > self.clock()
+        return True
+
+    def _get(self, *entry_key) -> list:
+        if not self._fresh(entry_key):
+            metrics.STATE_CACHE.inc(result="miss")
+            self._load([entry_key])
+        else:
+            metrics.STATE_CACHE.inc(result="hit")
+            self._entries.move_to_end(entry_key)
+        return self._entries[entry_key]
+
+    def _load(self, entry_keys: list[tuple]):
+        if not entry_keys:
+            return
+        if self.memory:
+            for entry_key in entry_keys:
+                empty = {COUNTER: 0, MEMBER: False}.get(entry_key[0])
+                self._put(entry_key, empty, None if entry_key[0] != SHARED else float("inf"))
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for kind, key, *member in entry_keys:
+            if kind == MEMBER:
+                pipe.sismember(key, member[0])
+            else:
+                pipe.get(key)
+                pipe.pttl(key)
+        replies = iter(pipe.execute())
+
+        now = self.clock()
+        for entry_key in entry_keys:
+            kind = entry_key[0]
+            if kind == MEMBER:
+                self._put(entry_key, bool(next(replies)), None)
+                continue
+            value, pttl = next(replies), next(replies)
+            expires_at = now + pttl if pttl and pttl > 0 else None
+            if kind == COUNTER:
+                self._put(entry_key, int(value or 0), expires_at)
+            elif kind == FLAG:
+                self._put(entry_key, value, expires_at)
+            else:
+                self._put(entry_key, value, now + settings.STATE_SHARED_READ_TTL_MS)
+
+    def _put(self, entry_key: tuple, value, expires_at: int | None):
+        self._entries[entry_key] = [value, expires_at]
+        self._entries.move_to_end(entry_key)
+        if len(self._entries) > self.max_entries:
+            # Evicted entries must not hide unflushed writes from a later read-through
+            self.flush()
+            while len(self._entries) > self.max_entries * 0.9:
+                self._entries.popitem(last=False)
+
+    def _requeue(self, counters: dict, members: dict, flags: dict):
+        """Merge a failed flush back under any writes buffered since."""
+        for key, (op, amount, expires_at) in counters.items():
+            newer = self._counters.get(key)
+            if newer is None:
+                self._counters[key] = [op, amount, expires_at]
+            elif newer[0] == "incr":
+                newer[0], newer[1] = op, newer[1] + amount
+        for key, old in members.items():
+            self._members.setdefault(key, set()).update(old)
+        for key, value in flags.items():
+            self._flags.setdefault(key, value)
+
+
+state_cache = StateCache()
@@ -1,24 +1,70 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch, helpers
+from elasticsearch.serializer import (
+    CompatibilityModeJsonSerializer,
+    CompatibilityModeNdjsonSerializer,
+    JsonSerializer,
+    NdjsonSerializer,
+)
+from app.core import codec
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class _CodecJson:
+    """Mixin: (de)serialize ES request and response bodies with app.core.codec."""
+
+    def json_dumps(self, data) -> bytes:
+        return codec.dumps_bytes(data)
+
+    def json_loads(self, data: bytes):
+        return codec.loads(data)
+
+
+class _Json(_CodecJson, JsonSerializer):
+    pass
+
+
+class _Ndjson(_CodecJson, NdjsonSerializer):
+    pass
+
+
+class _CompatJson(_CodecJson, CompatibilityModeJsonSerializer):
+    pass
+
+
+class _CompatNdjson(_CodecJson, CompatibilityModeNdjsonSerializer):
+    pass
+
+
+SERIALIZERS = {s.mimetype: s() for s in (_Json, _Ndjson, _CompatJson, _CompatNdjson)}
+
+
 class StorageService:
     def __init__(self):
         # Elastic Cloud requires basic auth — pass credentials if password is set
-        es_kwargs: dict = {"hosts": [settings.ELASTICSEARCH_URL]}
+        es_kwargs: dict = {"hosts": [settings.ELASTICSEARCH_URL], "serializers": SERIALIZERS}
         if settings.ELASTICSEARCH_PASSWORD:
             es_kwargs["basic_auth"] = (
                 settings.ELASTICSEARCH_USERNAME,
                 settings.ELASTICSEARCH_PASSWORD,
             )
         self.es = Elasticsearch(**es_kwargs)
+        self._es_kwargs = es_kwargs
+        self._aes = None
         # ILM Aliases
         self.log_alias = "logs-write"
         self.alert_alias = "alerts-write"
         self.incident_alias = "incidents-write"
+        self.index_message = settings.TEMPLATES_INDEX_MESSAGE
+
+    @property
+    def aes(self):
+        """AsyncElasticsearch client for the async worker, created on first use."""
+        if self._aes is None:
+            self._aes = AsyncElasticsearch(**self._es_kwargs)
+        return self._aes
 
     def is_healthy(self) -> bool:
         try:
@@ -26,6 +72,36 @@ class StorageService:
         except Exception:
             return False
 
+    def _log_doc(self, log_data: dict) -> dict:
+        """The logs-write document: templated events leave out `message` unless TEMPLATES_INDEX_MESSAGE."""
+        if self.index_message or not log_data.get("template_id"):
+            return log_data
+        return {key: value for key, value in log_data.items() if key != "message"}
+
+    def _alert_docs(self, log_data: dict) -> list:
+        return [
+            {
+                "timestamp": log_data.get("timestamp"),
+                "source_ip": log_data.get("ip"),
+                "rule_name": alert_msg,
+                "severity": log_data.get("severity", "MEDIUM"),
+                "full_log_id": log_data.get("id", "unknown"),
+                "metadata": log_data.get("metadata"),
+            }
+            for alert_msg in log_data.get("alerts") or []
+        ]
+
+    def _incident_docs(self, log_data: dict) -> list:
+        return [
+            {
+                "timestamp": log_data.get("timestamp"),
+                "incident": incident,
+                "severity": "CRITICAL",
+                "log_reference": log_data,
+            }
+            for incident in log_data.get("incidents") or []
+        ]
+
     def index_log(self, log_data: dict):
         """
         Index a log entry and its associated alerts/incidents into separate indices.
@@ -33,37 +109,59 @@ class StorageService:
         """
         try:
             # 1. Store the Full Log (Normalized)
-            self.es.index(index=self.log_alias, document=log_data)
+            self.es.index(index=self.log_alias, document=self._log_doc(log_data))
 
             # 2. Store Alerts (if any)
-            if log_data.get("alerts"):
-                for alert_msg in log_data["alerts"]:
-                    alert_doc = {
-                        "timestamp": log_data.get("timestamp"),
-                        "source_ip": log_data.get("ip"),
-                        "rule_name": alert_msg,
-                        "severity": log_data.get("severity", "MEDIUM"),
-                        "full_log_id": log_data.get("id", "unknown"),
-                        "metadata": log_data.get("metadata"),
-                    }
-                    self.es.index(index=self.alert_alias, document=alert_doc)
+            for alert_doc in self._alert_docs(log_data):
+                self.es.index(index=self.alert_alias, document=alert_doc)
 
             # 3. Store Incidents (if any)
-            if log_data.get("incidents"):
-                for incident in log_data["incidents"]:
-                    incident_doc = {
-                        "timestamp": log_data.get("timestamp"),
-                        "incident": incident,
-                        "severity": "CRITICAL",
-                        "log_reference": log_data,
-                    }
-                    self.es.index(index=self.incident_alias, document=incident_doc)
+            for incident_doc in self._incident_docs(log_data):
+                self.es.index(index=self.incident_alias, document=incident_doc)
+
+            return "indexed"
+        except Exception as e:
+            logger.error(f"Error indexing log: {e}")
+            return None
 
+    async def aindex_log(self, log_data: dict):
+        """Async variant of index_log (AsyncElasticsearch)."""
+        try:
+            await self.aes.index(index=self.log_alias, document=self._log_doc(log_data))
+            for alert_doc in self._alert_docs(log_data):
+                await self.aes.index(index=self.alert_alias, document=alert_doc)
+            for incident_doc in self._incident_docs(log_data):
+                await self.aes.index(index=self.incident_alias, document=incident_doc)
             return "indexed"
         except Exception as e:
             logger.error(f"Error indexing log: {e}")
             return None
 
+    def index_logs(self, logs: list) -> int:
+        """
+        Index a batch of log entries (plus their alerts/incidents) with a single
+        _bulk request. Returns the number of documents indexed successfully.
+        """
+        actions = []
+        for log_data in logs:
+            actions.append({"_index": self.log_alias, "_source": self._log_doc(log_data)})
+            for alert_doc in self._alert_docs(log_data):
+                actions.append({"_index": self.alert_alias, "_source": alert_doc})
+            for incident_doc in self._incident_docs(log_data):
+                actions.append({"_index": self.incident_alias, "_source": incident_doc})
+
+        if not actions:
+            return 0
+
+        try:
+            success, errors = helpers.bulk(self.es, actions, raise_on_error=False)
+            if errors:
+                logger.error(f"Bulk indexing: {len(errors)} of {len(actions)} documents failed")
+            return success
+        except Exception as e:
+            logger.error(f"Error bulk indexing {len(logs)} logs: {e}")
+            return 0
+
     # ---- Dashboard helpers (ES 8.x API: keyword args, no body=) ----
 
     def count(self, index: str, query: dict | None = None) -> int:
@@ -0,0 +1,178 @@
+"""
+Syslog transport helpers shared by /ingest/raw and the syslog listener.
+
+Framing (RFC 6587): a body or TCP stream carries either
+  * octet-counted frames, `LEN SP MSG` back to back (rsyslog / syslog-ng
+    with framing enabled), or
+  * one message per line (non-transparent framing, LF or CRLF).
+
+Headers: parse_syslog() understands RFC 5424 (`<PRI>1 TIMESTAMP HOST APP
+PROCID MSGID SD MSG`) and BSD / RFC 3164 (`<PRI>Mmm dd hh:mm:ss HOST
+TAG[PID]: MSG`), and maps the program name to a NormalizationService source.
+"""
+import re
+from datetime import datetime
+
+_OCTET_PREFIX = re.compile(rb"[1-9]\d{0,8} ")
+
+
+def is_octet_counted(data: bytes) -> bool:
+    """
+    True when `data` starts with a frame whose length lands on the end of the
+    data, a line break or the next `LEN SP` prefix (so a plain line that
+    happens to start with a number is not mistaken for a frame).
+    """
+    prefix = _OCTET_PREFIX.match(data)
+    if prefix is None:
+        return False
+    end = prefix.end() + int(data[:prefix.end() - 1])
+    if end >= len(data):
+        return end == len(data) or b"\n" not in data[:end]
+    return data[end:end + 1] in (b"\n", b"\r") or _OCTET_PREFIX.match(data, end) is not None
+
+
+def split_octet_counted(data: bytes) -> tuple[list[bytes], bytes]:
+    """
+    Split back-to-back `LEN SP MSG` frames. Returns (frames, rest) where rest
+    is an incomplete trailing frame, or the unframed remainder if the data
+    stops looking octet-counted.
+    """
+    frames = []
+    pos = 0
+    while pos < len(data):
+        prefix = _OCTET_PREFIX.match(data, pos)
+        if prefix is None:
+            break
+        start = prefix.end()
+        end = start + int(data[pos:start - 1])
+        if end > len(data):
+            break
+        frames.append(data[start:end])
+        pos = end
+        # Some senders put a newline after each frame anyway
+        while pos < len(data) and data[pos:pos + 1] in (b"\n", b"\r"):
+            pos += 1
+    return frames, data[pos:]
+
+
+def split_lines(data: bytes) -> list[bytes]:
+    return [line.rstrip(b"\r") for line in data.split(b"\n") if line.strip()]
+
+
+def split_frames(data: bytes) -> tuple[list[str], str]:
+    """Split a complete body into messages; returns (messages, framing)."""
+    if is_octet_counted(data):
+        frames, rest = split_octet_counted(data)
+        messages = frames + split_lines(rest)
+        framing = "octet-counted"
+    else:
+        messages = split_lines(data)
+        framing = "newline"
+    return [m.decode("utf-8", errors="replace") for m in messages if m.strip()], framing
+
+
+# ---------------------------------------------------------------------------
+# Header parsing
+# ---------------------------------------------------------------------------
+
+_PRI = re.compile(r"<(\d{1,3})>")
+_RFC5424 = re.compile(
+    r"1 (?P<timestamp>\S+) (?P<hostname>\S+) (?P<app_name>\S+) (?P<procid>\S+) (?P<msgid>\S+) "
+    r"(?P<sd>-|(?:\[(?:[^\]\\]|\\.)*\])+) ?(?P<message>.*)",
+    re.DOTALL,
+)
+_RFC3164 = re.compile(
+    r"(?P<timestamp>[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d) (?:(?P<hostname>[^\s:\[]+) )?"
+    r"(?:(?P<app_name>[^\s:\[]+)(?:\[(?P<procid>[^\]]*)\])?: )?(?P<message>.*)",
+    re.DOTALL,
+)
+
+# Syslog severity -> LogEntry level
+LEVELS = ["CRITICAL", "CRITICAL", "CRITICAL", "ERROR", "WARNING", "INFO", "INFO", "DEBUG"]
+
+# Program names whose messages NormalizationService has patterns for
+PROGRAM_SOURCES = {
+    "sshd": "ssh",
+    "ssh": "ssh",
+    "nginx": "nginx",
+    "ufw": "firewall",
+}
+
+
+def _nil(value: str | None) -> str | None:
+    return None if value in (None, "-") else value
+
+
+def _bsd_timestamp(value: str, now: datetime) -> str | None:
+    """RFC 3164 timestamps have no year: take the current one, or last year's around New Year."""
+    try:
+        ts = datetime.strptime(f"{now.year} {value}", "%Y %b %d %H:%M:%S")
+    except ValueError:
+        return None
+    if (ts - now).days > 1:
+        ts = ts.replace(year=now.year - 1)
+    return ts.isoformat()
+
+
+def parse_syslog(line: str, now: datetime | None = None) -> dict:
+    """
+    Split a syslog line into header fields and message. Lines without a
+    recognisable header come back with only `message` set (plus PRI, if any).
+    """
+    now = now or datetime.utcnow()
+    fields = {
+        "facility": None, "severity": None, "timestamp": None,
+        "hostname": None, "app_name": None, "procid": None, "message": line,
+    }
+    rest = line
+    pri = _PRI.match(line)
+    if pri and int(pri.group(1)) <= 191:
+        value = int(pri.group(1))
+        fields["facility"], fields["severity"] = value >> 3, value & 7
+        rest = line[pri.end():]
+
+    match = _RFC5424.match(rest)
+    if match:
+        timestamp = _nil(match["timestamp"])
+        if timestamp:
+            try:
+                timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).isoformat()
+            except ValueError:
+                timestamp = None
+        fields.update(
+            timestamp=timestamp,
+            hostname=_nil(match["hostname"]),
+            app_name=_nil(match["app_name"]),
+            procid=_nil(match["procid"]),
+            message=match["message"].removeprefix("\ufeff"),  # BOM marks UTF-8 MSG
+        )
+        return fields
+
+    match = _RFC3164.match(rest)
+    if match:
+        fields.update(
+            timestamp=_bsd_timestamp(match["timestamp"], now),
+            hostname=match["hostname"],
+            app_name=match["app_name"],
+            procid=match["procid"],
+            message=match["message"],
+        )
+    else:
+        fields["message"] = rest
+    return fields
+
+
+def source_for(app_name: str | None, message: str, detect) -> str:
+    """
+    Normalization source for a syslog message: the program name when it is
+    one we parse, else `detect(message)` (NormalizationService.detect_source),
+    else the program name itself.
+    """
+    if app_name:
+        source = PROGRAM_SOURCES.get(app_name.lower())
+        if source:
+            return source
+    source = detect(message)
+    if source == "raw_ingest" and app_name:
+        return app_name
+    return source
@@ -0,0 +1,321 @@
+"""
+Online log template mining for messages no parser recognises (Drain: He et
+al., "Drain: An Online Log Parsing Approach with Fixed Depth Tree", 2017).
+
+A message is split on whitespace and walked down a fixed-depth prefix tree:
+
+    (source, token count) -> first token -> ... -> TEMPLATES_DEPTH-th token -> templates
+
+so it is only compared with templates of its own source and length that
+start the same way. Tokens containing a digit are treated as parameters up
+front (`<*>`) and never branch the tree. In the leaf, the most similar
+template (share of positions that agree, parameters agreeing with anything)
+absorbs the message if the similarity reaches TEMPLATES_SIMILARITY; the
+positions that differ become parameters. Otherwise the message starts a new
+template. A node with TEMPLATES_MAX_CHILDREN children sends new tokens down
+its `<*>` child instead. Once TEMPLATES_MAX templates exist, messages no
+template matches are left untemplated and add nothing to the tree.
+
+`source` is client-supplied, so trees (and Redis keys) are kept for the
+parser library's sources plus the first TEMPLATES_MAX_SOURCES others seen
+(truncated to 64 characters); later sources share the "other" tree.
+
+Events get `template_id`, `template_params` (the message tokens at the
+template's parameter positions) and `template_rarity` (1.0 for a template
+seen once, falling with the log of its count), which the ML detector uses
+as a feature.
+
+Templates are written behind to Redis every TEMPLATES_FLUSH_SECONDS:
+
+    log_templates                 hash  id -> {"source", "template", "path"}
+    log_templates:top:{source}    zset  id -> events seen, fleet-wide
+    log_templates:sources         set   sources with templates
+
+Workers load them at startup, so IDs survive restarts and processes that
+start after the first flush share them. Processes mining concurrently may
+still give one format two IDs until their next restart: an ID is a hash of
+the source and the message that created the template.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from app.core import codec, metrics
+from app.core.config import settings
+from app.models.event import Event
+from app.services.normalization import normalization_service
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "<*>"
+OTHER_SOURCE = "other"
+MAX_SOURCE_LENGTH = 64
+TEMPLATES_KEY = "log_templates"
+SOURCES_KEY = "log_templates:sources"
+_DIGIT = re.compile(r'\d')
+
+
+def top_key(source: str) -> str:
+    return f"log_templates:top:{source}"
+
+
+class Template:
+    __slots__ = ("id", "source", "tokens", "path", "count", "params")
+
+    def __init__(self, template_id: str, source: str, tokens: List[str], path: List[str], count: int = 0):
+        self.id = template_id
+        self.source = source
+        self.tokens = tokens
+        self.path = path  # tree route it was created under (may differ from tokens once generalized)
+        self.count = count
+        self._index_params()
+
+    def _index_params(self):
+        self.params = [i for i, token in enumerate(self.tokens) if token == WILDCARD]
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    @property
+    def rarity(self) -> float:
+        """1.0 for a template seen once, falling with the log of its count."""
+        return round(1.0 / (1.0 + math.log2(max(self.count, 1))), 3)
+
+    def similarity(self, masked: List[str]) -> float:
+        same = 0
+        for token, other in zip(self.tokens, masked):
+            if token == other or token == WILDCARD:
+                same += 1
+        return same / len(masked)
+
+    def absorb(self, masked: List[str]) -> bool:
+        """Turn the positions where `masked` differs into parameters; True if the template changed."""
+        changed = False
+        for i, (token, other) in enumerate(zip(self.tokens, masked)):
+            if token != other and token != WILDCARD:
+                self.tokens[i] = WILDCARD
+                changed = True
+        if changed:
+            self._index_params()
+        return changed
+
+
+def _mask(token: str) -> str:
+    return WILDCARD if _DIGIT.search(token) else token
+
+
+def _template_id(source: str, masked: List[str]) -> str:
+    return hashlib.blake2b(f"{source}\x1f{' '.join(masked)}".encode(), digest_size=6).hexdigest()
+
+
+class TemplateMiner:
+    def __init__(self, client=None):
+        self.redis = client or redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.enabled = settings.TEMPLATES_ENABLED
+        self.depth = max(1, settings.TEMPLATES_DEPTH)
+        self.similarity = settings.TEMPLATES_SIMILARITY
+        self.max_children = settings.TEMPLATES_MAX_CHILDREN
+        self.max_templates = settings.TEMPLATES_MAX
+        self.max_sources = settings.TEMPLATES_MAX_SOURCES
+        self._sources: set = set()  # sources with their own tree, besides the parser library's
+        self._lock = threading.RLock()
+        # (source, token count) -> nested {token: child}; the last level holds template lists
+        self._root: Dict[tuple, Any] = {}
+        self.templates: Dict[str, Template] = {}
+        # Write-behind buffers
+        self._changed: set = set()  # ids whose template text must be (re)written
+        self._counts: Dict[str, int] = {}  # id -> events since the last flush
+        self._flushed_at = time.monotonic()
+
+    # ---- mining ----
+
+    def source_bucket(self, source: str) -> str:
+        """The tree a source's messages are mined in (its own, or the shared "other")."""
+        source = source[:MAX_SOURCE_LENGTH]
+        if source in self._sources or source in normalization_service.library.by_source:
+            return source
+        if len(self._sources) < self.max_sources:
+            self._sources.add(source)
+            return source
+        return OTHER_SOURCE
+
+    def _leaf(self, source: str, length: int, path: List[str], create: bool = True) -> tuple:
+        """
+        (template list, route taken) for the first tokens of a `length`-token
+        message. Without `create`, the list is None where the route does not exist yet.
+        """
+        node = self._root.get((source, length))
+        if node is None:
+            if not create:
+                return None, []
+            node = self._root[(source, length)] = {}
+        route = []
+        for i, token in enumerate(path):
+            child = node.get(token)
+            if child is None:
+                if token != WILDCARD and len(node) >= self.max_children:
+                    token = WILDCARD
+                    child = node.get(token)
+                if child is None:
+                    if not create:
+                        return None, route
+                    child = node[token] = [] if i == len(path) - 1 else {}
+            route.append(token)
+            node = child
+        return node, route
+
+    def mine(self, message: str, source: str) -> Optional[tuple]:
+        """(template, params) for a message; None if it is empty or TEMPLATES_MAX is reached."""
+        tokens = message.split()
+        if not tokens:
+            return None
+        masked = [_mask(token) for token in tokens]
+        with self._lock:
+            source = self.source_bucket(source)
+            # At TEMPLATES_MAX only existing templates can match; the tree must not grow
+            full = len(self.templates) >= self.max_templates
+            leaf, route = self._leaf(source, len(masked), masked[:self.depth], create=not full)
+            best, best_similarity = None, -1.0
+            for template in leaf or ():
+                similarity = template.similarity(masked)
+                if similarity > best_similarity:
+                    best, best_similarity = template, similarity
+            if best is not None and best_similarity >= self.similarity:
+                if best.absorb(masked):
+                    self._changed.add(best.id)
+                metrics.TEMPLATE_EVENTS.inc(result="matched")
+            elif full:
+                metrics.TEMPLATE_EVENTS.inc(result="full")
+                return None
+            else:
+                best = Template(_template_id(source, masked), source, masked, route)
+                leaf.append(best)
+                self.templates[best.id] = best
+                self._changed.add(best.id)
+                metrics.TEMPLATE_EVENTS.inc(result="created")
+            best.count += 1
+            self._counts[best.id] = self._counts.get(best.id, 0) + 1
+            return best, [tokens[i] for i in best.params]
+
+    def process_event(self, log_entry: Event):
+        """Template an event that normalization left unparsed."""
+        if not self.enabled or not log_entry.message:
+            return
+        mined = self.mine(log_entry.message, str(log_entry.source or "unknown"))
+        if mined is None:
+            return
+        template, params = mined
+        log_entry.template_id = template.id
+        log_entry.template_params = params
+        log_entry.template_rarity = template.rarity
+
+    # ---- persistence ----
+
+    def load(self) -> int:
+        """Read the persisted templates into the tree. Returns how many were added."""
+        if not self.enabled:
+            return 0
+        try:
+            stored = {template_id: codec.loads(raw) for template_id, raw in self.redis.hgetall(TEMPLATES_KEY).items()}
+            sources = {entry["source"] for entry in stored.values()}
+            pipe = self.redis.pipeline(transaction=False)
+            for source in sources:
+                pipe.zrange(top_key(source), 0, -1, withscores=True)
+            counts = {}
+            for scores in pipe.execute():
+                counts.update(scores)
+        except Exception as e:
+            logger.error(f"Could not load log templates: {e}")
+            return 0
+
+        added = 0
+        with self._lock:
+            for template_id, entry in stored.items():
+                if template_id in self.templates or len(self.templates) >= self.max_templates:
+                    continue
+                tokens = entry["template"].split()
+                path = entry.get("path") or tokens[:self.depth]
+                if entry["source"] != OTHER_SOURCE and entry["source"] not in normalization_service.library.by_source:
+                    self._sources.add(entry["source"])
+                leaf, route = self._leaf(entry["source"], len(tokens), path[:self.depth])
+                template = Template(template_id, entry["source"], tokens, route, int(counts.get(template_id, 0)))
+                leaf.append(template)
+                self.templates[template_id] = template
+                added += 1
+        logger.info(f"Loaded {added} log templates")
+        return added
+
+    def maybe_flush(self) -> int:
+        if time.monotonic() - self._flushed_at < settings.TEMPLATES_FLUSH_SECONDS:
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """Write new and generalized templates and the count deltas in one pipeline."""
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            changed, counts = self._changed, self._counts
+            if not (changed or counts):
+                return 0
+            self._changed, self._counts = set(), {}
+            # Snapshot under the lock; the round-trip happens without it so mining never waits on Redis
+            texts = {
+                template_id: codec.dumps({
+                    "source": self.templates[template_id].source,
+                    "template": self.templates[template_id].text,
+                    "path": self.templates[template_id].path,
+                })
+                for template_id in changed
+            }
+            sources = {template_id: self.templates[template_id].source for template_id in changed | counts.keys()}
+
+        pipe = self.redis.pipeline(transaction=False)
+        if texts:
+            pipe.hset(TEMPLATES_KEY, mapping=texts)
+            pipe.sadd(SOURCES_KEY, *{sources[template_id] for template_id in texts})
+        for template_id, count in counts.items():
+            pipe.zincrby(top_key(sources[template_id]), count, template_id)
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Template flush failed, will retry: {e}")
+            with self._lock:
+                self._changed |= changed
+                for template_id, count in counts.items():
+                    self._counts[template_id] = self._counts.get(template_id, 0) + count
+            return 0
+        return len(texts) + len(counts)
+
+    # ---- queries ----
+
+    def top(self, source: Optional[str] = None, limit: int = 20) -> Dict[str, List[Dict[str, Any]]]:
+        """Most frequent templates per source (fleet-wide, as of the workers' last flush)."""
+        sources = [source] if source else sorted(self.redis.smembers(SOURCES_KEY))
+        pipe = self.redis.pipeline(transaction=False)
+        for name in sources:
+            pipe.zrevrange(top_key(name), 0, limit - 1, withscores=True)
+        ranked = dict(zip(sources, pipe.execute()))
+        ids = [template_id for scores in ranked.values() for template_id, _ in scores]
+        stored = dict(zip(ids, self.redis.hmget(TEMPLATES_KEY, ids))) if ids else {}
+
+        result = {}
+        for name, scores in ranked.items():
+            result[name] = [
+                {
+                    "template_id": template_id,
+                    "template": codec.loads(stored[template_id])["template"] if stored.get(template_id) else None,
+                    "count": int(count),
+                }
+                for template_id, count in scores
+            ]
+        return result
+
+
+template_miner = TemplateMiner()
@@ -0,0 +1,231 @@
+"""
+Syslog listener: network devices and hosts send straight into logs_stream,
+skipping HTTP, JWT auth and pydantic validation.
+
+    python -m app.syslog_server [--host 0.0.0.0] [--udp-port 5514] [--tcp-port 5514]
+
+  * UDP: one message per datagram.
+  * TCP: octet-counted (RFC 6587) or newline framing, detected per
+    connection from its first bytes.
+  * RFC 5424 and RFC 3164 headers are parsed; the program name picks the
+    source_type NormalizationService parses the message with.
+
+Received events wait in a bounded buffer (SYSLOG_BUFFER_SIZE) and are
+XADDed in pipelined batches of up to SYSLOG_BATCH_SIZE, at least every
+SYSLOG_FLUSH_MS. While the ingest backpressure signal is raised, or Redis is
+unreachable, the buffer stops draining: TCP senders are slowed by flow
+control and UDP datagrams that do not fit are dropped and counted in
+aegis_syslog_dropped_total.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from datetime import datetime
+
+from app.core import metrics
+from app.core.config import settings
+from app.services.backpressure import backpressure_guard
+from app.services.normalization import normalization_service
+from app.services.queue import queue_service
+from app.services.syslog import (
+    LEVELS,
+    is_octet_counted,
+    parse_syslog,
+    source_for,
+    split_lines,
+    split_octet_counted,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+)
+logger = logging.getLogger("aegis.syslog")
+
+NAME = f"syslog-{socket.gethostname()}-{os.getpid()}"
+METRICS_INTERVAL = 5  # seconds between snapshots for the API's /metrics
+RETRY_DELAY = 1  # seconds to wait after a failed or throttled push
+SHUTDOWN_TIMEOUT = 10  # seconds to keep flushing the buffer on SIGTERM
+
+
+def build_event(line: str, peer: str, transport: str) -> dict:
+    fields = parse_syslog(line)
+    message = fields["message"]
+    severity = fields["severity"]
+    metadata = {"source_ip": peer, "transport": transport, "raw_format": "syslog"}
+    for key in ("hostname", "app_name", "procid", "facility", "severity"):
+        if fields[key] is not None:
+            metadata[key] = fields[key]
+    return {
+        "timestamp": fields["timestamp"] or datetime.utcnow().isoformat(),
+        "level": LEVELS[severity] if severity is not None else "INFO",
+        "source": source_for(fields["app_name"], message, normalization_service.detect_source),
+        "message": message,
+        "metadata": metadata,
+    }
+
+
+class SyslogServer:
+    def __init__(self, buffer_size: int | None = None, batch_size: int | None = None):
+        self.buffer: asyncio.Queue = asyncio.Queue(buffer_size or settings.SYSLOG_BUFFER_SIZE)
+        self.batch_size = batch_size or settings.SYSLOG_BATCH_SIZE
+        self.flush_interval = settings.SYSLOG_FLUSH_MS / 1000
+        self.max_message = settings.SYSLOG_MAX_MESSAGE_BYTES
+
+    # ---- receive ----
+
+    def _decode(self, raw: bytes, peer: str, transport: str) -> dict | None:
+        if len(raw) > self.max_message:
+            metrics.SYSLOG_DROPPED.inc(reason="oversize")
+            return None
+        metrics.SYSLOG_RECEIVED.inc(transport=transport)
+        return build_event(raw.decode("utf-8", errors="replace"), peer, transport)
+
+    def offer(self, raw: bytes, peer: str, transport: str):
+        """Non-blocking enqueue (UDP): drop and count when the buffer is full."""
+        event = self._decode(raw, peer, transport)
+        if event is None:
+            return
+        try:
+            self.buffer.put_nowait(event)
+        except asyncio.QueueFull:
+            metrics.SYSLOG_DROPPED.inc(reason="buffer_full")
+
+    async def put(self, raw: bytes, peer: str, transport: str):
+        """Blocking enqueue (TCP): a full buffer pauses reading from the socket."""
+        event = self._decode(raw, peer, transport)
+        if event is not None:
+            await self.buffer.put(event)
+
+    async def handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")[0]
+        pending = b""
+        octet_counted = None
+        discarding = False  # inside an over-long line, up to its newline
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                pending += chunk
+                if octet_counted is None:
+                    if len(pending) < 11 and b" " not in pending and b"\n" not in pending:
+                        continue  # not enough bytes to tell the framing yet
+                    octet_counted = is_octet_counted(pending)
+
+                if octet_counted:
+                    frames, pending = split_octet_counted(pending)
+                else:
+                    *frames, pending = pending.split(b"\n")
+                    if discarding and frames:
+                        frames, discarding = frames[1:], False
+                    frames = [frame.rstrip(b"\r") for frame in frames if frame.strip()]
+                for frame in frames:
+                    await self.put(frame, peer, "tcp")
+
+                if len(pending) > self.max_message + 10:
+                    # An over-long line, or a frame we can no longer resync on
+                    metrics.SYSLOG_DROPPED.inc(reason="oversize")
+                    if octet_counted:
+                        break
+                    pending, discarding = b"", True
+            if discarding:
+                pending = b""
+            for frame in split_lines(pending):
+                await self.put(frame, peer, "tcp")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # ---- flush ----
+
+    async def _next_batch(self) -> list[dict]:
+        batch = [await self.buffer.get()]
+        if self.buffer.qsize() < self.batch_size - 1:
+            await asyncio.sleep(self.flush_interval)
+        while len(batch) < self.batch_size and not self.buffer.empty():
+            batch.append(self.buffer.get_nowait())
+        return batch
+
+    async def flush_loop(self):
+        while True:
+            batch = await self._next_batch()
+            while True:
+                if await backpressure_guard.current():
+                    await asyncio.sleep(RETRY_DELAY)
+                    continue
+                queued = await queue_service.apush_logs(batch)
+                if queued:
+                    break
+                logger.warning(f"Could not queue {len(batch)} syslog events, retrying")
+                await asyncio.sleep(RETRY_DELAY)
+            metrics.INGESTED.inc(queued, route="syslog")
+            if queued < len(batch):
+                metrics.SYSLOG_DROPPED.inc(len(batch) - queued, reason="redis")
+            for _ in batch:
+                self.buffer.task_done()
+
+    async def metrics_loop(self):
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            metrics.SYSLOG_BUFFERED.set(self.buffer.qsize())
+            try:
+                await asyncio.to_thread(metrics.publish_snapshot, queue_service.redis, NAME)
+            except Exception as e:
+                logger.error(f"publish_metrics error: {e}")
+
+    async def serve(self, host: str, udp_port: int, tcp_port: int):
+        """Listen until SIGTERM / SIGINT, then stop accepting and flush what is buffered."""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        listeners = []
+        if udp_port:
+            transport, _protocol = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self), local_addr=(host, udp_port), reuse_port=True
+            )
+            listeners.append(transport)
+            logger.info(f"Syslog UDP listening on {host}:{udp_port}")
+        if tcp_port:
+            listeners.append(await asyncio.start_server(self.handle_tcp, host, tcp_port, reuse_port=True))
+            logger.info(f"Syslog TCP listening on {host}:{tcp_port}")
+        tasks = [asyncio.create_task(self.flush_loop()), asyncio.create_task(self.metrics_loop())]
+
+        await stop.wait()
+        for listener in listeners:
+            listener.close()
+        try:
+            await asyncio.wait_for(self.buffer.join(), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutting down with {self.buffer.qsize()} syslog events unflushed")
+        for task in tasks:
+            task.cancel()
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: SyslogServer):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr):
+        # Some relays pack several newline-separated messages into one datagram
+        for line in split_lines(data):
+            self.server.offer(line, addr[0], "udp")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Aegis syslog listener (UDP/TCP)")
+    parser.add_argument("--host", default=settings.SYSLOG_HOST)
+    parser.add_argument("--udp-port", type=int, default=settings.SYSLOG_UDP_PORT, help="0 disables UDP")
+    parser.add_argument("--tcp-port", type=int, default=settings.SYSLOG_TCP_PORT, help="0 disables TCP")
+    args = parser.parse_args(argv)
+    asyncio.run(SyslogServer().serve(args.host, args.udp_port, args.tcp_port))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,35 @@
 """
 Background worker: reads from the Redis Stream, runs the full pipeline,
 publishes results to the Redis pub/sub channel, and enforces iptables blocks.
+
+Run a single consumer:          python -m app.worker
+Run a supervised process pool:  python -m app.worker --processes 4
+
+With STREAM_PARTITIONS > 0 each worker consumes only the logs_stream:{i}
+partitions it currently owns (see app/services/partitions.py).
 """
 import redis
-import json
 import time
 import subprocess
 import logging
 import os
+import argparse
+import contextlib
+import multiprocessing
+import signal
+import socket
+import sys
+from app import dlq
+from app.core import codec, metrics
 from app.core.config import settings
+from app.models.event import Event
+from app.services.backpressure import BackpressureMonitor
+from app.services.partitions import PartitionCoordinator, stream_names
+from app.services.retention import StreamRetention
+from app.services.state_cache import state_cache
 from app.services.storage import storage_service
 from app.services.normalization import normalization_service
+from app.services.templates import template_miner
 from app.services.enrichment import enrichment_service
 from app.services.detection_rules import rule_detector
 from app.services.detection_ml import ml_detector
@@ -23,10 +42,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger("aegis.worker")
 
-r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+r = redis.Redis.from_url(
+    settings.REDIS_URL, decode_responses=True, encoding_errors=codec.REDIS_ENCODING_ERRORS
+)
 STREAM_KEY = "logs_stream"
 GROUP_NAME = "ingest_group"
-CONSUMER_NAME = "worker_1"
+# Every stream the group reads: logs_stream, or its partitions when sharded
+ALL_STREAMS = stream_names(STREAM_KEY, settings.STREAM_PARTITIONS)
+
+
+def make_consumer_name() -> str:
+    """Unique per process so replicas never share a consumer identity."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+CONSUMER_NAME = make_consumer_name()
 PUBSUB_CHANNEL = "aegis:feed"
 
 # Whether the host supports iptables (set NET_ADMIN cap in Docker)
@@ -97,116 +127,684 @@ def sync_iptables_blocks():
 # ---------------------------------------------------------------------------
 
 def create_consumer_group():
+    for stream in ALL_STREAMS:
+        try:
+            r.xgroup_create(stream, GROUP_NAME, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+# ---------------------------------------------------------------------------
+# Partition ownership (STREAM_PARTITIONS > 0)
+# ---------------------------------------------------------------------------
+
+coordinator: PartitionCoordinator | None = None
+
+
+def consumed_streams() -> list[str]:
+    """Streams this process reads right now."""
+    if coordinator is None:
+        return [STREAM_KEY]
+    return coordinator.streams()
+
+
+def heartbeat_partitions():
+    if coordinator is None:
+        return
     try:
-        r.xgroup_create(STREAM_KEY, GROUP_NAME, id="0", mkstream=True)
-    except redis.exceptions.ResponseError as e:
-        if "BUSYGROUP" not in str(e):
-            raise
+        coordinator.heartbeat()
+    except Exception as e:
+        logger.error(f"Partition heartbeat error: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Pending-entry reclaim (failed / orphaned messages)
+# ---------------------------------------------------------------------------
+
+RECLAIM_COUNT = 100  # pending entries inspected per reclaim pass
+# stream -> PEL id the next pass resumes from, so a long PEL is covered over
+# several passes instead of rescanning its (possibly not yet idle) head
+_reclaim_cursor: dict[str, str] = {}
+
+
+def reclaim_pending():
+    """
+    Re-deliver messages that have sat in the PEL longer than WORKER_RECLAIM_IDLE_MS
+    (failed processing, or their consumer died before XACK). Messages delivered
+    WORKER_MAX_DELIVERIES times are moved to the dead-letter stream instead.
+    Reclaimed messages are processed one at a time so a poison message can't
+    take a whole batch down with it.
+    """
+    for stream in consumed_streams():
+        _reclaim_stream(stream)
+
+
+def _reclaim_stream(stream: str):
+    idle = settings.WORKER_RECLAIM_IDLE_MS
+    start = _reclaim_cursor.get(stream, "0-0")
+    try:
+        pending = r.xpending_range(
+            stream, GROUP_NAME, min=start, max="+", count=RECLAIM_COUNT, idle=idle
+        )
+        poison = [
+            (p["message_id"], p["times_delivered"])
+            for p in pending
+            if p["times_delivered"] >= settings.WORKER_MAX_DELIVERIES
+        ]
+        dlq.dead_letter(r, GROUP_NAME, poison, stream)
+
+        next_id, claimed, *_deleted = r.xautoclaim(
+            stream, GROUP_NAME, CONSUMER_NAME, idle, start_id=start, count=RECLAIM_COUNT
+        )
+        _reclaim_cursor[stream] = next_id  # "0-0" once the scan reached the end of the PEL
+        if claimed:
+            logger.info(f"Reclaimed {len(claimed)} pending message(s) from '{stream}'")
+        for message_id, message_data in claimed:
+            if _handle_message(message_id, message_data or {}, stream):
+                r.xack(stream, GROUP_NAME, message_id)
+                r.hdel(dlq.FAILURES_KEY, dlq.failure_field(message_id, stream))
+    except Exception as e:
+        logger.error(f"reclaim_pending error on '{stream}': {e}")
 
 
 # ---------------------------------------------------------------------------
 # Main processing loop
 # ---------------------------------------------------------------------------
 
+IPTABLES_SYNC_INTERVAL = 30  # seconds
+METRICS_PUBLISH_INTERVAL = 5  # seconds
+LAG_REFRESH_INTERVAL = 1  # seconds
+_last_run = {
+    "iptables": 0.0, "reclaim": 0.0, "metrics": 0.0, "lag": 0.0, "retention": 0.0, "partitions": 0.0,
+}
+
+
+class AdaptiveReadSizer:
+    """
+    Picks the XREADGROUP COUNT from consumer-group lag: small reads while the
+    stream is caught up, growing up to `maximum` as a backlog builds so a
+    backlog is drained in fewer round-trips.
+    """
+
+    def __init__(self, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.lag: int | None = None  # None when the server does not report lag
+        self.backlog = 0  # lag, or XLEN as a rough stand-in on Redis < 7
+
+    def refresh(self):
+        """Total lag over the streams this process reads."""
+        lag, backlog = 0, 0
+        try:
+            for stream in consumed_streams():
+                stream_lag = None
+                for group in r.xinfo_groups(stream):
+                    if group["name"] == GROUP_NAME:
+                        stream_lag = group.get("lag")
+                if stream_lag is None:
+                    lag = None
+                    backlog += r.xlen(stream)
+                else:
+                    lag = None if lag is None else lag + stream_lag
+                    backlog += stream_lag
+            self.lag, self.backlog = lag, backlog
+        except Exception as e:
+            logger.debug(f"Lag refresh failed: {e}")
+
+    def size(self, maximum: int | None = None) -> int:
+        return max(self.minimum, min(maximum or self.maximum, self.backlog))
+
+
+read_sizer = AdaptiveReadSizer(settings.WORKER_READ_COUNT_MIN, settings.WORKER_READ_COUNT_MAX)
+backpressure = BackpressureMonitor(r)
+retentions = [
+    StreamRetention(r, stream, settings.RETENTION_MAX_LEN // len(ALL_STREAMS))
+    for stream in ALL_STREAMS
+]
+
+
+def run_housekeeping():
+    """Periodic tasks shared by both processing loops."""
+    now = time.time()
+    state_cache.maybe_flush()
+    template_miner.maybe_flush()
+    normalization_service.maybe_reload()
+    if coordinator and now - _last_run["partitions"] > coordinator.ttl / 3:
+        heartbeat_partitions()
+        _last_run["partitions"] = now
+    # Periodic iptables sync (Phase 4)
+    if IPTABLES_ENABLED and now - _last_run["iptables"] > IPTABLES_SYNC_INTERVAL:
+        sync_iptables_blocks()
+        _last_run["iptables"] = now
+    if now - _last_run["reclaim"] > settings.WORKER_RECLAIM_INTERVAL_SECONDS:
+        reclaim_pending()
+        _last_run["reclaim"] = now
+    if now - _last_run["metrics"] > METRICS_PUBLISH_INTERVAL:
+        publish_metrics()
+        _last_run["metrics"] = now
+    if now - _last_run["lag"] > LAG_REFRESH_INTERVAL:
+        read_sizer.refresh()
+        try:
+            backpressure.evaluate(read_sizer.lag)
+        except Exception as e:
+            logger.error(f"Backpressure signal error: {e}")
+        _last_run["lag"] = now
+    if now - _last_run["retention"] > settings.RETENTION_INTERVAL_SECONDS:
+        for retention in retentions:
+            try:
+                retention.run()
+            except Exception as e:
+                logger.error(f"Stream retention error on '{retention.stream}': {e}")
+        _last_run["retention"] = now
+
+
+def publish_metrics():
+    """Sample stream lag / PEL size and push this process's snapshot for the API."""
+    try:
+        normalization_service.publish_metrics()
+        metrics.update_stream_gauges(r, ALL_STREAMS)
+        metrics.publish_snapshot(r, CONSUMER_NAME)
+    except Exception as e:
+        logger.error(f"publish_metrics error: {e}")
+
+
+def _decode(message_id: str, message_data: dict, stream: str = STREAM_KEY) -> Event | None:
+    """Decode a stream message. Undecodable messages go straight to the DLQ."""
+    try:
+        return Event(codec.decode_entry(message_data))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Undecodable message {message_id}: {e}")
+        dlq.record_failure(r, message_id, f"decode: {e}", stream)
+        dlq.dead_letter(r, GROUP_NAME, [(message_id, 1)], stream)
+        return None
+
+
+def _handle_message(message_id: str, message_data: dict, stream: str = STREAM_KEY) -> bool:
+    """
+    Process one message. Returns True if it can be acked; on failure the error
+    is recorded and the message stays pending for reclaim_pending().
+    """
+    if not message_data.get("data"):
+        return True
+
+    log_entry = _decode(message_id, message_data, stream)
+    if log_entry is None:
+        return False  # already dead-lettered and acked
+
+    try:
+        _process_single(log_entry)
+        return True
+    except Exception as e:
+        logger.error(f"Processing error for {message_id}: {e}")
+        dlq.record_failure(r, message_id, e, stream)
+        return False
+
+
+def _wait_for_partitions() -> bool:
+    """Idle while this process owns no partition (more workers than partitions)."""
+    if coordinator is not None and not coordinator.owned:
+        time.sleep(settings.WORKER_READ_BLOCK_MS / 1000)
+        return True
+    return False
+
+
 def process_messages():
     logger.info(f"Worker {CONSUMER_NAME} started on stream '{STREAM_KEY}'…")
     create_consumer_group()
-
-    last_iptables_sync = time.time()
-    IPTABLES_SYNC_INTERVAL = 30  # seconds
+    _last_run["iptables"] = time.time()
 
     while True:
         try:
-            # Periodic iptables sync (Phase 4)
-            if IPTABLES_ENABLED and time.time() - last_iptables_sync > IPTABLES_SYNC_INTERVAL:
-                sync_iptables_blocks()
-                last_iptables_sync = time.time()
+            run_housekeeping()
+            if _wait_for_partitions():
+                continue
 
             entries = r.xreadgroup(
-                GROUP_NAME, CONSUMER_NAME, {STREAM_KEY: ">"}, count=10, block=2000
+                GROUP_NAME, CONSUMER_NAME, {stream: ">" for stream in consumed_streams()},
+                count=read_sizer.size(), block=settings.WORKER_READ_BLOCK_MS,
             )
 
             if not entries:
                 continue
 
-            for _stream, messages in entries:
+            for stream, messages in entries:
                 for message_id, message_data in messages:
-                    raw_json = message_data.get("data")
-                    if not raw_json:
-                        r.xack(STREAM_KEY, GROUP_NAME, message_id)
-                        continue
+                    if _handle_message(message_id, message_data, stream):
+                        r.xack(stream, GROUP_NAME, message_id)
+
+        except Exception as e:
+            logger.error(f"Worker loop error: {e}")
+            time.sleep(1)
+
+
+def _read_batch(batch_size: int, linger: float) -> list:
+    """
+    Read up to batch_size (stream, message_id, message_data) triples. After the
+    first message arrives, keep reading for at most `linger` seconds to let the
+    batch fill up. With several streams, COUNT applies per stream, so the
+    result can exceed batch_size by a few reads' worth.
+    """
+    streams = {stream: ">" for stream in consumed_streams()}
+    entries = r.xreadgroup(
+        GROUP_NAME, CONSUMER_NAME, streams,
+        count=batch_size, block=settings.WORKER_READ_BLOCK_MS,
+    )
+    messages = [(stream, *m) for stream, msgs in entries or [] for m in msgs]
+    if not messages:
+        return messages
+
+    deadline = time.monotonic() + linger
+    while len(messages) < batch_size:
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:  # block=0 would mean "wait forever"
+            break
+        entries = r.xreadgroup(
+            GROUP_NAME, CONSUMER_NAME, streams,
+            count=batch_size - len(messages), block=remaining_ms,
+        )
+        if not entries:
+            break
+        messages.extend((stream, *m) for stream, msgs in entries for m in msgs)
+    return messages
+
+
+def process_batches():
+    """
+    Batch-at-a-time variant of process_messages (WORKER_MODE=batch).
+    The batch size adapts to lag between WORKER_READ_COUNT_MIN and WORKER_BATCH_SIZE.
+    """
+    batch_size = max(settings.WORKER_READ_COUNT_MIN, settings.WORKER_BATCH_SIZE)
+    linger = settings.WORKER_BATCH_LINGER_MS / 1000
+    logger.info(
+        f"Worker {CONSUMER_NAME} started on stream '{STREAM_KEY}' in batch mode "
+        f"(size<={batch_size}, linger={settings.WORKER_BATCH_LINGER_MS}ms)…"
+    )
+    create_consumer_group()
+    _last_run["iptables"] = time.time()
+
+    while True:
+        try:
+            run_housekeeping()
+            if _wait_for_partitions():
+                continue
 
-                    log_entry = json.loads(raw_json)
+            messages = _read_batch(read_sizer.size(batch_size), linger)
+            if not messages:
+                continue
 
-                    try:
-                        _process_single(log_entry)
-                    except Exception as e:
-                        logger.error(f"Processing error for {message_id}: {e}")
+            ids, log_entries = [], []
+            for stream, message_id, message_data in messages:
+                if not message_data.get("data"):
+                    r.xack(stream, GROUP_NAME, message_id)
+                    continue
+                log_entry = _decode(message_id, message_data, stream)
+                if log_entry is not None:
+                    ids.append((stream, message_id))
+                    log_entries.append(log_entry)
+
+            try:
+                _process_batch(log_entries)
+            except Exception as e:
+                # Leave the whole batch pending: reclaim_pending() retries the
+                # messages one by one and dead-letters the ones that keep failing.
+                logger.error(f"Batch processing error ({len(log_entries)} events): {e}")
+                pipe = r.pipeline(transaction=False)
+                for stream, message_id in ids:
+                    dlq.record_failure(pipe, message_id, e, stream)
+                pipe.execute()
+                continue
 
-                    r.xack(STREAM_KEY, GROUP_NAME, message_id)
+            ack_ids(ids)
 
         except Exception as e:
             logger.error(f"Worker loop error: {e}")
             time.sleep(1)
 
 
-def _process_single(log_entry: dict):
-    # 1. Normalize
-    extracted = normalization_service.parse_log(
-        log_entry.get("message", ""), log_entry.get("source", "")
-    )
-    if extracted:
-        log_entry.update(extracted)
+def ack_ids(ids: list[tuple[str, str]]):
+    """XACK (stream, message_id) pairs: one XACK per stream, in one round-trip."""
+    by_stream: dict[str, list[str]] = {}
+    for stream, message_id in ids:
+        by_stream.setdefault(stream, []).append(message_id)
+    if not by_stream:
+        return
+    pipe = r.pipeline(transaction=False)
+    for stream, stream_ids in by_stream.items():
+        pipe.xack(stream, GROUP_NAME, *stream_ids)
+    pipe.execute()
 
-    # 2. Enrich
-    enrichment_service.enrich_log(log_entry)
 
-    # 3. Rule-based detection
-    alerts, rule_severity = rule_detector.check_rules(log_entry)
+# ---------------------------------------------------------------------------
+# Pipeline stages
+# ---------------------------------------------------------------------------
+
+def _apply_rules(log_entry: Event, alerts: list, rule_severity: str):
     if alerts:
-        log_entry["alerts"] = alerts
-        log_entry["severity"] = rule_severity
+        log_entry.alerts = alerts
+        log_entry.severity = rule_severity
         logger.info(f"ALERT: {alerts} (Severity: {rule_severity})")
 
-    # 4. ML detection
-    anomaly_result = ml_detector.predict(log_entry)
-    log_entry["anomaly_score"] = anomaly_result["score"]
-    log_entry["anomaly_explanation"] = anomaly_result["explanation"]
+
+def _apply_anomaly(log_entry: Event, anomaly_result: dict):
+    log_entry.anomaly_score = anomaly_result["score"]
+    log_entry.anomaly_explanation = anomaly_result["explanation"]
 
     if anomaly_result["score"] > 0.7:
-        log_entry["ml_anomaly"] = True
-        log_entry.setdefault("alerts", []).append(
-            f"ML Detection: {anomaly_result['explanation']}"
-        )
+        log_entry.ml_anomaly = True
+        log_entry.add_alert(f"ML Detection: {anomaly_result['explanation']}")
         logger.info(f"ML ANOMALY: {anomaly_result['explanation']}")
 
-    # 5. Correlation
-    incidents = correlation_service.process_event(log_entry) or []
-    if incidents:
-        log_entry.setdefault("incidents", []).extend(incidents)
-        log_entry["severity"] = "CRITICAL"
-        logger.warning(f"INCIDENT: {incidents}")
 
-    # 6. Automated response (Redis block + optional iptables)
-    resp_result = response_service.evaluate(log_entry)
+def _apply_response(log_entry: Event, resp_result: dict | None, client=None):
+    """Record the response decision and enforce iptables blocks if enabled."""
     if resp_result:
-        log_entry["response_action"] = resp_result
+        log_entry.response_action = resp_result
         if resp_result.get("action") == "block" and IPTABLES_ENABLED:
-            ip = log_entry.get("ip") or log_entry.get("metadata", {}).get("ip")
+            ip = log_entry.ip
             if ip:
                 iptables_block(ip)
-                r.sadd("iptables:blocked", ip)
+                (client or r).sadd("iptables:blocked", ip)
+
+
+MAX_SOURCE_LABELS = 50  # bound metric cardinality; `source` is client-supplied
+_source_labels: set = set()
+
+
+def _source_label(log_entry: Event) -> str:
+    source = str(log_entry.source or "unknown")
+    if source in _source_labels:
+        return source
+    if len(_source_labels) < MAX_SOURCE_LABELS:
+        _source_labels.add(source)
+        return source
+    return "other"
+
+
+def record_outcome(log_entries: list, elapsed: float):
+    """Count processed events, alerts and incidents, and feed the EPS window."""
+    for log_entry in log_entries:
+        source = _source_label(log_entry)
+        metrics.EVENTS.inc(source=source)
+        if log_entry.alerts:
+            metrics.ALERTS.inc(len(log_entry.alerts), source=source)
+        if log_entry.incidents:
+            metrics.INCIDENTS.inc(len(log_entry.incidents), source=source)
+    metrics.STAGE_LATENCY.observe(elapsed / len(log_entries), count=len(log_entries), stage="total")
+    metrics.registry.window.record(len(log_entries), elapsed)
+
+
+def _process_single(log_entry: Event):
+    start = time.perf_counter()
+    stage = metrics.STAGE_LATENCY.time
+
+    # 1. Normalize; messages no parser recognises get a log template instead
+    with stage(stage="normalize"):
+        extracted = normalization_service.parse_log(log_entry.message, log_entry.source or "")
+        if extracted:
+            log_entry.update(extracted)
+    if not extracted:
+        with stage(stage="template"):
+            template_miner.process_event(log_entry)
+
+    # 2. Enrich
+    with stage(stage="enrich"):
+        enrichment_service.enrich_log(log_entry)
+
+    # 3. Rule-based detection
+    with stage(stage="rules"):
+        _apply_rules(log_entry, *rule_detector.check_rules(log_entry))
+
+    # 4. ML detection
+    with stage(stage="ml"):
+        _apply_anomaly(log_entry, ml_detector.predict(log_entry))
+
+    # 5. Correlation
+    with stage(stage="correlation"):
+        correlation_service.process_event(log_entry)
+    if log_entry.incidents:
+        logger.warning(f"INCIDENT: {log_entry.incidents}")
+
+    # 6. Automated response (Redis block + optional iptables)
+    with stage(stage="response"):
+        _apply_response(log_entry, response_service.evaluate(log_entry))
 
     # 7. Index to ES
-    storage_service.index_log(log_entry)
-    logger.debug(
-        f"Indexed: {log_entry.get('timestamp')} — {log_entry.get('message', '')[:80]}"
-    )
+    doc = log_entry.to_dict()
+    with stage(stage="index"):
+        with backpressure.track_index():
+            storage_service.index_log(doc)
+    logger.debug(f"Indexed: {doc.get('timestamp')} — {log_entry.message[:80]}")
 
     # 8. Publish to WebSocket pub/sub (Phase 3)
-    r.publish(PUBSUB_CHANNEL, json.dumps(log_entry, default=str))
+    with stage(stage="publish"):
+        r.publish(PUBSUB_CHANNEL, codec.dumps_bytes(doc))
 
+    record_outcome([log_entry], time.perf_counter() - start)
+
+
+def _process_batch(log_entries: list[Event]):
+    """
+    Same stages as _process_single, applied to a whole batch. Stateful stages
+    use their *_batch variants so Redis traffic is pipelined per stage, ES
+    gets a single _bulk request and feed publishes go out in one pipeline.
+    Stage timings are recorded per event (batch time / batch size).
+    """
+    if not log_entries:
+        return
+    start = time.perf_counter()
+    n = len(log_entries)
+    stage = metrics.STAGE_LATENCY.time
+
+    # 1. Normalize; messages no parser recognises get a log template instead
+    with stage(count=n, stage="normalize"):
+        parsed = normalization_service.parse_many(
+            [e.message for e in log_entries], [e.source or "" for e in log_entries]
+        )
+        unparsed = []
+        for log_entry, extracted in zip(log_entries, parsed.rows()):
+            if extracted:
+                log_entry.update(extracted)
+            else:
+                unparsed.append(log_entry)
+    if unparsed:
+        with stage(count=len(unparsed), stage="template"):
+            for log_entry in unparsed:
+                template_miner.process_event(log_entry)
+
+    # 2. Enrich
+    with stage(count=n, stage="enrich"):
+        for log_entry in log_entries:
+            enrichment_service.enrich_log(log_entry)
+
+    # 3. Rule-based detection
+    with stage(count=n, stage="rules"):
+        for log_entry, (alerts, rule_severity) in zip(
+            log_entries, rule_detector.check_rules_batch(log_entries)
+        ):
+            _apply_rules(log_entry, alerts, rule_severity)
+
+    # 4. ML detection
+    with stage(count=n, stage="ml"):
+        for log_entry, anomaly_result in zip(log_entries, ml_detector.predict_batch(log_entries)):
+            _apply_anomaly(log_entry, anomaly_result)
+
+    # 5. Correlation
+    with stage(count=n, stage="correlation"):
+        correlation_service.process_batch(log_entries)
+
+    # 6. Automated response
+    pipe = r.pipeline(transaction=False)
+    with stage(count=n, stage="response"):
+        for log_entry, resp_result in zip(log_entries, response_service.evaluate_batch(log_entries)):
+            _apply_response(log_entry, resp_result, client=pipe)
+
+    # 7. Bulk index to ES
+    docs = [log_entry.to_dict() for log_entry in log_entries]
+    with stage(count=n, stage="index"):
+        with backpressure.track_index():
+            storage_service.index_logs(docs)
+    logger.debug(f"Bulk indexed {n} logs")
+
+    # 8. Publish to WebSocket pub/sub, sharing the pipeline with iptables bookkeeping
+    with stage(count=n, stage="publish"):
+        for doc in docs:
+            pipe.publish(PUBSUB_CHANNEL, codec.dumps_bytes(doc))
+        pipe.execute()
+
+    record_outcome(log_entries, time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# Process pool supervisor
+# ---------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def worker_lifecycle(startup_delay: float = 0.0, slot: int = 0):
+    """
+    Setup and teardown for one worker process, whatever loop it runs (sync,
+    batch or async): consumer name, signals, partition coordinator, mined
+    templates and metrics endpoint; on exit, write-behind state and templates
+    are flushed and partitions released.
+    """
+    global CONSUMER_NAME, coordinator
+    CONSUMER_NAME = make_consumer_name()
+
+    # Forked children must not run the supervisor's signal handlers. Exit through
+    # the finally below so write-behind state and mined templates are flushed and
+    # partitions move without waiting for lease expiry.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+    if settings.STREAM_PARTITIONS:
+        coordinator = PartitionCoordinator(r, STREAM_KEY, CONSUMER_NAME)
+        # Local detection state is only valid for partitions we still own
+        coordinator.on_revoke.append(lambda _lost: state_cache.clear())
+
+    try:
+        # Stagger startup so N processes don't open connections and warm up at once
+        time.sleep(startup_delay)
+        template_miner.load()
+
+        # Each process in the pool serves its own registry on port + slot
+        if settings.WORKER_METRICS_PORT:
+            try:
+                metrics.serve(settings.WORKER_METRICS_PORT + slot)
+            except OSError as e:
+                logger.error(f"Metrics endpoint disabled: {e}")
+
+        yield
+    finally:
+        state_cache.flush()
+        template_miner.flush()
+        if coordinator is not None:
+            coordinator.leave()
+
+
+def run_worker(startup_delay: float = 0.0, slot: int = 0):
+    """Entry point for one worker process (also used directly when --processes=1)."""
+    with worker_lifecycle(startup_delay, slot):
+        if settings.WORKER_MODE == "async":
+            from app import async_worker
+            async_worker.run()
+        elif settings.WORKER_MODE == "batch":
+            process_batches()
+        else:
+            process_messages()
+
+
+def _forget_consumer(consumer: str):
+    """Drop a dead process's consumer from the group, unless it still owns pending entries."""
+    for stream in ALL_STREAMS:
+        try:
+            for info in r.xinfo_consumers(stream, GROUP_NAME):
+                if info["name"] == consumer and info["pending"] == 0:
+                    r.xgroup_delconsumer(stream, GROUP_NAME, consumer)
+        except Exception as e:
+            logger.error(f"Could not remove consumer {consumer} from '{stream}': {e}")
+
+
+def supervise(processes: int):
+    """
+    Fork `processes` workers, each with its own consumer name, and restart any
+    that exit. Restarts back off exponentially while a slot keeps crashing.
+    The parent imports the services once; children inherit the loaded model
+    via fork and create their own Redis/ES connections lazily.
+    """
+    ctx = multiprocessing.get_context("fork")
+    stagger = settings.WORKER_STARTUP_STAGGER_SECONDS
+    host = socket.gethostname()
+
+    children: dict[int, multiprocessing.Process] = {}
+    started_at: dict[int, float] = {}
+    crashes = [0] * processes
+    stopping = False
+
+    def spawn(slot: int, delay: float):
+        proc = ctx.Process(target=run_worker, args=(delay, slot), name=f"aegis-worker-{slot}")
+        proc.start()
+        children[slot] = proc
+        started_at[slot] = time.time()
+        logger.info(f"Supervisor: started worker slot {slot} as {host}-{proc.pid}")
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        logger.info(f"Supervisor: received signal {signum}, stopping {len(children)} workers")
+        for proc in children.values():
+            if proc.is_alive():
+                proc.terminate()
+
+    for slot in range(processes):
+        spawn(slot, slot * stagger)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for slot, proc in list(children.items()):
+            if stopping or proc.is_alive():
+                continue
+
+            # A worker that stayed up for a minute is considered healthy again
+            if time.time() - started_at[slot] > 60:
+                crashes[slot] = 0
+            crashes[slot] += 1
+            backoff = min(2 ** (crashes[slot] - 1), 60)
+
+            logger.error(
+                f"Supervisor: worker {host}-{proc.pid} (slot {slot}) exited with code "
+                f"{proc.exitcode}; restarting in {backoff}s"
+            )
+            _forget_consumer(f"{host}-{proc.pid}")
+            spawn(slot, backoff)
+
+    for proc in children.values():
+        proc.join(timeout=10)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Aegis stream worker")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=settings.WORKER_PROCESSES,
+        help="number of worker processes to run (0 = one per CPU core)",
+    )
+    args = parser.parse_args(argv)
+    processes = args.processes or os.cpu_count() or 1
+    if state_cache.local and processes > 1 and not settings.STREAM_PARTITIONS:
+        logger.warning(
+            "STATE_CONSISTENCY=local with several processes on one stream: per-IP state "
+            "will diverge between workers. Set STREAM_PARTITIONS to shard by entity."
+        )
 
-if __name__ == "__main__":
     time.sleep(5)  # Let ES/Redis warm up
-    process_messages()
+    if processes == 1:
+        run_worker()
+    else:
+        supervise(processes)
+
+
+if __name__ == "__main__":
+    main()
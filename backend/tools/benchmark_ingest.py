@@ -1,5 +1,7 @@
+import argparse
 import asyncio
 import aiohttp
+import gzip
 import time
 import json
 import uuid
@@ -15,6 +17,24 @@ TOTAL_LOGS = 10000
 # Number of concurrent connections/tasks
 CONCURRENCY = 200
 
+# Request body encoding: none | gzip | zstd (zstd needs the zstandard package)
+COMPRESSION = "none"
+
+
+def encode_payload(batch, compression):
+    """Serialize a batch once up front; returns (body, headers)."""
+    body = json.dumps(batch).encode()
+    headers = {"Content-Type": "application/json"}
+    if compression == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    elif compression == "zstd":
+        import zstandard
+
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        headers["Content-Encoding"] = "zstd"
+    return body, headers
+
 def generate_mock_log():
     return {
         "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -29,11 +49,12 @@ def generate_mock_log():
     }
 
 async def send_request(session, semaphore, url, payload, latencies):
+    body, headers = payload
     async with semaphore:
         start_time = time.perf_counter()
         try:
             # Setting a very short timeout since we're local and want to hammer it
-            async with session.post(url, json=payload, headers={"Content-Type": "application/json"}, timeout=5) as response:
+            async with session.post(url, data=body, headers=headers, timeout=5) as response:
                 status = response.status
                 # Read response to ensure it completed
                 await response.read() 
@@ -51,7 +72,7 @@ async def send_request(session, semaphore, url, payload, latencies):
 async def main():
     print(f"🚀 AEGIS SIEM Benchmark Test")
     print(f"Targeting: {API_URL}")
-    print(f"Total Logs: {TOTAL_LOGS} (Concurrency: {CONCURRENCY})")
+    print(f"Total Logs: {TOTAL_LOGS} (Concurrency: {CONCURRENCY}, Compression: {COMPRESSION})")
     print("...")
 
     # Semaphore limits concurrent connections to prevent overloading the local OS socket limit
@@ -72,18 +93,22 @@ async def main():
         batches.append(batch)
 
     num_requests = len(batches)
+    raw_bytes = sum(len(json.dumps(batch).encode()) for batch in batches)
+    payloads = [encode_payload(batch, COMPRESSION) for batch in batches]
+    wire_bytes = sum(len(body) for body, _headers in payloads)
     print(f"Testing {num_requests} requests of size {BATCH_SIZE}...")
 
     # Warmup (optional)
     # Allows FastAPI and Redis connections pool to initialize
     async with aiohttp.ClientSession() as session:
-        await session.post(API_URL, json=batches[0], headers={"Content-Type": "application/json"})
+        body, headers = payloads[0]
+        await session.post(API_URL, data=body, headers=headers)
 
     start_bulk = time.perf_counter()
 
     async with aiohttp.ClientSession() as session:
-        for batch in batches:
-            task = asyncio.create_task(send_request(session, semaphore, API_URL, batch, latencies))
+        for payload in payloads:
+            task = asyncio.create_task(send_request(session, semaphore, API_URL, payload, latencies))
             tasks.append(task)
             
         # Wait for all requests to finish
@@ -105,6 +130,9 @@ async def main():
     if failed_count > 0:
         print(f"Failed/Dropped:       {failed_count}")
     
+    print(f"Body Bytes Sent:      {wire_bytes / 1e6:,.2f} MB ({raw_bytes / 1e6:,.2f} MB uncompressed, "
+          f"ratio {raw_bytes / wire_bytes:.1f}x)")
+    print(f"Wire Throughput:      {wire_bytes / duration / 1e6:,.2f} MB/s")
     print("-" * 40)
     print(f"🔥 Throughput (EPS):  {eps:,.0f} Events/Second")
     print("-" * 40)
@@ -126,4 +154,10 @@ async def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the /ingest/logs endpoint")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--compression", choices=["none", "gzip", "zstd"], default=COMPRESSION,
+                        help="Content-Encoding of the request bodies")
+    args = parser.parse_args()
+    API_URL, COMPRESSION = args.url, args.compression
     asyncio.run(main())
@@ -0,0 +1,457 @@
+"""
+Stage-level microbenchmarks for the worker pipeline.
+
+Runs each stage (normalize, template, enrich, rules, ml, correlation, response, index)
+and the full worker._process_single path over generated nginx / ssh / UFW /
+mixed corpora. Redis and Elasticsearch are replaced by in-process stand-ins,
+so the numbers measure our code, not the network.
+
+Reports per stage: events/sec, p50 / p99 latency, and from a separate
+tracemalloc pass the peak and retained bytes per event.
+
+    cd backend
+    python tools/benchmark_stages.py --events 20000 --output bench.json
+    python tools/benchmark_stages.py --compare bench.json      # diff against an earlier run
+"""
+import argparse
+import copy
+import fnmatch
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import worker  # noqa: E402
+from app.core import codec  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.models.event import Event  # noqa: E402
+from app.services.correlation import correlation_service  # noqa: E402
+from app.services.detection_ml import ml_detector  # noqa: E402
+from app.services.detection_rules import rule_detector  # noqa: E402
+from app.services.enrichment import enrichment_service  # noqa: E402
+from app.services.normalization import normalization_service  # noqa: E402
+from app.services.response import response_service  # noqa: E402
+from app.services.state_cache import state_cache  # noqa: E402
+from app.services.templates import template_miner  # noqa: E402
+from app.services.storage import storage_service  # noqa: E402
+
+CORPORA = ("nginx", "ssh", "ufw", "mixed")
+STAGES = ("normalize", "template", "enrich", "rules", "ml", "correlation", "response", "index", "full")
+ALLOC_SAMPLE = 2000  # events traced per stage for the allocation pass
+
+
+# ---------------------------------------------------------------------------
+# Stand-ins
+# ---------------------------------------------------------------------------
+
+class InMemoryRedis:
+    """The subset of redis.Redis the pipeline uses, backed by a dict."""
+
+    def __init__(self):
+        self.data: dict = {}
+        self.expiry: dict = {}  # key -> unix ms
+
+    def _live(self, key):
+        exp = self.expiry.get(key)
+        if exp is not None and exp <= time.time() * 1000:
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        return self.data.get(key) if self._live(key) else None
+
+    def mget(self, keys):
+        return [self.get(k) for k in keys]
+
+    def set(self, key, value, ex=None, px=None, pxat=None, nx=False):
+        if nx and self._live(key):
+            return None
+        self.data[key] = str(value)
+        self.expiry.pop(key, None)
+        if ex:
+            self.expire(key, ex)
+        elif px:
+            self.expiry[key] = time.time() * 1000 + px
+        elif pxat:
+            self.expiry[key] = pxat
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value, ex=ttl)
+
+    def incrby(self, key, amount):
+        value = int(self.get(key) or 0) + amount
+        self.data[key] = str(value)
+        return value
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def expire(self, key, seconds):
+        if not self._live(key):
+            return False
+        self.expiry[key] = time.time() * 1000 + int(seconds) * 1000
+        return True
+
+    def pexpireat(self, key, when_ms):
+        if not self._live(key):
+            return False
+        self.expiry[key] = when_ms
+        return True
+
+    def pttl(self, key):
+        if not self._live(key):
+            return -2
+        exp = self.expiry.get(key)
+        return -1 if exp is None else int(exp - time.time() * 1000)
+
+    def exists(self, *keys):
+        return sum(1 for k in keys if self._live(k))
+
+    def sadd(self, key, *members):
+        s = self.data.setdefault(key, set())
+        before = len(s)
+        s.update(members)
+        return len(s) - before
+
+    def sismember(self, key, member):
+        return member in self.data.get(key, ())
+
+    def publish(self, channel, message):
+        return 0
+
+    def pipeline(self, transaction=False):
+        return _InMemoryPipeline(self)
+
+
+class _InMemoryPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __len__(self):
+        return len(self.calls)
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [method(*args, **kwargs) for method, args, kwargs in calls]
+
+
+class InMemoryES:
+    """Accepts index() calls and serializes the document like the real client would."""
+
+    def __init__(self):
+        self.docs = 0
+        self.bytes = 0
+
+    def index(self, index, document):
+        self.docs += 1
+        self.bytes += len(codec.dumps_bytes(document))
+        return {"result": "created"}
+
+
+def install_standins(state_mode: str):
+    r = InMemoryRedis()
+    worker.r = r
+    for service in (rule_detector, ml_detector, correlation_service, response_service, template_miner):
+        service.redis = r
+    state_cache.redis = r
+    state_cache.local = state_mode == "local"
+    storage_service.es = InMemoryES()
+    # Enrichment must not call ipinfo / AbuseIPDB from a benchmark
+    settings.IPINFO_TOKEN = ""
+    settings.ABUSEIPDB_API_KEY = ""
+    return r
+
+
+# ---------------------------------------------------------------------------
+# Corpora
+# ---------------------------------------------------------------------------
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "curl/8.4.0",
+    "python-requests/2.32.5",
+]
+PATHS = ["/", "/login", "/api/v1/logs", "/wp-login.php", "/static/app.js", "/.env", "/admin"]
+USERS = ["root", "admin", "ubuntu", "deploy", "git", "postgres", "alice"]
+
+
+def _zipf_ips(rng: random.Random, count: int = 500) -> tuple[list, list]:
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+           for _ in range(count)]
+    weights = [1 / (k ** 1.2) for k in range(1, count + 1)]
+    return ips, weights
+
+
+def _nginx(rng, ip, ts):
+    ua = rng.choice(USER_AGENTS)
+    status = rng.choice([200, 200, 200, 301, 404, 500])
+    message = (
+        f'{ip} - - [{ts.strftime("%d/%b/%Y:%H:%M:%S +0000")}] "{rng.choice(["GET", "POST"])} '
+        f'{rng.choice(PATHS)} HTTP/1.1" {status} {rng.randint(0, 50000)} "-" "{ua}"'
+    )
+    return {"source": "nginx", "level": "INFO", "message": message, "user_agent": ua}
+
+
+def _ssh(rng, ip, ts):
+    user = rng.choice(USERS)
+    roll = rng.random()
+    if roll < 0.7:
+        message = f"Failed password for {'invalid user ' if rng.random() < 0.3 else ''}{user} from {ip} port {rng.randint(1024, 65535)} ssh2"
+    elif roll < 0.9:
+        message = f"Accepted password for {user} from {ip} port {rng.randint(1024, 65535)} ssh2"
+    else:
+        message = f"sudo: {user} : TTY=pts/0 ; PWD=/home/{user} ; USER=root ; COMMAND=/bin/bash"
+        return {"source": "ssh", "level": "WARN", "message": message, "metadata": {"ip": ip, "user": user}}
+    return {"source": "ssh", "level": "WARN", "message": message}
+
+
+def _ufw(rng, ip, ts):
+    message = (
+        f"[UFW BLOCK] IN=eth0 OUT= MAC=52:54:00:12:34:56 SRC={ip} DST=10.0.0.{rng.randint(2, 250)} "
+        f"LEN=60 TOS=0x00 PREC=0x00 TTL=52 ID={rng.randint(1, 65535)} DF PROTO={rng.choice(['TCP', 'UDP'])} "
+        f"SPT={rng.randint(1024, 65535)} DPT={rng.choice([22, 23, 3389, 445, 5432])} WINDOW=29200 RES=0x00 SYN URGP=0"
+    )
+    return {"source": "firewall", "level": "WARN", "message": message}
+
+
+GENERATORS = {"nginx": _nginx, "ssh": _ssh, "ufw": _ufw}
+
+
+def generate_corpus(kind: str, n: int, seed: int = 42) -> list[dict]:
+    rng = random.Random(f"{kind}-{seed}")
+    ips, weights = _zipf_ips(rng)
+    start = datetime(2026, 1, 8, tzinfo=timezone.utc)
+    events = []
+    for i in range(n):
+        gen = GENERATORS[rng.choice(list(GENERATORS))] if kind == "mixed" else GENERATORS[kind]
+        ts = start + timedelta(milliseconds=i * 50)
+        event = gen(rng, rng.choices(ips, weights)[0], ts)
+        event["timestamp"] = ts.isoformat().replace("+00:00", "Z")
+        events.append(event)
+    return events
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+# id() of prepared events normalization left unparsed: the ones the worker templates
+_unparsed: set = set()
+
+
+def _normalize(e):
+    extracted = normalization_service.parse_log(e.message, e.source or "")
+    if extracted:
+        e.update(extracted)
+    else:
+        _unparsed.add(id(e))
+
+
+def _template(e):
+    if id(e) in _unparsed:
+        template_miner.process_event(e)
+
+
+def _rules(e):
+    worker._apply_rules(e, *rule_detector.check_rules(e))
+
+
+def _ml(e):
+    worker._apply_anomaly(e, ml_detector.predict(e))
+
+
+STAGE_FUNCS = {
+    "codec": lambda e: Event(codec.decode_entry(codec.encode_entry(e.to_dict()))),
+    "normalize": _normalize,
+    "template": _template,
+    "enrich": enrichment_service.enrich_log,
+    "rules": _rules,
+    "ml": _ml,
+    "correlation": correlation_service.process_event,
+    "response": lambda e: worker._apply_response(e, response_service.evaluate(e)),
+    "index": lambda e: storage_service.index_log(e.to_dict()),
+    "full": worker._process_single,
+}
+# What an event must already have been through before the stage runs
+PREREQUISITES = {
+    "codec": [],
+    "normalize": [],
+    "template": ["normalize"],
+    "enrich": ["normalize", "template"],
+    "rules": ["normalize", "template", "enrich"],
+    "ml": ["normalize", "template", "enrich", "rules"],
+    "correlation": ["normalize", "template", "enrich", "rules", "ml"],
+    "response": ["normalize", "template", "enrich", "rules", "ml", "correlation"],
+    "index": ["normalize", "template", "enrich", "rules", "ml", "correlation", "response"],
+    "full": [],
+}
+
+
+def _prepare(corpus: list[dict], stage: str, redis_standin: InMemoryRedis) -> list[Event]:
+    """Fresh copies of the corpus, advanced to the stage's input; state reset afterwards."""
+    events = [Event(doc) for doc in copy.deepcopy(corpus)]
+    _unparsed.clear()
+    for prior in PREREQUISITES[stage]:
+        func = STAGE_FUNCS[prior]
+        for e in events:
+            func(e)
+    redis_standin.data.clear()
+    redis_standin.expiry.clear()
+    state_cache.clear()
+    return events
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_stage(corpus: list[dict], stage: str, redis_standin: InMemoryRedis) -> dict:
+    func = STAGE_FUNCS[stage]
+    events = _prepare(corpus, stage, redis_standin)
+
+    latencies = []
+    perf = time.perf_counter_ns
+    started = perf()
+    for e in events:
+        t0 = perf()
+        func(e)
+        latencies.append(perf() - t0)
+    total_s = (perf() - started) / 1e9
+    latencies.sort()
+
+    # Allocation pass: tracing slows everything down, so it is kept separate
+    sample = _prepare(corpus[:ALLOC_SAMPLE], stage, redis_standin)
+    peaks = []
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    for e in sample:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func(e)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(events)
+    return {
+        "events": n,
+        "eps": round(n / total_s, 1) if total_s else 0.0,
+        "p50_us": round(_percentile(latencies, 50) / 1000, 2),
+        "p99_us": round(_percentile(latencies, 99) / 1000, 2),
+        "mean_us": round(statistics.fmean(latencies) / 1000, 2) if latencies else 0.0,
+        "alloc_peak_bytes_per_event": round(statistics.fmean(peaks)) if peaks else 0,
+        "alloc_retained_bytes_per_event": round((retained - base) / len(sample)) if sample else 0,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(n: int, corpora: list[str], stages: list[str], state_mode: str) -> dict:
+    redis_standin = install_standins(state_mode)
+    results: dict = {}
+    for kind in corpora:
+        corpus = generate_corpus(kind, n)
+        results[kind] = {}
+        for stage in stages:
+            results[kind][stage] = res = bench_stage(corpus, stage, redis_standin)
+            print(
+                f"{kind:>6} {stage:<12} {res['eps']:>12,.0f} ev/s  p50 {res['p50_us']:>8.1f}us  "
+                f"p99 {res['p99_us']:>9.1f}us  peak {res['alloc_peak_bytes_per_event']:>7} B/ev"
+            )
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "events_per_corpus": n,
+            "state_consistency": state_mode,
+            "ml_model_loaded": ml_detector.model is not None,
+            "codec": f"{codec.BACKEND}/{settings.STREAM_CODEC}",
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """Print eps / p99 changes per stage; returns the number of regressions beyond threshold %."""
+    regressions = 0
+    for kind, stages in current["results"].items():
+        for stage, res in stages.items():
+            old = baseline.get("results", {}).get(kind, {}).get(stage)
+            if not old or not old["eps"]:
+                continue
+            eps_delta = (res["eps"] - old["eps"]) / old["eps"] * 100
+            p99_delta = (res["p99_us"] - old["p99_us"]) / old["p99_us"] * 100 if old["p99_us"] else 0.0
+            flag = ""
+            if eps_delta < -threshold or p99_delta > threshold:
+                flag = "  <-- regression"
+                regressions += 1
+            print(f"{kind:>6} {stage:<12} eps {eps_delta:+7.1f}%  p99 {p99_delta:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Aegis pipeline stage microbenchmarks")
+    parser.add_argument("--events", type=int, default=10000, help="events per corpus")
+    parser.add_argument("--corpus", default="all", help=f"comma-separated subset of {CORPORA}")
+    parser.add_argument("--stage", default="*", help=f"glob over stage names {STAGES}")
+    parser.add_argument("--state", choices=["strict", "local"], default="strict",
+                        help="STATE_CONSISTENCY mode for the detection state layer")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--compare", default=None, help="baseline JSON to diff against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="%% change that counts as a regression in --compare")
+    args = parser.parse_args(argv)
+
+    corpora = list(CORPORA) if args.corpus == "all" else args.corpus.split(",")
+    stages = [s for s in STAGES if fnmatch.fnmatch(s, args.stage)]
+    report = run(args.events, corpora, stages, args.state)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
 import json
+import os
 import random
+import sys
 import numpy as np
 from datetime import datetime, timedelta
 import ipaddress
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.normalization import normalization_service  # noqa: E402
+from app.services.templates import TemplateMiner  # noqa: E402
+
 # Configuration
 TOTAL_LOGS = 10000
 START_TIME = datetime.now() - timedelta(days=7)
@@ -113,6 +120,18 @@ def generate_dataset():
             "is_injected_anomaly": True
         })
 
+    # 6. Template rarity, as the worker assigns it to these source-less
+    # messages as they arrive: only those no parser recognises are templated,
+    # the rest keep the detector's default of 0.0
+    miner = TemplateMiner()
+    for log_entry in logs:
+        rarity = 0.0
+        if not normalization_service.parse_log(log_entry["message"], ""):
+            mined = miner.mine(log_entry["message"], "raw_ingest")
+            if mined is not None:
+                rarity = mined[0].rarity
+        log_entry["template_rarity"] = rarity
+
     # Save
     with open(OUTPUT_FILE, "w") as f:
         json.dump(logs, f, indent=2)
@@ -88,7 +88,10 @@ TEMPLATES = {
                 "properties": {
                     "timestamp": {"type": "date"},
                     "ip": {"type": "ip"},
-                    "location": {"type": "geo_point"}
+                    "location": {"type": "geo_point"},
+                    "template_id": {"type": "keyword"},
+                    "template_params": {"type": "keyword"},
+                    "template_rarity": {"type": "float"}
                 }
             }
         }
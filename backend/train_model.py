@@ -20,18 +20,24 @@ def train():
     with open(DATASET_FILE, "r") as f:
         data = json.load(f)
 
-    # Extract Features: [hour, msg_len, is_ssh, login_rate]
+    # Extract Features: [hour, msg_len, is_ssh, login_rate(, template_rarity)]
+    # Rarity is only used when the dataset has it (tools/generate_dataset.py);
+    # the worker feeds the model as many features as it was trained on.
     # Train only on normal records so the Isolation Forest learns a clean baseline.
+    with_rarity = any("template_rarity" in entry for entry in data)
     X = []
     for entry in data:
         if entry.get("is_injected_anomaly"):
             continue
-        X.append([
+        row = [
             entry["hour"],
             entry["msg_len"],
             entry["is_ssh"],
             entry.get("login_rate", 0),
-        ])
+        ]
+        if with_rarity:
+            row.append(entry.get("template_rarity", 0.0))
+        X.append(row)
 
     X = np.array(X)
     print(f"Training on {len(X)} normal records…")
@@ -55,7 +61,7 @@ def train():
 
     # Print learned scaler statistics for audit
     scaler: StandardScaler = pipeline.named_steps["scaler"]
-    names = ["Hour", "MsgLen", "IsSSH", "LoginRate"]
+    names = ["Hour", "MsgLen", "IsSSH", "LoginRate", "TemplateRarity"]
     for name, mean, std in zip(names, scaler.mean_, scaler.scale_):
         print(f"  {name}: mean={mean:.2f}, std={std:.2f}")
 
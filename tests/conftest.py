@@ -0,0 +1,36 @@
+"""
+Shared fixtures. Run the suite from backend/ (see README) so `app` imports.
+
+fake_redis / fake_aredis are in-memory clients for unit tests that need no
+running Redis; both talk to the same per-test server, so state written
+through one is visible through the other. Tests using fake_aredis call
+coroutines through `run`, which keeps the test on the loop the client is
+bound to.
+"""
+import asyncio
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def fake_redis(redis_server):
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def fake_aredis(redis_server):
+    return fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def run():
+    """Run coroutines on one event loop for the whole test."""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
@@ -0,0 +1,66 @@
+"""Async worker drain behaviour: stops and partition revokes finish in-flight events first."""
+import asyncio
+
+import pytest
+
+from app import async_worker
+from app import worker as sync_worker
+from app.services.partitions import PartitionCoordinator
+
+
+@pytest.fixture
+def idle_worker(monkeypatch, fake_aredis):
+    """An AsyncWorker whose Redis is fakeredis with nothing to read."""
+    monkeypatch.setattr(sync_worker, "create_consumer_group", lambda: None)
+    monkeypatch.setattr(sync_worker, "run_housekeeping", lambda: None)
+    monkeypatch.setattr(sync_worker, "consumed_streams", lambda: [])
+    monkeypatch.setattr(async_worker.settings, "WORKER_READ_BLOCK_MS", 10)
+    worker = async_worker.AsyncWorker(2)
+    worker.r = fake_aredis
+    return worker
+
+
+def in_flight(worker, finished: list, delay: float = 0.05) -> asyncio.Task:
+    async def event():
+        await asyncio.sleep(delay)
+        finished.append("event")
+
+    task = asyncio.create_task(event())
+    worker.tasks.add(task)
+    task.add_done_callback(worker.tasks.discard)
+    return task
+
+
+def test_stop_drains_in_flight_events(idle_worker, monkeypatch):
+    monkeypatch.setattr(sync_worker, "coordinator", None)
+    finished = []
+
+    async def scenario():
+        running = asyncio.create_task(idle_worker.run())
+        await asyncio.sleep(0.02)
+        in_flight(idle_worker, finished)
+        idle_worker.stopping.set()
+        await asyncio.wait_for(running, 2)
+
+    asyncio.run(scenario())
+    assert finished == ["event"]
+    assert not idle_worker.tasks
+
+
+def test_revoke_waits_for_in_flight_events_before_state_is_dropped(idle_worker, monkeypatch, fake_redis):
+    coordinator = PartitionCoordinator(fake_redis, "logs_stream", "a", partitions=2)
+    finished = []
+    coordinator.on_revoke.append(lambda _lost: finished.append("state cleared"))
+    monkeypatch.setattr(sync_worker, "coordinator", coordinator)
+
+    async def scenario():
+        running = asyncio.create_task(idle_worker.run())
+        await asyncio.sleep(0.02)
+        in_flight(idle_worker, finished)
+        # The housekeeping thread runs the revoke callbacks in order
+        await asyncio.to_thread(lambda: [callback({1}) for callback in coordinator.on_revoke])
+        idle_worker.stopping.set()
+        await asyncio.wait_for(running, 2)
+
+    asyncio.run(scenario())
+    assert finished == ["event", "state cleared"]
@@ -0,0 +1,165 @@
+"""Verified-JWT cache and agent keys: expiry, eviction, revocation, hashed lookup."""
+import hashlib
+import json
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from jose import JWTError
+
+from app.core import security
+from app.core.config import settings
+from app.core.security import VerifiedTokenCache, create_access_token
+from app.services import agent_keys as agent_keys_module
+from app.services.agent_keys import KEYS_HASH, AgentKeyStore
+
+
+class Clock:
+    """Stands in for the `time` module of the code under test."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    monotonic = time
+
+
+@pytest.fixture
+def verified(monkeypatch):
+    """Tokens that reached the real signature check, in order."""
+    calls = []
+    decode_token = security.decode_token
+
+    def spy(token):
+        calls.append(token)
+        return decode_token(token)
+
+    monkeypatch.setattr(security, "decode_token", spy)
+    return calls
+
+
+@pytest.fixture
+def store(fake_aredis):
+    return AgentKeyStore(fake_aredis)
+
+
+def token(sub: str, seconds: int = 60) -> str:
+    return create_access_token({"sub": sub}, timedelta(seconds=seconds))
+
+
+def test_cached_token_skips_the_signature_check(verified):
+    cache = VerifiedTokenCache(max_entries=10)
+    alice = token("alice")
+    assert cache.decode(alice)["sub"] == "alice"
+    assert cache.decode(alice)["sub"] == "alice"
+    assert verified == [alice]
+
+
+def test_expired_token_is_rejected_while_still_cached(monkeypatch, verified):
+    cache = VerifiedTokenCache(max_entries=10)
+    alice = token("alice", seconds=60)
+    exp = cache.decode(alice)["exp"]
+
+    monkeypatch.setattr(security, "time", Clock(exp + 1))
+    with pytest.raises(JWTError):
+        cache.decode(alice)
+    assert verified == [alice]  # refused from the cache entry, not by re-verifying
+    assert not cache._entries
+
+
+def test_expired_token_is_refused_by_the_route_dependency(monkeypatch, run):
+    alice = token("alice", seconds=60)
+    monkeypatch.setattr(security, "token_cache", VerifiedTokenCache(max_entries=10))
+    assert run(security.get_current_user(alice)) == {"username": "alice"}
+    exp = security.token_cache.decode(alice)["exp"]
+
+    monkeypatch.setattr(security, "time", Clock(exp + 1))
+    with pytest.raises(HTTPException) as refused:
+        run(security.get_current_user(alice))
+    assert refused.value.status_code == 401
+
+
+def test_least_recently_used_token_is_evicted(verified):
+    cache = VerifiedTokenCache(max_entries=2)
+    alice, bob, carol = token("alice"), token("bob"), token("carol")
+    cache.decode(alice)
+    cache.decode(bob)
+    cache.decode(alice)  # bob is now the oldest
+    cache.decode(carol)
+    assert len(cache._entries) == 2
+
+    cache.decode(alice)
+    cache.decode(bob)
+    assert verified == [alice, bob, carol, bob]
+
+
+def test_tampered_token_is_verified_not_served_from_the_cache():
+    cache = VerifiedTokenCache(max_entries=10)
+    alice = token("alice")
+    cache.decode(alice)
+    with pytest.raises(JWTError):
+        cache.decode(alice[:-2] + ("AA" if alice[-2:] != "AA" else "BB"))
+
+
+def test_only_a_hash_of_the_secret_is_stored(store, run, fake_aredis):
+    created = run(store.create("web-01"))
+    key_id, secret = created["api_key"][len("aegis_"):].split(".")
+    assert key_id == created["key_id"]
+
+    raw = run(fake_aredis.hget(KEYS_HASH, key_id))
+    assert secret not in raw
+    assert json.loads(raw)["hash"] == hashlib.sha256(secret.encode()).hexdigest()
+
+    assert run(store.verify(created["api_key"])) == "web-01"
+    assert run(store.verify(f"aegis_{key_id}.{secret[:-1]}x")) is None
+    for malformed in ("aegis_", f"aegis_{key_id}", f"aegis_.{secret}", f"other_{key_id}.{secret}"):
+        assert run(store.verify(malformed)) is None
+
+
+def test_revoked_key_stops_working_at_once_in_the_revoking_process(store, run):
+    api_key = run(store.create("web-01"))["api_key"]
+    assert run(store.verify(api_key)) == "web-01"
+    assert run(store.revoke(api_key[len("aegis_"):].split(".")[0]))
+    assert run(store.verify(api_key)) is None
+
+
+def test_revoked_key_stops_working_elsewhere_once_the_cache_expires(monkeypatch, fake_aredis, run):
+    clock = Clock(1000.0)
+    monkeypatch.setattr(agent_keys_module, "time", clock)
+    admin, api = AgentKeyStore(fake_aredis), AgentKeyStore(fake_aredis)
+    created = run(admin.create("web-01"))
+    assert run(api.verify(created["api_key"])) == "web-01"
+
+    run(admin.revoke(created["key_id"]))
+    clock.now += settings.AGENT_KEY_CACHE_SECONDS - 1
+    assert run(api.verify(created["api_key"])) == "web-01"  # the documented grace period
+    clock.now += 1
+    assert run(api.verify(created["api_key"])) is None
+
+
+def test_unknown_key_ids_are_cached_and_the_cache_is_bounded(monkeypatch, store, run, fake_aredis):
+    monkeypatch.setattr(settings, "AUTH_CACHE_MAX_ENTRIES", 3)
+    for i in range(3):
+        assert run(store.verify(f"aegis_bogus{i}.secret")) is None
+    assert len(store._records) == 3
+
+    # A miss is remembered, so a key created under that id right after is not looked up yet
+    run(fake_aredis.hset(KEYS_HASH, "bogus0", json.dumps({"agent": "x", "hash": "0"})))
+    assert store._records["bogus0"][0] is None
+
+    run(store.verify("aegis_bogus3.secret"))
+    assert list(store._records) == ["bogus3"]
+
+
+def test_ingest_principal_refuses_a_revoked_agent_key(monkeypatch, store, run):
+    monkeypatch.setattr(security, "agent_keys", store)
+    created = run(store.create("web-01"))
+    principal = run(security.get_ingest_principal(token=None, api_key=created["api_key"]))
+    assert principal == {"username": "agent:web-01", "agent": "web-01"}
+
+    run(store.revoke(created["key_id"]))
+    with pytest.raises(HTTPException) as refused:
+        run(security.get_ingest_principal(token=created["api_key"], api_key=None))
+    assert refused.value.status_code == 401
@@ -0,0 +1,95 @@
+"""gzip / zstd request bodies: decoding, the zip-bomb ceiling and bad input."""
+import gzip
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.core import compression
+from app.core.compression import RequestDecompressionMiddleware
+
+needs_zstd = pytest.mark.skipif(compression.zstandard is None, reason="zstandard not installed")
+
+
+def zstd_compress(data: bytes) -> bytes:
+    return compression.zstandard.ZstdCompressor().compress(data)
+
+
+LINES = b"".join(b'{"source": "app", "message": "event %d"}\n' % i for i in range(1000))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(compression.settings, "INGEST_MAX_DECOMPRESSED_BYTES", 1024 * 1024)
+    app = FastAPI()
+    app.add_middleware(RequestDecompressionMiddleware, path_prefix="/ingest")
+
+    @app.post("/ingest/echo")
+    async def echo(request: Request):
+        size, lines = 0, 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+        return {"bytes": size, "lines": lines, "headers": sorted(request.headers)}
+
+    @app.post("/other")
+    async def other(request: Request):
+        return {"bytes": len(await request.body())}
+
+    return TestClient(app)
+
+
+def post(client, body: bytes, encoding: str | None, path: str = "/ingest/echo"):
+    headers = {"Content-Encoding": encoding} if encoding else {}
+    return client.post(path, content=body, headers=headers)
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    (None, lambda b: b),
+    ("gzip", gzip.compress),
+    pytest.param("zstd", zstd_compress, marks=needs_zstd),
+])
+def test_body_reaches_the_endpoint_decoded(client, encoding, compress):
+    response = post(client, compress(LINES), encoding)
+    assert response.status_code == 200
+    assert response.json()["bytes"] == len(LINES)
+    assert response.json()["lines"] == 1000
+    assert "content-encoding" not in response.json()["headers"]
+
+
+def test_concatenated_gzip_members_are_one_body(client):
+    response = post(client, gzip.compress(LINES) + gzip.compress(LINES), "gzip")
+    assert response.json()["lines"] == 2000
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("gzip", gzip.compress),
+    pytest.param("zstd", zstd_compress, marks=needs_zstd),
+])
+def test_zip_bomb_is_refused_with_413(client, encoding, compress):
+    bomb = compress(b"\0" * (64 * 1024 * 1024))
+    assert len(bomb) < 128 * 1024
+    response = post(client, bomb, encoding)
+    assert response.status_code == 413
+    assert "exceeds 1048576 bytes" in response.json()["detail"]
+
+
+def test_unknown_encoding_is_refused_with_415(client):
+    response = post(client, LINES, "br")
+    assert response.status_code == 415
+    assert response.headers["Accept-Encoding"] == ", ".join(compression.supported_encodings())
+
+
+@pytest.mark.parametrize("encoding, body", [
+    ("gzip", b"this is not gzip at all"),
+    ("gzip", gzip.compress(LINES)[:200]),  # truncated member
+    pytest.param("zstd", b"\x28\xb5\x2f\xfd garbage", marks=needs_zstd),
+])
+def test_corrupt_body_is_refused_with_400(client, encoding, body):
+    response = post(client, body, encoding)
+    assert response.status_code == 400
+
+
+def test_routes_outside_the_prefix_are_untouched(client):
+    response = post(client, gzip.compress(LINES), "gzip", path="/other")
+    assert response.json()["bytes"] == len(gzip.compress(LINES))
@@ -0,0 +1,67 @@
+"""Unit tests for the dead-letter queue against fakeredis."""
+import pytest
+
+from app import dlq
+from app.core import codec
+
+GROUP = "ingest_group"
+
+
+@pytest.fixture
+def client(fake_redis):
+    fake_redis.xgroup_create(dlq.STREAM_KEY, GROUP, id="0", mkstream=True)
+    return fake_redis
+
+
+def deliver(client, event: dict) -> str:
+    message_id = client.xadd(dlq.STREAM_KEY, codec.encode_entry(event, "json"))
+    client.xreadgroup(GROUP, "worker-1", {dlq.STREAM_KEY: ">"}, count=10)
+    return message_id
+
+
+def test_dead_letter_moves_entry_acks_and_clears_failure(client):
+    message_id = deliver(client, {"message": "poison", "source": "ssh"})
+    dlq.record_failure(client, message_id, "boom")
+
+    assert dlq.dead_letter(client, GROUP, [(message_id, 5)]) == 1
+
+    assert client.hlen(dlq.FAILURES_KEY) == 0
+    assert client.xpending(dlq.STREAM_KEY, GROUP)["pending"] == 0
+    [(_dlq_id, fields)] = client.xrange(dlq.DLQ_KEY)
+    assert fields["original_id"] == message_id
+    assert fields["error"] == "boom"
+    assert fields["deliveries"] == "5"
+    assert codec.decode_entry(fields) == {"message": "poison", "source": "ssh"}
+
+
+def test_dead_letter_clears_partition_failures_and_keeps_others(client):
+    stream = f"{dlq.STREAM_KEY}:2"
+    client.xgroup_create(stream, GROUP, id="0", mkstream=True)
+    message_id = client.xadd(stream, codec.encode_entry({"message": "poison"}, "json"))
+    client.xreadgroup(GROUP, "worker-1", {stream: ">"}, count=10)
+    dlq.record_failure(client, message_id, "boom", stream)
+    dlq.record_failure(client, "1-1", "still retrying")
+
+    dlq.dead_letter(client, GROUP, [(message_id, 5)], stream)
+
+    assert client.hkeys(dlq.FAILURES_KEY) == ["1-1"]
+    assert client.xrange(dlq.DLQ_KEY)[0][1]["stream"] == stream
+
+
+def test_dead_letter_acks_entries_already_trimmed(client):
+    message_id = deliver(client, {"message": "gone"})
+    client.xdel(dlq.STREAM_KEY, message_id)
+    dlq.record_failure(client, message_id, "boom")
+
+    assert dlq.dead_letter(client, GROUP, [(message_id, 5)]) == 0
+    assert client.hlen(dlq.FAILURES_KEY) == 0
+    assert client.xlen(dlq.DLQ_KEY) == 0
+
+
+def test_replay_requeues_and_empties_dlq(client):
+    message_id = deliver(client, {"message": "poison"})
+    dlq.dead_letter(client, GROUP, [(message_id, 5)])
+
+    assert dlq.replay(client) == 1
+    assert client.xlen(dlq.DLQ_KEY) == 0
+    assert codec.decode_entry(client.xrange(dlq.STREAM_KEY)[-1][1]) == {"message": "poison"}
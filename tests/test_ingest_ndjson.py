@@ -0,0 +1,75 @@
+"""/ingest/ndjson: valid lines are queued, invalid ones are reported by line number."""
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import ingest
+from app.core import codec
+from app.core.security import get_ingest_principal
+from app.services.backpressure import backpressure_guard
+from app.services.queue import queue_service
+
+
+def entry(message: str, **fields) -> str:
+    return json.dumps({"source": "app", "message": message, **fields})
+
+
+BODY = "\n".join([
+    entry("first"),                          # 1
+    '{"source": "app", "message": "trunc',   # 2: not JSON
+    "",                                      # 3: blank, not counted
+    entry("second", level="WARN"),           # 4
+    json.dumps({"source": "app"}),           # 5: no message
+    entry("x" * 300),                        # 6: over INGEST_MAX_LINE_BYTES
+    json.dumps(["not", "an", "object"]),     # 7
+    entry("third", timestamp="2026-02-28T09:15:02Z"),  # 8, no trailing newline
+]).encode()
+
+
+@pytest.fixture
+def client(monkeypatch, fake_aredis):
+    monkeypatch.setattr(queue_service, "aredis", fake_aredis)
+    monkeypatch.setattr(queue_service, "partitions", 0)
+    monkeypatch.setattr(ingest.settings, "INGEST_CHUNK_SIZE", 2)
+    monkeypatch.setattr(ingest.settings, "INGEST_MAX_LINE_BYTES", 200)
+    app = FastAPI()
+    app.include_router(ingest.router, prefix="/ingest")
+    app.dependency_overrides[ingest.ingest_gate] = lambda: None
+    app.dependency_overrides[backpressure_guard] = lambda: None
+    app.dependency_overrides[get_ingest_principal] = lambda: {"username": "tester"}
+    with TestClient(app) as client:
+        yield client
+
+
+def queued(fake_redis) -> list[dict]:
+    return [codec.decode_entry(fields) for _id, fields in fake_redis.xrange(queue_service.stream_name)]
+
+
+def test_good_lines_are_queued_and_bad_lines_reported(client, fake_redis):
+    # Sent in small pieces so lines also straddle reads
+    pieces = [BODY[i:i + 7] for i in range(0, len(BODY), 7)]
+    response = client.post("/ingest/ndjson", content=iter(pieces), headers={"X-Source-Host": "web-01"})
+
+    assert response.status_code == 202
+    report = response.json()
+    assert (report["count"], report["lines"], report["failed"]) == (3, 7, 4)
+    assert [e["line"] for e in report["errors"]] == [2, 5, 6, 7]
+    assert report["errors"][0]["error"].startswith("invalid JSON")
+    assert "message" in report["errors"][1]["error"]
+    assert report["errors"][2]["error"] == "line exceeds 200 bytes"
+
+    events = queued(fake_redis)
+    assert [e["message"] for e in events] == ["first", "second", "third"]
+    assert events[1]["level"] == "WARN"
+    assert events[2]["timestamp"].startswith("2026-02-28T09:15:02")
+    assert all(e["metadata"]["source_host"] == "web-01" for e in events)
+
+
+def test_reported_errors_are_capped_but_all_are_counted(client, fake_redis, monkeypatch):
+    monkeypatch.setattr(ingest.settings, "INGEST_MAX_REPORTED_ERRORS", 2)
+    body = "\n".join(["nope"] * 5 + [entry("kept")]) + "\n"
+    report = client.post("/ingest/ndjson", content=body).json()
+    assert (report["count"], report["failed"], len(report["errors"])) == (1, 5, 2)
+    assert [e["message"] for e in queued(fake_redis)] == ["kept"]
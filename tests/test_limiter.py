@@ -0,0 +1,109 @@
+"""Token-bucket rate limiter: the Lua script against fakeredis with a frozen clock."""
+import pytest
+from fastapi import HTTPException
+from fakeredis.commands_mixins import server_mixin
+
+from app.core.limiter import Limit, RateLimiter
+
+IP = "203.0.113.9"
+
+
+class Clock:
+    """Stands in for the `time` module behind fakeredis' TIME command."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server_mixin, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(fake_aredis, clock):
+    limiter = RateLimiter(default="3/60", routes="", principals="")
+    limiter.redis = fake_aredis
+    limiter.local_precheck = False
+    return limiter
+
+
+@pytest.fixture
+def take(limiter, run):
+    def take(limit=Limit(3, 60), key="rate_limit:bucket:ingest_logs:" + IP):
+        (reply,) = run(limiter.run(lambda pipe: limiter.queue(pipe, key, limit, IP)))
+        return limiter.decide(key, limit, reply)
+    return take
+
+
+def test_full_bucket_allows_a_burst_then_refuses(take):
+    decisions = [take() for _ in range(4)]
+    assert [(d.allowed, d.remaining, d.reset_ms, d.retry_after_ms) for d in decisions] == [
+        (True, 2, 20000, 0),
+        (True, 1, 40000, 0),
+        (True, 0, 60000, 0),
+        (False, 0, 60000, 20000),
+    ]
+
+
+def test_bucket_refills_at_the_sustained_rate_up_to_capacity(take, clock):
+    for _ in range(3):
+        take()
+    clock.advance(10)  # half a token
+    refused = take()
+    assert (refused.allowed, refused.retry_after_ms) == (False, 10000)
+    clock.advance(10)
+    assert take().allowed
+    clock.advance(3600)  # idle for an hour: back to a full bucket, not more
+    assert take().remaining == 2
+
+
+def test_buckets_and_request_counter_expire(take, fake_redis):
+    take()
+    assert 0 < fake_redis.pttl("rate_limit:bucket:ingest_logs:" + IP) <= 60000
+    assert fake_redis.get(f"rate_limit:{IP}") == "1"
+    assert 0 < fake_redis.ttl(f"rate_limit:{IP}") <= 60
+
+
+def test_refusal_raises_429_with_retry_after(limiter, take):
+    for _ in range(3):
+        limiter.enforce(take())
+    with pytest.raises(HTTPException) as refused:
+        limiter.enforce(take())
+    assert refused.value.status_code == 429
+    assert refused.value.headers["Retry-After"] == "20"
+    assert refused.value.headers["RateLimit-Remaining"] == "0"
+    assert refused.value.headers["RateLimit-Policy"] == "3;w=60"
+
+
+def test_local_precheck_answers_a_refused_bucket_without_redis(limiter, take, monkeypatch):
+    limiter.local_precheck = True
+    key = "rate_limit:bucket:ingest_logs:" + IP
+    for _ in range(4):
+        take(key=key)
+    assert limiter.precheck(key).allowed is False
+    monkeypatch.setattr("app.core.limiter.time.monotonic", lambda: float("inf"))
+    assert limiter.precheck(key) is None
+
+
+def test_script_is_reloaded_after_script_flush(take, run, fake_aredis, monkeypatch):
+    loads = []
+    script_load = fake_aredis.script_load
+
+    async def counting_load(script):
+        loads.append(script)
+        return await script_load(script)
+
+    monkeypatch.setattr(fake_aredis, "script_load", counting_load)
+    assert take().remaining == 2
+    run(fake_aredis.script_flush())
+    assert take().remaining == 1
+    assert len(loads) == 2
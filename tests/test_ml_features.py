@@ -0,0 +1,24 @@
+"""ML feature extraction must keep the values the shipped model was trained on."""
+import pytest
+
+from app.models.event import Event
+from app.services.detection_ml import ml_detector
+
+
+@pytest.mark.parametrize("timestamp, hour", [
+    ("2026-01-08T17:37:52Z", 17),
+    ("2026-01-08T17:37:52+05:30", 17),  # wall-clock hour as written, not UTC (12)
+    ("2026-01-08T02:10:00-08:00", 2),
+    ("2026-01-08T17:37:52.123456", 17),
+    ("2026-01-08 17:37:52", 12),  # no "T": the model's default hour
+    ("not a timestamp", 12),
+    (None, 12),
+])
+def test_hour_is_read_from_the_timestamp_as_written(timestamp, hour):
+    log_entry = Event({"timestamp": timestamp, "message": "GET /", "source": "nginx"})
+    assert ml_detector._features(log_entry, 0)[0] == hour
+
+
+def test_features_follow_the_training_order():
+    log_entry = Event({"timestamp": "2026-01-08T03:00:00Z", "message": "Accepted", "source": "ssh"})
+    assert ml_detector._features(log_entry, 7)[:4] == [3, 8, 1, 7]
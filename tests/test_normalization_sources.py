@@ -0,0 +1,28 @@
+"""Classification may name the source of unlabeled lines, never replace a client's."""
+import pytest
+
+from app.services.normalization import normalization_service
+
+SSH = "Accepted password for root from 10.0.0.9 port 22 ssh2"
+UFW = "[UFW BLOCK] IN=eth0 OUT= MAC=00:00 SRC=1.2.3.4 DST=10.0.0.5 LEN=60 PROTO=TCP SPT=1 DPT=22"
+
+
+@pytest.mark.parametrize("source", ["auth", "web", "syslog"])
+def test_labeled_source_without_parsers_keeps_its_source(source):
+    extracted = normalization_service.parse_log(SSH, source)
+    assert extracted["ip"] == "10.0.0.9"
+    assert "source" not in extracted
+    [row] = normalization_service.parse_many([SSH], source).rows()
+    assert row == extracted
+
+
+@pytest.mark.parametrize("source", ["", "raw_ingest"])
+def test_unlabeled_line_is_named_by_its_parser(source):
+    assert normalization_service.parse_log(SSH, source)["source"] == "ssh"
+    assert normalization_service.parse_many([SSH], source).rows()[0]["source"] == "ssh"
+
+
+def test_ufw_lines_are_firewall_events_from_any_source():
+    # The UFW parser sets source itself, as before the parser library existed
+    assert normalization_service.parse_log(UFW, "kernel")["source"] == "firewall"
+    assert normalization_service.detect_source(SSH) == "ssh"
@@ -0,0 +1,57 @@
+"""parse_many() must give every message the fields parse_log() would."""
+
+from app.services.normalization import NormalizationService, ParserLibrary
+
+NGINX = '10.0.0.7 - - [08/Jan/2026:17:37:52 +0000] "GET /api/v1/logs HTTP/1.1" 202 31 "-" "python-requests/2.32.5"'
+SSH_FAILED = "Failed password for invalid user admin from 192.168.1.1 port 22 ssh2"
+SSH_ACCEPTED = "Accepted password for root from 192.168.1.2 port 22 ssh2"
+UFW = "[UFW BLOCK] IN=eth0 OUT= MAC=00:00 SRC=1.2.3.4 DST=10.0.0.5 LEN=60 PROTO=TCP SPT=1 DPT=22"
+NOISE = "disk /dev/sda1 is 91% full"
+
+MESSAGES = [NGINX, SSH_FAILED, NOISE, SSH_ACCEPTED, UFW, NGINX.replace("GET", "POST"), "", "password for nobody"]
+
+
+def parse_each(library, messages, source_types):
+    service = NormalizationService.__new__(NormalizationService)
+    service.library = library
+    if isinstance(source_types, str):
+        source_types = [source_types] * len(messages)
+    return [service.parse_log(m, s) or None for m, s in zip(messages, source_types)]
+
+
+def test_shipped_library_bulk_matches_per_message():
+    library = NormalizationService().library
+    for source_types in ("raw_ingest", "ssh", "nginx", ["nginx", "ssh", "syslog", "ssh", "firewall", "nginx", "", "ssh"]):
+        assert library.parse_many(MESSAGES, source_types).rows() == parse_each(library, MESSAGES, source_types)
+
+
+def test_columns_lay_out_the_same_fields_per_message():
+    library = NormalizationService().library
+    batch = library.parse_many(MESSAGES, "raw_ingest")
+    rows = batch.rows()
+    for name, column in batch.columns.items():
+        assert column == [row.get(name) if row else None for row in rows]
+    assert batch.matched == sum(row is not None for row in rows)
+    assert batch.parser[0] == "nginx_access"
+    assert batch.parser[2] is None
+
+
+def test_constants_only_optional_groups_and_casts():
+    library = ParserLibrary.from_config({
+        "patterns": {"INT": r"\d+"},
+        "parsers": [
+            # Captures nothing: a match is only its constant fields
+            {"name": "heartbeat", "sources": ["app"], "prefilter": "heartbeat", "pattern": "heartbeat ok",
+             "fields": {"event_type": "heartbeat"}},
+            {"name": "retry", "sources": ["app"], "prefilter": "retry",
+             "pattern": r"retry(?: after %{INT:delay:int}s)?(?: user=(?P<user>\w+))?", "drop": ["user"]},
+        ],
+    })
+    messages = ["heartbeat ok", "retry after 5s user=bob", "retry", "heartbeat failed", "unrelated"]
+    for source_types in ("app", "raw_ingest"):
+        bulk = library.parse_many(messages, source_types).rows()
+        assert bulk == parse_each(library, messages, source_types)
+    assert bulk[0] == {"event_type": "heartbeat", "source": "app"}
+    assert bulk[1] == {"delay": 5, "source": "app"}
+    assert bulk[2] == {"delay": None, "source": "app"}
+    assert bulk[3] is None
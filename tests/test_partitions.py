@@ -0,0 +1,110 @@
+"""Unit tests for entity-sharded stream routing (no Redis or ES needed)."""
+
+import pytest
+
+from app.models.event import Event
+from app.services import normalization
+from app.services.partitions import PartitionCoordinator, entity_of, stream_names
+from app.services.queue import QueueService
+
+ATTACKER = "192.168.1.100"
+
+
+def sharded_queue(partitions: int = 4) -> QueueService:
+    queue = QueueService()
+    queue.partitions = partitions
+    queue.streams = stream_names(queue.stream_name, partitions)
+    return queue
+
+
+def test_message_only_ip_is_pinned_to_one_partition():
+    queue = sharded_queue()
+    events = [
+        {"source": "ssh", "level": "INFO", "metadata": {},
+         "message": f"Failed password for invalid user hacker from {ATTACKER} port {port} ssh2"}
+        for port in range(22, 30)
+    ]
+    events.append({
+        "source": "nginx", "level": "INFO",
+        "message": f'{ATTACKER} - - [08/Jan/2026:17:37:52 +0000] "GET /.env HTTP/1.1" 404 0 "-" "curl/8.4.0"',
+    })
+    events.append({
+        "source": "firewall", "level": "WARN",
+        "message": f"[UFW BLOCK] IN=eth0 OUT= SRC={ATTACKER} DST=10.0.0.5 LEN=60 PROTO=TCP SPT=1 DPT=22",
+    })
+    streams = {queue.stream_for(event) for event in events}
+    assert streams == {queue.stream_for({"ip": ATTACKER})}
+
+
+def test_unlabeled_line_is_routed_by_its_classified_ip():
+    queue = sharded_queue()
+    line = f"Accepted password for root from {ATTACKER} port 22 ssh2"
+    assert queue.stream_for({"source": "raw_ingest", "message": line}) == queue.stream_for({"ip": ATTACKER})
+
+
+def test_explicit_ip_wins_over_user():
+    queue = sharded_queue()
+    event = {"ip": ATTACKER, "metadata": {"user": "alice"}, "message": "login"}
+    assert queue.stream_for(event) == queue.stream_for({"ip": ATTACKER})
+
+
+@pytest.mark.parametrize("event", [
+    {"source": "ssh", "message": f"Accepted password for root from {ATTACKER} port 22 ssh2", "metadata": {"user": "x"}},
+    {"source": "nginx", "message": f'{ATTACKER} - - [08/Jan/2026:17:37:52 +0000] "GET / HTTP/1.1" 200 1 "-" "-"'},
+    {"source": "firewall", "message": "[UFW BLOCK] IN=eth0 OUT= MAC=52:54:00:9d:f2:1e:52:54:00:d4:9a:6f:08:00 "
+                                      "SRC=2001:db8::7 DST=2001:db8::1 LEN=60 PROTO=TCP SPT=1 DPT=22"},
+    {"source": "firewall", "message": f"[UFW BLOCK] IN=eth0 OUT= SRC={ATTACKER} DST=10.0.0.5 LEN=60 PROTO=TCP"},
+    {"source": "app", "message": "disk check passed", "user": "alice"},
+    {"source": "app", "message": "build 1.2.3 deployed"},
+])
+def test_ingest_entity_matches_the_normalized_entity(event):
+    log_entry = Event(dict(event))
+    extracted = normalization.normalization_service.parse_log(log_entry.message, log_entry.source)
+    if extracted:
+        log_entry.update(extracted)
+    assert entity_of(event) == log_entry.entity
+
+
+def test_routing_does_not_parse_the_message(monkeypatch):
+    def parse_log(*args):
+        raise AssertionError("stream_for ran the parsers")
+
+    monkeypatch.setattr(normalization.normalization_service, "parse_log", parse_log)
+    queue = sharded_queue()
+    line = f"Failed password for invalid user hacker from {ATTACKER} port 22 ssh2"
+    assert queue.stream_for({"source": "ssh", "message": line}) == queue.stream_for({"ip": ATTACKER})
+
+
+def test_entity_precedence():
+    assert entity_of({"metadata": {"ip": "10.0.0.1"}, "message": f"from {ATTACKER}"}) == "10.0.0.1"
+    assert entity_of({"user": "alice", "message": f"conn from {ATTACKER}:5514"}) == ATTACKER
+    assert entity_of({"metadata": {"user": "alice"}, "message": "v1.2.3.4.5 at 22:14:15"}) == "alice"
+    assert entity_of({"metadata": "not a dict", "message": None}) is None
+
+
+def test_unsharded_queue_uses_the_base_stream():
+    queue = sharded_queue(0)
+    queue.streams = [queue.stream_name]
+    assert queue.stream_for({"message": f"Failed password for x from {ATTACKER} port 1 ssh2"}) == "logs_stream"
+
+
+def test_revoked_partitions_are_flushed_before_their_leases_are_released(fake_redis):
+    client = fake_redis
+    first = PartitionCoordinator(client, "logs_stream", "a-worker", partitions=4)
+    assert first.heartbeat() == {0, 1, 2, 3}
+
+    holders_at_revoke = {}
+
+    def on_revoke(lost):
+        for p in lost:
+            holders_at_revoke[p] = client.get(first.lease_key(p))
+
+    first.on_revoke.append(on_revoke)
+    second = PartitionCoordinator(client, "logs_stream", "b-worker", partitions=4)
+    second.heartbeat()  # joins; its partitions are still leased by the first worker
+    assert second.owned == set()
+
+    assert first.heartbeat() == {0, 2}
+    assert holders_at_revoke == {1: "a-worker", 3: "a-worker"}
+    assert client.get(first.lease_key(1)) is None
+    assert second.heartbeat() == {1, 3}
@@ -0,0 +1,79 @@
+"""Offline pipeline runner: input validation, failure handling and parity with the live worker."""
+import pytest
+
+from app import pipeline
+from app.core import codec
+
+SSH = "Failed password for root from 10.1.2.3 port 22 ssh2"
+
+
+def event(message, **fields) -> str:
+    return codec.dumps({"source": "ssh", "message": message, "timestamp": "2026-01-01T00:00:00Z", **fields})
+
+
+def test_invalid_lines_in_a_chunk_become_none_and_the_rest_are_normalized():
+    lines = [
+        event(SSH),
+        '{"message": 5}',
+        '{"source": ["ssh"], "message": "x"}',
+        "not json",
+        "[1, 2]",
+        event("service started"),
+    ]
+    events, unparsed = pipeline.normalize_chunk(lines)
+    assert [e is None for e in events] == [False, True, True, True, True, False]
+    assert unparsed == [5]
+    assert events[0].ip == "10.1.2.3"
+    assert events[0].event_type == "ssh_login_failed"
+    assert events[5].message == "service started"
+
+
+@pytest.fixture(autouse=True)
+def local_enrichment(monkeypatch):
+    monkeypatch.setattr(pipeline.settings, "IPINFO_TOKEN", "")
+    monkeypatch.setattr(pipeline.settings, "ABUSEIPDB_API_KEY", "")
+
+
+def test_run_counts_invalid_lines_and_writes_the_others_in_order(tmp_path):
+    source = tmp_path / "in.ndjson"
+    output = tmp_path / "out.ndjson"
+    source.write_text("\n".join([event(SSH, seq=0), '{"message": 5}', event("service started", seq=2)]) + "\n")
+
+    stats = pipeline.run(str(source), str(output), workers=2, chunk_size=10)
+
+    assert (stats.events, stats.errors) == (2, 1)
+    assert [codec.loads(line)["seq"] for line in output.read_text().splitlines()] == [0, 2]
+
+
+def test_run_fails_when_a_detection_process_dies(tmp_path, monkeypatch):
+    def crash_on_poison(log_entries, clock):
+        if any(e.message == "poison" for e in log_entries):
+            raise MemoryError("killed")
+        return log_entries
+
+    # Detection processes are forked, so they inherit the patched stage
+    monkeypatch.setattr(pipeline, "detect_events", crash_on_poison)
+    monkeypatch.setattr(pipeline, "DETECTOR_POLL_SECONDS", 0.05)
+    source = tmp_path / "in.ndjson"
+    source.write_text("\n".join(event(message, ip=f"10.0.0.{i}") for i, message in enumerate(["ok"] * 50 + ["poison"])))
+
+    with pytest.raises(RuntimeError, match=r"partition \d exited with code 1"):
+        pipeline.run(str(source), str(tmp_path / "out.ndjson"), workers=2, chunk_size=5)
+
+
+def test_unparsed_events_get_templates_independent_of_workers(tmp_path):
+    source = tmp_path / "in.ndjson"
+    lines = [event(f"worker {i % 4} finished job {i}", source="app", ip=f"10.0.0.{i % 7}") for i in range(40)]
+    source.write_text("\n".join(lines + [event(SSH)]))
+
+    outputs = []
+    for workers in (1, 3):
+        output = tmp_path / f"out-{workers}.ndjson"
+        pipeline.run(str(source), str(output), workers=workers, chunk_size=4)
+        outputs.append([codec.loads(line) for line in output.read_text().splitlines()])
+
+    templated = [(e.get("template_id"), e.get("template_rarity")) for e in outputs[0]]
+    assert templated == [(e.get("template_id"), e.get("template_rarity")) for e in outputs[1]]
+    assert all(template_id for template_id, _ in templated[:40])
+    assert templated[0][1] == 1.0 and templated[39][1] < 1.0
+    assert outputs[0][40].get("template_id") is None  # parsed: no template, as in the worker
@@ -0,0 +1,51 @@
+"""Pending-entry reclaim walks the whole PEL across passes."""
+import pytest
+
+from app import worker
+from app.core import codec
+from app.core.config import settings
+
+
+@pytest.fixture
+def handled(monkeypatch, fake_redis):
+    """Message ids the reclaim pass handed to _handle_message."""
+    seen = []
+    monkeypatch.setattr(worker, "r", fake_redis)
+    monkeypatch.setattr(worker, "_reclaim_cursor", {})
+    monkeypatch.setattr(worker, "RECLAIM_COUNT", 2)
+    monkeypatch.setattr(settings, "WORKER_RECLAIM_IDLE_MS", 60000)
+    monkeypatch.setattr(worker, "_handle_message", lambda message_id, data, stream: seen.append(message_id) or True)
+    fake_redis.xgroup_create(worker.STREAM_KEY, worker.GROUP_NAME, id="0", mkstream=True)
+    return seen
+
+
+def pend(client, count: int) -> list[str]:
+    ids = [client.xadd(worker.STREAM_KEY, codec.encode_entry({"message": f"m{i}"}, "json")) for i in range(count)]
+    client.xreadgroup(worker.GROUP_NAME, "crashed", {worker.STREAM_KEY: ">"})
+    return ids
+
+
+def test_idle_entries_behind_a_busy_head_are_reclaimed(handled, fake_redis):
+    ids = pend(fake_redis, 5)
+    # The oldest two are still being worked on by a live consumer; the rest were orphaned
+    fake_redis.xclaim(worker.STREAM_KEY, worker.GROUP_NAME, "live", 0, ids[:2], idle=0)
+    fake_redis.xclaim(worker.STREAM_KEY, worker.GROUP_NAME, "crashed", 0, ids[2:], idle=120000)
+
+    worker._reclaim_stream(worker.STREAM_KEY)
+    assert worker._reclaim_cursor[worker.STREAM_KEY] != "0-0"  # the next pass resumes, not restarts
+    worker._reclaim_stream(worker.STREAM_KEY)
+    worker._reclaim_stream(worker.STREAM_KEY)
+    assert handled == ids[2:]
+    assert worker._reclaim_cursor[worker.STREAM_KEY] == "0-0"
+    still_pending = fake_redis.xpending_range(worker.STREAM_KEY, worker.GROUP_NAME, "-", "+", 10)
+    assert [p["message_id"] for p in still_pending] == ids[:2]
+
+
+def test_scan_starts_over_after_reaching_the_end(handled, fake_redis):
+    ids = pend(fake_redis, 1)
+    worker._reclaim_stream(worker.STREAM_KEY)
+    assert handled == []  # delivered just now, not idle yet
+
+    fake_redis.xclaim(worker.STREAM_KEY, worker.GROUP_NAME, "crashed", 0, ids, idle=120000)
+    worker._reclaim_stream(worker.STREAM_KEY)
+    assert handled == ids
@@ -0,0 +1,111 @@
+"""Unit tests for the local (write-behind) state cache against fakeredis."""
+import pytest
+
+from app.services.state_cache import StateCache
+
+
+@pytest.fixture
+def make_cache(fake_redis):
+    def make(max_entries=1000):
+        return StateCache(fake_redis, mode="local", max_entries=max_entries)
+    return make
+
+
+def fail_next_flush(monkeypatch, cache):
+    pipeline = cache.redis.pipeline
+
+    def broken(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        monkeypatch.setattr(pipe, "execute", lambda: (_ for _ in ()).throw(ConnectionError("redis down")))
+        monkeypatch.setattr(cache.redis, "pipeline", pipeline)
+        return pipe
+
+    monkeypatch.setattr(cache.redis, "pipeline", broken)
+
+
+def test_writes_stay_local_until_flushed(make_cache):
+    cache = make_cache()
+    assert cache.window_incr("bf:1.2.3.4", 60) == 1
+    assert cache.window_incr("bf:1.2.3.4", 60) == 2
+    cache.add_member("admins", "10.0.0.1")
+    cache.set_flag("phase:1.2.3.4", 300)
+    assert cache.redis.get("bf:1.2.3.4") is None
+
+    assert cache.flush() == 3
+    assert cache.redis.get("bf:1.2.3.4") == "2"
+    assert 0 < cache.redis.ttl("bf:1.2.3.4") <= 60
+    assert cache.redis.sismember("admins", "10.0.0.1")
+    assert cache.redis.get("phase:1.2.3.4") == "active"
+    assert cache.flush() == 0
+
+
+def test_increments_after_a_flush_are_added_to_the_stored_count(make_cache):
+    cache = make_cache()
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.flush()
+    cache.redis.incrby("bf:1.2.3.4", 5)  # another writer before ours lands
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.flush()
+    assert cache.redis.get("bf:1.2.3.4") == "7"
+
+
+def test_restarted_cache_reads_through_flushed_state(make_cache):
+    cache = make_cache()
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.add_member("admins", "10.0.0.1")
+    cache.flush()
+
+    restarted = make_cache()
+    assert restarted.window_incr("bf:1.2.3.4", 60) == 2
+    assert restarted.is_member("admins", "10.0.0.1")
+    assert not restarted.is_member("admins", "10.0.0.2")
+
+
+def test_failed_flush_is_requeued_under_newer_writes(monkeypatch, make_cache):
+    cache = make_cache()
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.add_member("admins", "10.0.0.1")
+    cache.set_flag("phase:1.2.3.4", 300, "first")
+
+    fail_next_flush(monkeypatch, cache)
+    assert cache.flush() == 0
+    assert cache.redis.get("bf:1.2.3.4") is None
+
+    # Written after the failure: the counter keeps counting, the newer flag wins
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.add_member("admins", "10.0.0.2")
+    cache.set_flag("phase:1.2.3.4", 300, "second")
+
+    assert cache.flush() == 3
+    assert cache.redis.get("bf:1.2.3.4") == "3"
+    assert cache.redis.smembers("admins") == {"10.0.0.1", "10.0.0.2"}
+    assert cache.redis.get("phase:1.2.3.4") == "second"
+
+
+def test_eviction_flushes_before_forgetting_entries(make_cache):
+    cache = make_cache(max_entries=10)
+    for i in range(11):
+        cache.window_incr(f"bf:10.0.0.{i}", 60)
+    assert len(cache._entries) <= 10
+    assert cache.redis.get("bf:10.0.0.0") == "1"
+    # The evicted counter is read back from Redis, not restarted
+    assert cache.window_incr("bf:10.0.0.0", 60) == 2
+
+
+def test_clear_flushes_then_drops_local_state(make_cache):
+    cache = make_cache()
+    cache.window_incr("bf:1.2.3.4", 60)
+    cache.clear()
+    assert cache.redis.get("bf:1.2.3.4") == "1"
+    assert not cache._entries
+    cache.redis.set("bf:1.2.3.4", 9)  # the partition's new owner wrote meanwhile
+    assert cache.window_incr("bf:1.2.3.4", 60) == 10
+
+
+@pytest.mark.parametrize("mode", ["strict", "local"])
+def test_modes_agree_on_window_counts(mode, fake_redis):
+    cache = StateCache(fake_redis, mode=mode, max_entries=1000)
+    assert [cache.window_incr("w", 60) for _ in range(3)] == [1, 2, 3]
+    cache.flush()
+    assert cache.redis.get("w") == "3"
@@ -0,0 +1,146 @@
+"""Unit tests for syslog header parsing and the TCP listener's framing."""
+import asyncio
+from datetime import datetime
+
+from app.services.syslog import parse_syslog, split_frames, split_octet_counted
+from app.syslog_server import SyslogServer
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+SSH = "<38>Feb 28 09:15:02 bastion sshd[4242]: Failed password for root from 203.0.113.9 port 22 ssh2"
+
+
+class ChunkReader:
+    """Stands in for a StreamReader that returns the given chunks, one per read()."""
+
+    def __init__(self, chunks: list[bytes]):
+        self.chunks = list(chunks)
+
+    async def read(self, _n: int) -> bytes:
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+class Writer:
+    closed = False
+
+    def get_extra_info(self, _name):
+        return ("10.0.0.1", 51514)
+
+    def close(self):
+        self.closed = True
+
+
+def frame(message: str) -> bytes:
+    data = message.encode()
+    return str(len(data)).encode() + b" " + data
+
+
+def receive(chunks: list[bytes], max_message: int | None = None) -> tuple[list[dict], ChunkReader, Writer]:
+    async def go():
+        server = SyslogServer(buffer_size=100)
+        if max_message is not None:
+            server.max_message = max_message
+        reader, writer = ChunkReader(chunks), Writer()
+        await server.handle_tcp(reader, writer)
+        events = []
+        while not server.buffer.empty():
+            events.append(server.buffer.get_nowait())
+        return events, reader, writer
+    return asyncio.run(go())
+
+
+def test_rfc5424_header():
+    fields = parse_syslog(
+        "<165>1 2026-02-28T09:15:02.003Z web01 nginx 811 - [meta x=\"1\"] ﻿GET /login 200", NOW
+    )
+    assert fields["facility"] == 20
+    assert fields["severity"] == 5
+    assert fields["timestamp"] == "2026-02-28T09:15:02.003000+00:00"
+    assert (fields["hostname"], fields["app_name"], fields["procid"]) == ("web01", "nginx", "811")
+    assert fields["message"] == "GET /login 200"
+
+
+def test_rfc5424_nil_values():
+    fields = parse_syslog("<13>1 - - - - - - only msg", NOW)
+    assert fields["severity"] == 5
+    assert fields["timestamp"] is fields["hostname"] is fields["app_name"] is None
+    assert fields["message"] == "only msg"
+
+
+def test_rfc3164_header_takes_the_year_from_now():
+    fields = parse_syslog(SSH, NOW)
+    assert (fields["facility"], fields["severity"]) == (4, 6)
+    assert fields["timestamp"] == "2026-02-28T09:15:02"
+    assert (fields["hostname"], fields["app_name"], fields["procid"]) == ("bastion", "sshd", "4242")
+    assert fields["message"].startswith("Failed password for root")
+
+
+def test_rfc3164_timestamp_from_late_last_year():
+    fields = parse_syslog("<13>Dec 31 23:59:00 host cron: nightly", datetime(2026, 1, 1, 0, 1))
+    assert fields["timestamp"] == "2025-12-31T23:59:00"
+
+
+def test_line_without_a_header_falls_back_to_the_whole_message():
+    for line in ("disk /dev/sda1 is 91% full", "<13>not a bsd header at all"):
+        fields = parse_syslog(line, NOW)
+        assert fields["timestamp"] is fields["hostname"] is fields["app_name"] is None
+    assert parse_syslog("disk /dev/sda1 is 91% full", NOW)["message"] == "disk /dev/sda1 is 91% full"
+    assert parse_syslog("<13>not a bsd header at all", NOW)["severity"] == 5
+
+
+def test_malformed_pri_leaves_the_line_intact():
+    for line in ("<999>1 2026-01-01T00:00:00Z h app - - - m", "<abc>" + SSH[4:], "<13" + SSH[4:]):
+        fields = parse_syslog(line, NOW)
+        assert fields["facility"] is None and fields["severity"] is None
+        assert fields["message"] == line
+
+
+def test_split_frames_tells_octet_counting_from_numbered_lines():
+    assert split_frames(frame("hello world!") + frame("abcde")) == (["hello world!", "abcde"], "octet-counted")
+    assert split_frames(b"100 not a frame\nsecond\r\n") == (["100 not a frame", "second"], "newline")
+
+
+def test_split_octet_counted_keeps_an_incomplete_frame():
+    data = frame("first") + b"\n" + frame("second message")
+    assert split_octet_counted(data[:-4]) == ([b"first"], frame("second message")[:-4])
+
+
+def test_tcp_octet_counted_frames_split_across_reads():
+    data = frame(SSH) + frame("<13>1 - - - - - - second")
+    # Cut inside the first length prefix and inside the first message
+    events, _, writer = receive([data[:1], data[1:20], data[20:90], data[90:]])
+    assert [e["message"] for e in events] == [parse_syslog(SSH)["message"], "second"]
+    assert events[0]["source"] == "ssh"
+    assert events[0]["metadata"]["source_ip"] == "10.0.0.1"
+    assert events[0]["metadata"]["hostname"] == "bastion"
+    assert writer.closed
+
+
+def test_tcp_newline_framing_split_across_reads():
+    events, _, _ = receive([
+        b"<13>Feb 28 09:00:00 h a: one\r\n<13>Feb 28 09:0",
+        b"0:01 h a: two\n<13>Feb 28 09:00:02 h a: th",
+        b"ree",
+    ])
+    assert [e["message"] for e in events] == ["one", "two", "three"]
+
+
+def test_tcp_octet_count_larger_than_the_buffer_closes_the_connection():
+    # The frame claims 5000 bytes; once more than max_message is pending the stream cannot resync
+    data = b"5000 " + b"x" * 60
+    events, reader, writer = receive([data, b"y" * 60, frame("<13>1 - - - - - - never read")], max_message=100)
+    assert events == []
+    assert reader.chunks == [frame("<13>1 - - - - - - never read")]
+    assert writer.closed
+
+
+def test_tcp_frame_larger_than_one_read_but_within_the_limit_is_kept():
+    data = frame("<13>1 - - - - - - " + "z" * 150)
+    events, _, _ = receive([data[:50], data[50:100], data[100:]], max_message=200)
+    assert [e["message"] for e in events] == ["z" * 150]
+
+
+def test_tcp_over_long_line_is_dropped_and_reading_continues():
+    chunks = [b"x" * 150, b"x" * 50 + b"\n<13>Feb 28 09:00:00 h a: ok\n", b"y" * 150]
+    events, _, _ = receive(chunks, max_message=100)
+    # Neither the end of the dropped line nor the over-long tail at EOF comes through
+    assert [e["message"] for e in events] == ["ok"]
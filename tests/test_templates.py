@@ -0,0 +1,84 @@
+"""Unit tests for the log template miner against fakeredis."""
+import pytest
+
+from app.services import templates
+from app.services.templates import TemplateMiner
+
+
+@pytest.fixture
+def make_miner(fake_redis):
+    def make(**overrides):
+        miner = TemplateMiner(fake_redis)
+        for name, value in overrides.items():
+            setattr(miner, name, value)
+        return miner
+    return make
+
+
+def tree_size(node) -> int:
+    if isinstance(node, list):
+        return 1
+    return 1 + sum(tree_size(child) for child in node.values())
+
+
+def test_similar_messages_share_a_template_and_yield_params(make_miner):
+    miner = make_miner()
+    first, _ = miner.mine("session opened for user alice", "app")
+    second, params = miner.mine("session opened for user bob", "app")
+    assert first is second
+    assert second.text == "session opened for user <*>"
+    assert params == ["bob"]
+    assert second.count == 2
+
+
+def test_full_miner_matches_existing_templates_without_growing_the_tree(make_miner):
+    miner = make_miner(max_templates=1)
+    template, _ = miner.mine("disk check passed", "app")
+    size = tree_size(miner._root)
+
+    for i in range(20):
+        assert miner.mine(f"unrelated message shape number{i} {'x ' * i}", "app") is None
+        assert miner.mine(f"novel{i} words here", f"app{i % 3}") is None
+    assert tree_size(miner._root) == size
+    assert list(miner.templates) == [template.id]
+    assert miner.mine("disk check passed", "app")[0] is template
+
+
+def test_sources_beyond_the_limit_share_the_other_tree(make_miner):
+    miner = make_miner(max_sources=2)
+    assert miner.mine("hello world", "alpha")[0].source == "alpha"
+    assert miner.mine("hello world", "beta")[0].source == "beta"
+    assert miner.mine("hello world", "gamma")[0].source == templates.OTHER_SOURCE
+    assert miner.mine("hello world", "delta")[0].source == templates.OTHER_SOURCE
+    # Already-admitted sources keep their own tree
+    assert miner.mine("hello world", "alpha")[0].source == "alpha"
+
+
+def test_parser_sources_do_not_count_against_the_limit(monkeypatch, make_miner):
+    miner = make_miner(max_sources=0)
+    monkeypatch.setattr(templates.normalization_service.library, "by_source", {"ssh": []})
+    assert miner.mine("hello world", "ssh")[0].source == "ssh"
+    assert miner.mine("hello world", "custom")[0].source == templates.OTHER_SOURCE
+
+
+def test_long_sources_are_truncated(make_miner):
+    miner = make_miner()
+    template, _ = miner.mine("hello world", "s" * 1000)
+    assert template.source == "s" * templates.MAX_SOURCE_LENGTH
+
+
+def test_flushed_templates_load_into_a_new_miner_and_count_as_known_sources(make_miner):
+    miner = make_miner()
+    template, _ = miner.mine("job 17 finished", "cron")
+    miner.mine("job 18 finished", "cron")
+    assert miner.flush() == 2
+
+    restarted = make_miner(max_sources=1)
+    assert restarted.load() == 1
+    loaded, params = restarted.mine("job 19 finished", "cron")
+    assert loaded.id == template.id
+    assert loaded.count == 3
+    assert params == ["19"]
+    # The loaded source used up the only slot
+    assert restarted.mine("hello world", "another")[0].source == templates.OTHER_SOURCE
+    assert restarted.top("cron")["cron"][0]["count"] == 2
@@ -0,0 +1,36 @@
+"""SIGTERM must stop a worker through its flush-on-exit path."""
+import os
+import signal
+
+import pytest
+
+from app import worker
+from app.core.config import settings
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def test_sigterm_flushes_state_and_templates(monkeypatch, restore_signals, fake_redis):
+    flushed = []
+    monkeypatch.setattr(settings, "STREAM_PARTITIONS", 0)
+    monkeypatch.setattr(settings, "WORKER_METRICS_PORT", 0)
+    monkeypatch.setattr(settings, "WORKER_MODE", "single")
+    monkeypatch.setattr(worker.template_miner, "redis", fake_redis)
+    monkeypatch.setattr(worker.state_cache, "flush", lambda: flushed.append("state"))
+    monkeypatch.setattr(worker.template_miner, "flush", lambda: flushed.append("templates"))
+
+    def stopped_by_supervisor():
+        os.kill(os.getpid(), signal.SIGTERM)
+        raise AssertionError("SIGTERM did not stop the worker")
+
+    monkeypatch.setattr(worker, "process_messages", stopped_by_supervisor)
+
+    with pytest.raises(SystemExit):
+        worker.run_worker()
+    assert flushed == ["state", "templates"]